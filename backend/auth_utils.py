@@ -57,3 +57,14 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     if user is None:
         raise credentials_exception
     return user
+
+async def get_current_user_released(user: models.User = Depends(get_current_user), db: Session = Depends(database.get_db)):
+    """
+    get_current_user for async routes that go on to await a remote API.
+    Hands the request's DB connection back to the pool first: otherwise each
+    request waiting on the remote side pins one, and once the pool is empty
+    the next get_current_user blocks the event loop waiting for a connection.
+    The returned user is detached but fully loaded.
+    """
+    db.close()
+    return user
@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta, date
+
+# Clinic runs on Asia/Jakarta (UTC+7). Timestamps are stored in UTC,
+# so "today" has to be computed relative to the local day.
+# 00:00 WIB = 17:00 UTC (Yesterday)
+CLINIC_UTC_OFFSET = timedelta(hours=7)
+
+def local_now() -> datetime:
+    return datetime.utcnow() + CLINIC_UTC_OFFSET
+
+def local_today() -> date:
+    return local_now().date()
+
+def today_start_utc() -> datetime:
+    """UTC timestamp of local midnight (start of the clinic's day)."""
+    today_local = local_now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today_local - CLINIC_UTC_OFFSET
+
+def day_start_utc(day: date) -> datetime:
+    """UTC timestamp of local midnight at the start of `day`."""
+    return datetime(day.year, day.month, day.day) - CLINIC_UTC_OFFSET
+
+def local_date_of(utc_dt: datetime) -> date:
+    return (utc_dt + CLINIC_UTC_OFFSET).date()
@@ -21,10 +21,17 @@ DB_NAME = os.getenv("DB_NAME", "klinik_db")
 encoded_user = quote_plus(DB_USER)
 encoded_password = quote_plus(DB_PASSWORD)
 
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{encoded_user}:{encoded_password}@{DB_HOST}/{DB_NAME}"
+# DATABASE_URL overrides the MySQL settings (e.g. sqlite:///./klinik_test.db for local scripts)
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL") or f"mysql+pymysql://{encoded_user}:{encoded_password}@{DB_HOST}/{DB_NAME}"
+
+connect_args = {}
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    # Sessions are used from the threadpool; wait on the write lock instead of failing fast
+    connect_args = {"check_same_thread": False, "timeout": 30}
 
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL
+    SQLALCHEMY_DATABASE_URL,
+    connect_args=connect_args
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -1,6 +1,6 @@
 from fastapi import FastAPI, Request, Response
 from .database import engine, Base
-from .routers import auth, patients, queue, master_data, medicines, users, integration, doctors, diseases, dashboard, payments, pharmacists, config, appointments
+from .routers import auth, patients, queue, master_data, medicines, users, integration, doctors, diseases, dashboard, payments, pharmacists, config, appointments, metrics, exports
 import os
 from dotenv import load_dotenv
 from pathlib import Path
@@ -11,6 +11,10 @@ load_dotenv(dotenv_path=env_path)
 # Create Tables
 Base.metadata.create_all(bind=engine)
 
+# Alter existing tables (indexes, new columns) - see migrations/__init__.py
+from .migrations import run_migrations
+run_migrations(engine)
+
 app = FastAPI(title="Klinik Admin API")
 
 @app.middleware("http")
@@ -35,6 +39,8 @@ async def cors_handler(request: Request, call_next):
     response.headers["Access-Control-Allow-Origin"] = "*"
     response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
     response.headers["Access-Control-Allow-Headers"] = "*"
+    # Let browser clients read the paging / caching headers
+    response.headers["Access-Control-Expose-Headers"] = "ETag, X-Next-Cursor, X-Total-Count"
     return response
 
 # Include Routers
@@ -52,6 +58,8 @@ app.include_router(payments.router)
 app.include_router(pharmacists.router)
 app.include_router(config.router)
 app.include_router(appointments.router)
+app.include_router(metrics.router)
+app.include_router(exports.router)
 
 @app.get("/")
 def read_root():
@@ -63,7 +71,30 @@ def startup_event():
     from .scheduler import start_scheduler
     start_scheduler()
 
+@app.on_event("startup")
+async def start_queue_broker():
+    # Tail queue_events in every worker so changes made by other workers
+    # reach this worker's stream clients and invalidate its queue cache
+    from .services.queue_events import queue_event_broker
+    from .services.queue_cache import queue_snapshot_cache
+    from .services.wait_time import wait_time_estimator
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        wait_time_estimator.rebuild(db)
+    finally:
+        db.close()
+    # Estimator first, so a bumped snapshot is rebuilt with the new estimates
+    queue_event_broker.add_listener(wait_time_estimator.on_queue_event)
+    queue_event_broker.add_listener(queue_snapshot_cache.bump)
+    await queue_event_broker.start()
+
 @app.on_event("shutdown")
 def shutdown_event():
     from .scheduler import shutdown_scheduler
     shutdown_scheduler()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    from .services.http_pool import http_pool
+    await http_pool.aclose()
@@ -0,0 +1,78 @@
+"""
+Versioned schema migrations.
+
+Base.metadata.create_all only creates missing tables; it never touches a table
+that already exists. Changes to existing tables (new indexes, columns,
+backfills) go here as vNNNN_<name>.py modules exposing upgrade(conn).
+Applied versions are recorded in schema_migrations, so each runs once.
+
+Migrations must be idempotent against a freshly created schema: create_all
+runs first and already builds whatever the models declare, which is why the
+helpers in ops.py skip objects that exist.
+"""
+import importlib
+import logging
+import pkgutil
+import re
+from datetime import datetime
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_PATTERN = re.compile(r"^v(\d{4})_\w+$")
+LOCK_NAME = "klinik_schema_migrations"
+
+def discover_migrations():
+    """[(version, module_name, module)] sorted by version."""
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        match = MIGRATION_PATTERN.match(info.name)
+        if match:
+            module = importlib.import_module(f"{__name__}.{info.name}")
+            found.append((int(match.group(1)), info.name, module))
+    return sorted(found, key=lambda m: m[0])
+
+def _ensure_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "name VARCHAR(100) NOT NULL, "
+        "applied_at DATETIME NOT NULL)"
+    ))
+
+def applied_versions(conn) -> set:
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+def run_migrations(engine, target: int = None) -> list:
+    """Apply pending migrations (up to target, if given). Returns the applied names."""
+    applied_now = []
+    is_mysql = engine.dialect.name == "mysql"
+
+    with engine.connect() as lock_conn:
+        # Every uvicorn worker runs this at import; only one may migrate at a time
+        if is_mysql:
+            lock_conn.execute(text("SELECT GET_LOCK(:name, 300)"), {"name": LOCK_NAME})
+        try:
+            with engine.begin() as conn:
+                _ensure_table(conn)
+                done = applied_versions(conn)
+
+            for version, name, module in discover_migrations():
+                if version in done or (target is not None and version > target):
+                    continue
+                logger.info(f"Applying migration {name}...")
+                # MySQL commits DDL implicitly, so each migration must be re-runnable
+                with engine.begin() as conn:
+                    module.upgrade(conn)
+                    conn.execute(
+                        text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                        {"v": version, "n": name, "t": datetime.utcnow()}
+                    )
+                applied_now.append(name)
+        finally:
+            if is_mysql:
+                lock_conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+
+    if applied_now:
+        logger.info(f"Applied {len(applied_now)} migration(s): {', '.join(applied_now)}")
+    return applied_now
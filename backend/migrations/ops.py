@@ -0,0 +1,34 @@
+from sqlalchemy import inspect, text
+
+def _quote(conn, name: str) -> str:
+    return conn.dialect.identifier_preparer.quote(name)
+
+def index_exists(conn, table: str, name: str) -> bool:
+    return any(ix["name"] == name for ix in inspect(conn).get_indexes(table))
+
+def column_exists(conn, table: str, column: str) -> bool:
+    return any(col["name"] == column for col in inspect(conn).get_columns(table))
+
+def create_index_if_missing(conn, table: str, name: str, columns: list, unique: bool = False):
+    if index_exists(conn, table, name):
+        return False
+    cols = ", ".join(_quote(conn, c) for c in columns)
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.execute(text(f"CREATE {kind} {_quote(conn, name)} ON {_quote(conn, table)} ({cols})"))
+    return True
+
+def drop_index_if_exists(conn, table: str, name: str):
+    if not index_exists(conn, table, name):
+        return False
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"DROP INDEX {_quote(conn, name)} ON {_quote(conn, table)}"))
+    else:
+        conn.execute(text(f"DROP INDEX {_quote(conn, name)}"))
+    return True
+
+def add_column_if_missing(conn, table: str, column: str, ddl_type: str):
+    """ddl_type is the raw column type, e.g. "DATETIME NULL"."""
+    if column_exists(conn, table, column):
+        return False
+    conn.execute(text(f"ALTER TABLE {_quote(conn, table)} ADD COLUMN {_quote(conn, column)} {ddl_type}"))
+    return True
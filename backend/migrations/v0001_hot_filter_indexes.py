@@ -0,0 +1,12 @@
+"""Composite indexes for the hot queue / appointment filters and Payment.patient_id."""
+from .ops import create_index_if_missing
+
+def upgrade(conn):
+    # Today's tickets per type/priority (dashboard, numbering fallbacks)
+    create_index_if_missing(conn, "patientqueue", "ix_patientqueue_type_prio_time", ["queueType", "isPriority", "appointmentTime"])
+    # "Does this patient already have an active ticket today?"
+    create_index_if_missing(conn, "patientqueue", "ix_patientqueue_user_status_time", ["userId", "status", "appointmentTime"])
+    # Upcoming appointments ORDER BY appointment_date, appointment_time
+    create_index_if_missing(conn, "appointments", "ix_appointments_date_time", ["appointment_date", "appointment_time"])
+    # GET /payments/patient/{patient_id}
+    create_index_if_missing(conn, "payments", "ix_payments_patient_id", ["patient_id"])
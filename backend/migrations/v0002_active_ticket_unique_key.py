@@ -0,0 +1,20 @@
+"""activeDay column + unique (userId, activeDay): at most one active ticket per patient per local day."""
+from sqlalchemy import text
+from .ops import add_column_if_missing, create_index_if_missing
+from .. import clinic_time
+
+def upgrade(conn):
+    add_column_if_missing(conn, "patientqueue", "activeDay", "DATE NULL")
+
+    # Only today's tickets can still block a registration. Older active ones are
+    # left NULL for the nightly cleanup. If the old race left a patient with
+    # two active tickets today, only the newest gets the key.
+    q = conn.dialect.identifier_preparer.quote
+    conn.execute(text(
+        f"UPDATE patientqueue SET {q('activeDay')} = :today WHERE id IN ("
+        f"SELECT id FROM (SELECT MAX(id) AS id FROM patientqueue "
+        f"WHERE status IN ('Waiting', 'In Consultation') AND {q('appointmentTime')} >= :start "
+        f"GROUP BY {q('userId')}) AS latest)"
+    ), {"today": clinic_time.local_today(), "start": clinic_time.today_start_utc()})
+
+    create_index_if_missing(conn, "patientqueue", "uq_patientqueue_user_active_day", ["userId", "activeDay"], unique=True)
@@ -0,0 +1,7 @@
+"""calledAt / completedAt on live and archived tickets, for the wait-time estimator."""
+from .ops import add_column_if_missing
+
+def upgrade(conn):
+    for table in ("patientqueue", "patientqueue_archive"):
+        add_column_if_missing(conn, table, "calledAt", "DATETIME NULL")
+        add_column_if_missing(conn, table, "completedAt", "DATETIME NULL")
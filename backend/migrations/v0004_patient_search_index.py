@@ -0,0 +1,39 @@
+"""Index on nomorRekamMedis and backfill of patient_search_tokens for existing patients."""
+import re
+import unicodedata
+from sqlalchemy import column, insert, select, table
+from .ops import create_index_if_missing
+
+# Frozen copy of the name words services/patient_search.py indexed at this
+# version; keys added later are backfilled by their own migrations
+CHUNK_SIZE = 5000
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+patients = table("patientcore", column("id"), column("firstName"), column("lastName"))
+tokens = table("patient_search_tokens", column("token"), column("patient_id"))
+
+def _words(text):
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    return [w for w in _NON_ALNUM.split(folded) if w]
+
+def upgrade(conn):
+    create_index_if_missing(conn, "patientcore", "ix_patientcore_nomorRekamMedis", ["nomorRekamMedis"])
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(patients.c.id, patients.c.firstName, patients.c.lastName)
+            .where(patients.c.id > last_id).order_by(patients.c.id).limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return
+        ids = [row.id for row in rows]
+        conn.execute(tokens.delete().where(tokens.c.patient_id.in_(ids)))
+        batch = [
+            {"token": token, "patient_id": row.id}
+            for row in rows for token in {w[:64] for w in _words(row.firstName) + _words(row.lastName)}
+        ]
+        if batch:
+            conn.execute(insert(tokens), batch)
+        last_id = ids[-1]
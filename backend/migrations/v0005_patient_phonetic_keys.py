@@ -0,0 +1,72 @@
+"""Add phonetic / skeleton name keys to patient_search_tokens for patients indexed by v0004."""
+import re
+import unicodedata
+from sqlalchemy import column, insert, or_, select, table
+
+# Frozen copy of the keys services/patient_search.py added at this version.
+# The word tokens v0004 wrote are left alone; only the keys are (re)written.
+CHUNK_SIZE = 5000
+PHONETIC_MARK = "#"
+SKELETON_MARK = "~"
+MIN_SKELETON_LENGTH = 3
+_SPELLING_RULES = [
+    ("oe", "u"), ("dj", "j"), ("tj", "c"), ("sj", "sy"), ("nj", "ny"),
+    ("ch", "kh"), ("kh", "h"), ("ph", "f"), ("th", "t"), ("dh", "d"),
+    ("q", "k"), ("x", "ks"), ("v", "f"), ("z", "s"),
+]
+_VOWELS = set("aeiouy")
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+patients = table("patientcore", column("id"), column("firstName"), column("lastName"))
+tokens = table("patient_search_tokens", column("token"), column("patient_id"))
+
+def _words(text):
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    return [w for w in _NON_ALNUM.split(folded) if w]
+
+def _collapse_doubles(word):
+    return "".join(ch for i, ch in enumerate(word) if i == 0 or ch != word[i - 1])
+
+def _phonetic(word):
+    for old, new in _SPELLING_RULES:
+        word = word.replace(old, new)
+    word = _collapse_doubles(word)
+    if len(word) > 3 and word.endswith("h"):
+        word = word[:-1]
+    return word
+
+def _keys(first_name, last_name):
+    keys = set()
+    for word in _words(first_name) + _words(last_name):
+        if not word.isalpha():
+            continue
+        phonetic = _phonetic(word)
+        keys.add((PHONETIC_MARK + phonetic)[:64])
+        skeleton = _collapse_doubles(phonetic[:1] + "".join(ch for ch in phonetic[1:] if ch not in _VOWELS))
+        if len(skeleton) >= MIN_SKELETON_LENGTH:
+            keys.add((SKELETON_MARK + skeleton)[:64])
+    return keys
+
+def upgrade(conn):
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(patients.c.id, patients.c.firstName, patients.c.lastName)
+            .where(patients.c.id > last_id).order_by(patients.c.id).limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            return
+        ids = [row.id for row in rows]
+        conn.execute(tokens.delete().where(
+            tokens.c.patient_id.in_(ids),
+            or_(tokens.c.token.startswith(PHONETIC_MARK), tokens.c.token.startswith(SKELETON_MARK))
+        ))
+        batch = [
+            {"token": key, "patient_id": row.id}
+            for row in rows for key in _keys(row.firstName, row.lastName)
+        ]
+        if batch:
+            conn.execute(insert(tokens), batch)
+        last_id = ids[-1]
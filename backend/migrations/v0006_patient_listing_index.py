@@ -0,0 +1,5 @@
+"""(firstName, id) index for keyset paging of GET /patients."""
+from .ops import create_index_if_missing
+
+def upgrade(conn):
+    create_index_if_missing(conn, "patientcore", "ix_patientcore_firstname_id", ["firstName", "id"])
@@ -0,0 +1,5 @@
+"""payments.created_at index for date-ranged exports (GET /exports/payments)."""
+from .ops import create_index_if_missing
+
+def upgrade(conn):
+    create_index_if_missing(conn, "payments", "ix_payments_created_at", ["created_at"])
@@ -0,0 +1,16 @@
+"""updated_at change tracking on the entities pushed to ERPNext (services/incremental_sync.py)."""
+from datetime import datetime
+from sqlalchemy import text
+from .ops import add_column_if_missing, column_exists, create_index_if_missing
+
+TRACKED_TABLES = ["patientcore", "doctorcore", "medicinecore", "diseases", "pharmacists"]
+
+def upgrade(conn):
+    now = datetime.utcnow()
+    for table in TRACKED_TABLES:
+        add_column_if_missing(conn, table, "updated_at", "DATETIME NULL")
+        # Existing rows count as changed when they were created (or now, if unknown),
+        # so the first incremental push still covers everything
+        source = "COALESCE(created_at, :now)" if column_exists(conn, table, "created_at") else ":now"
+        conn.execute(text(f"UPDATE {table} SET updated_at = {source} WHERE updated_at IS NULL"), {"now": now})
+        create_index_if_missing(conn, table, f"ix_{table}_updated_at", ["updated_at"])
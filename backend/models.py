@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, DateTime, Date, Enum, Float, JSON
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, DateTime, Date, Enum, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -35,6 +35,7 @@ class Disease(Base):
     name = Column(String(255)) # Disease Name
     description = Column(Text, nullable=True)
     is_active = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # Change tracking for incremental push
 
 class DoctorEntity(Base):
     __tablename__ = "doctorcore"
@@ -55,12 +56,14 @@ class DoctorEntity(Base):
 
     polyName = Column(String(50)) # Added for Policlinic Routing
     is_available = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # Change tracking for incremental push
 
 class Patient(Base):
     __tablename__ = "patientcore"
     
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow, index=True) # New field for dashboard stats
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # Change tracking for incremental push
     firstName = Column(String(100))
     lastName = Column(String(100), nullable=True)
     phone = Column(String(20), unique=True) # Added unique constraint
@@ -73,7 +76,7 @@ class Patient(Base):
     profession = Column(String(50))
     education = Column(String(20))
     
-    nomorRekamMedis = Column(String(50), nullable=True) # Medical Record Number
+    nomorRekamMedis = Column(String(50), nullable=True, index=True) # Medical Record Number
     avatar = Column(String(255), nullable=True) 
     height = Column(Integer, nullable=True) # cm
     weight = Column(Integer, nullable=True) # kg
@@ -102,6 +105,27 @@ class Patient(Base):
     maritalStatus = relationship("MaritalStatus")
     queues = relationship("PatientQueue", back_populates="patient")
 
+    __table_args__ = (
+        # Keyset paging of GET /patients (services/patient_listing.py)
+        Index("ix_patientcore_firstname_id", "firstName", "id"),
+    )
+
+class PatientSearchToken(Base):
+    __tablename__ = "patient_search_tokens"
+
+    # Normalized name words per patient (services/patient_search.py). The
+    # (token, patient_id) key serves prefix scans in id order; the reverse
+    # index checks the other query words of one candidate.
+    token = Column(String(64), primary_key=True)
+    patient_id = Column(Integer, ForeignKey("patientcore.id", ondelete="CASCADE"), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_patient_search_tokens_patient_token", "patient_id", "token"),
+    )
+
+# Tickets in these statuses block a new registration for the same patient/day
+ACTIVE_QUEUE_STATUSES = ["Waiting", "In Consultation"]
+
 class PatientQueue(Base):
     __tablename__ = "patientqueue"
     
@@ -116,10 +140,89 @@ class PatientQueue(Base):
     medicalFacilityPolyDoctorId = Column(Integer, ForeignKey("doctorcore.medicalFacilityPolyDoctorId"), nullable=True)
     queueType = Column(String(20), default="Doctor") # Doctor or Polyclinic
     polyclinic = Column(String(50), nullable=True) # e.g. General, Dental
+
+    # Local date while the ticket is active, NULL once it is not. Backs the
+    # "one active ticket per patient per day" unique key below (NULLs never collide).
+    activeDay = Column(Date, nullable=True)
+
+    # Consultation start/end (UTC), feed services/wait_time.py (migrations/v0003)
+    calledAt = Column(DateTime, nullable=True)
+    completedAt = Column(DateTime, nullable=True)
     
     patient = relationship("Patient", back_populates="queues")
     doctor = relationship("DoctorEntity")
 
+    # Existing databases get these through migrations/v0001_hot_filter_indexes.py
+    __table_args__ = (
+        # Equality columns first, then the "today" range
+        Index("ix_patientqueue_type_prio_time", "queueType", "isPriority", "appointmentTime"),
+        Index("ix_patientqueue_user_status_time", "userId", "status", "appointmentTime"),
+        # migrations/v0002_active_ticket_unique_key.py
+        Index("uq_patientqueue_user_active_day", "userId", "activeDay", unique=True),
+    )
+
+class PatientQueueArchive(Base):
+    __tablename__ = "patientqueue_archive"
+
+    # Tickets older than the retention window, moved out of patientqueue by
+    # scheduler.cleanup_queues. Same reporting columns, original id kept.
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    numberQueue = Column(String(20))
+    userId = Column(Integer, index=True)
+    appointmentTime = Column(DateTime, index=True)
+    status = Column(String(20))
+    isPriority = Column(Boolean, default=False)
+    isChecked = Column(Boolean, default=False)
+    medicalFacilityPolyDoctorId = Column(Integer, nullable=True)
+    queueType = Column(String(20))
+    polyclinic = Column(String(50), nullable=True)
+    calledAt = Column(DateTime, nullable=True)
+    completedAt = Column(DateTime, nullable=True)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+class QueueCounter(Base):
+    __tablename__ = "queue_counter"
+
+    # One row per local day / queue type / priority. Incremented atomically
+    # inside the registration transaction (see services/queue_numbering.py)
+    counterDate = Column(Date, primary_key=True) # Local (Asia/Jakarta) date
+    queueType = Column(String(20), primary_key=True) # Doctor or Polyclinic
+    isPriority = Column(Boolean, primary_key=True)
+    lastNumber = Column(Integer, default=0, nullable=False)
+
+class QueueEvent(Base):
+    __tablename__ = "queue_events"
+
+    # Append-only change log for the live queue stream (see services/queue_events.py).
+    # The autoincrement id doubles as the SSE event id clients resume from.
+    id = Column(Integer, primary_key=True, index=True)
+    eventType = Column(String(30)) # created, status_changed, completed
+    queueId = Column(Integer)
+    payload = Column(Text) # Pre-serialized schemas.PatientQueue JSON
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class OutboxMessage(Base):
+    __tablename__ = "outbox_messages"
+
+    # Side effects for ERPNext / SatuSehat, written in the same commit as the
+    # business row and drained by backend/outbox_worker.py (services/outbox.py).
+    id = Column(Integer, primary_key=True, index=True)
+    topic = Column(String(50)) # e.g. frappe.create_patient
+    payload = Column(Text) # JSON
+    idempotencyKey = Column(String(150), unique=True)
+    status = Column(String(20), default="pending") # pending, processing, done, dead
+    attempts = Column(Integer, default=0)
+    nextAttemptAt = Column(DateTime, default=datetime.utcnow)
+    lockedBy = Column(String(32), nullable=True) # Claim token of the worker batch
+    lockedUntil = Column(DateTime, nullable=True)
+    lastError = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbox_status_next_attempt", "status", "nextAttemptAt"),
+    )
+
 class Medicine(Base):
     __tablename__ = "medicinecore"
     
@@ -143,6 +246,7 @@ class Medicine(Base):
     notes = Column(Text, nullable=True) # Signa Text
     signa1 = Column(Integer, nullable=True) # Frequency
     signa2 = Column(Float, nullable=True) # Qty per dose
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # Change tracking for incremental push
     
     # Relationship for Batches
     batches = relationship("MedicineBatch", back_populates="medicine", cascade="all, delete-orphan")
@@ -164,7 +268,7 @@ class Payment(Base):
     __tablename__ = "payments"
 
     id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey("patientcore.id"))
+    patient_id = Column(Integer, ForeignKey("patientcore.id"), index=True)
     amount = Column(Integer, default=0)
     method = Column(String(50)) # Cash, BPJS, Insurance, Debit, etc.
     
@@ -174,7 +278,7 @@ class Payment(Base):
     claimStatus = Column(String(50), default="Pending") # Pending, Submitted, Paid, Rejected
 
     notes = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
     patient = relationship("Patient")
 
@@ -189,6 +293,44 @@ class Pharmacist(Base):
     erp_employee_id = Column(String(100), nullable=True) # ERPNext Employee ID
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True) # Change tracking for incremental push
+
+class SyncWatermark(Base):
+    __tablename__ = "sync_watermarks"
+
+    # How far an incremental push job got (services/incremental_sync.py): every
+    # row up to (lastUpdatedAt, lastId) in updated_at order has been pushed
+    target = Column(String(50), primary_key=True) # e.g. erpnext.patient
+    lastUpdatedAt = Column(DateTime, nullable=True)
+    lastId = Column(Integer, default=0)
+    lastRunAt = Column(DateTime, nullable=True)
+    lastSuccessAt = Column(DateTime, nullable=True) # Last run that pushed everything it found
+    lastPushed = Column(Integer, default=0)
+    lastFailed = Column(Integer, default=0)
+    lastError = Column(Text, nullable=True)
+
+class NikLookup(Base):
+    __tablename__ = "nik_lookups"
+
+    # Cached SatuSehat search-by-NIK answers (services/nik_cache.py): the
+    # parsed resource as JSON, or NULL when SatuSehat had no match
+    kind = Column(String(20), primary_key=True) # patient, practitioner
+    nik = Column(String(16), primary_key=True)
+    result = Column(Text, nullable=True)
+    fetchedAt = Column(DateTime, default=datetime.utcnow)
+    expiresAt = Column(DateTime, index=True)
+
+class KfaProduct(Base):
+    __tablename__ = "kfa_products"
+
+    # Local mirror of the KFA farmasi catalog (services/kfa_catalog.py); data
+    # is the item as KFA returned it, so search results parse exactly as the
+    # live API's
+    kfa_code = Column(String(50), primary_key=True)
+    name = Column(String(255))
+    data = Column(Text)
+    active = Column(Boolean, default=True)
+    syncedAt = Column(DateTime, default=datetime.utcnow, index=True)
 
 class AppConfig(Base):
     __tablename__ = "app_config"
@@ -211,3 +353,7 @@ class Appointment(Base):
     notes = Column(Text, nullable=True) # Notes
     status = Column(String(20), default="Scheduled")
     created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_appointments_date_time", "appointment_date", "appointment_time"),
+    )
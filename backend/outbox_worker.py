@@ -0,0 +1,71 @@
+"""
+Drains the outbox (services/outbox.py) outside the web workers.
+
+    python -m backend.outbox_worker
+
+Claims due messages in batches, runs them on a bounded thread pool (one DB
+session per message) and records success or schedules a retry with
+exponential backoff. Several workers can run side by side.
+"""
+import logging
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .database import SessionLocal
+from .services import outbox
+from .services import outbox_handlers # noqa: F401 - registers the handlers
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+CONCURRENCY = int(os.getenv("OUTBOX_CONCURRENCY", "4"))
+POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+
+_stop = threading.Event()
+
+def _run_one(message_id: int) -> bool:
+    db = SessionLocal()
+    try:
+        return outbox.process_message(db, message_id)
+    except Exception as e:
+        logger.error(f"Outbox message {message_id} could not be processed: {e}")
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+def run_once(executor: ThreadPoolExecutor) -> int:
+    """Claim and process one batch; returns how many messages were claimed."""
+    db = SessionLocal()
+    try:
+        ids = outbox.claim_batch(db, BATCH_SIZE)
+    finally:
+        db.close()
+    if ids:
+        results = list(executor.map(_run_one, ids))
+        logger.info(f"Outbox batch: {sum(results)}/{len(ids)} delivered")
+    return len(ids)
+
+def run(stop: threading.Event = _stop):
+    logger.info(f"Outbox worker started (batch {BATCH_SIZE}, concurrency {CONCURRENCY})")
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        while not stop.is_set():
+            try:
+                claimed = run_once(executor)
+            except Exception as e:
+                logger.error(f"Outbox poll failed: {e}")
+                claimed = 0
+            # A full batch means more is probably due; otherwise wait
+            if claimed < BATCH_SIZE:
+                stop.wait(POLL_INTERVAL_SECONDS)
+    logger.info("Outbox worker stopped")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    signal.signal(signal.SIGINT, lambda *_: _stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: _stop.set())
+    run()
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from datetime import datetime
 from .. import models, database, dependencies
 
@@ -34,7 +34,9 @@ def get_dashboard_overview(db: Session = Depends(database.get_db), current_user:
     ).count()
 
     # 4. Recent Activity (Last 5 Queues TODAY)
-    recent_queues = db.query(models.PatientQueue).filter(
+    recent_queues = db.query(models.PatientQueue).options(
+        joinedload(models.PatientQueue.patient)
+    ).filter(
         models.PatientQueue.appointmentTime >= today_start
     ).order_by(
         models.PatientQueue.appointmentTime.desc()
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from .. import models, schemas, database, dependencies
+from ..services.erpnext_push import push_changes, TARGET_DISEASE
 from pydantic import BaseModel
 
 router = APIRouter(
@@ -81,7 +82,6 @@ def sync_diseases_pull(db: Session = Depends(database.get_db), current_user: mod
     # We might need to update get_list to accept fields or use a custom call here for simplicity.
     
     # Custom fetch to get fields
-    import requests
     import json
     
     count = 0
@@ -91,7 +91,7 @@ def sync_diseases_pull(db: Session = Depends(database.get_db), current_user: mod
             "fields": '["name", "code", "description"]',
             "limit_page_length": 1000 # Fetch reasonable amount
         }
-        resp = requests.get(url, headers=frappe_client.headers, params=params, timeout=10)
+        resp = frappe_client.session.get(url, headers=frappe_client.headers, params=params)
         if resp.status_code == 200:
             data = resp.json().get("data", [])
             for item in data:
@@ -116,19 +116,7 @@ def sync_diseases_pull(db: Session = Depends(database.get_db), current_user: mod
     return {"status": "success", "count": count}
 
 @router.post("/sync/push")
-def sync_diseases_push(db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    from ..services.frappe_service import frappe_client
-    
-    # Push Local -> ERPNext
-    diseases = db.query(models.Disease).all()
-    count = 0
-    errors = 0
-    
-    for disease in diseases:
-        result = frappe_client.create_diagnosis(disease.icd_code, disease.name)
-        if result:
-            count += 1
-        else:
-            errors += 1
-            
-    return {"status": "success", "synced": count, "errors": errors}
+def sync_diseases_push(full: bool = False, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    # Push Local -> ERPNext, only diseases changed since the last push (full=true: all)
+    report = push_changes(db, TARGET_DISEASE, full=full)
+    return {"status": "success", "synced": report["pushed"], "errors": report["failed"], **report}
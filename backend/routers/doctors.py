@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 from sqlalchemy.orm import Session
 from .. import models, schemas, database
+from ..services.erpnext_push import push_changes, TARGET_DOCTOR
 
 router = APIRouter(
     prefix="/doctors",
@@ -56,40 +57,10 @@ def sync_doctors_pull(db: Session = Depends(database.get_db)):
     return {"status": "success", "count": synced_count}
 
 @router.post("/sync/push")
-def sync_doctors_push(db: Session = Depends(database.get_db)):
-    """Push data from App to ERPNext"""
-    from ..services.frappe_service import frappe_client
-    
-    local_doctors = db.query(models.DoctorEntity).all()
-    synced_count = 0
-    
-    for doc in local_doctors:
-        try:
-            name_parts = doc.namaDokter.split(" ", 1)
-            first_name = name_parts[0]
-            last_name = name_parts[1] if len(name_parts) > 1 else ""
-            
-            # Check if exists in ERPNext by Name (since we don't store ERP ID reliably yet)
-            erp_docs = frappe_client.get_list("Healthcare Practitioner", filters={"practitioner_name": doc.namaDokter})
-            
-            if erp_docs:
-                # Update
-                frappe_id = erp_docs[0].get("name")
-                update_data = {
-                    "first_name": first_name,
-                    "last_name": last_name,
-                    "department": doc.polyName
-                }
-                frappe_client.update_practitioner(frappe_id, update_data)
-            else:
-                # Create
-                frappe_client.create_practitioner(first_name, last_name, doc.polyName)
-            
-            synced_count += 1
-        except Exception as e:
-            print(f"Error pushing doctor {doc.namaDokter}: {e}")
-
-    return {"status": "success", "count": synced_count}
+def sync_doctors_push(full: bool = False, db: Session = Depends(database.get_db)):
+    """Push doctors changed since the last push to ERPNext (full=true: all of them)"""
+    report = push_changes(db, TARGET_DOCTOR, full=full)
+    return {"status": "success", "count": report["pushed"], **report}
 
 @router.post("", response_model=schemas.Doctor)
 def create_doctor(doctor: schemas.DoctorBase, db: Session = Depends(database.get_db)):
@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from .. import models, dependencies, clinic_time
+from ..services.exports import stream_export, FORMAT_CSV, FORMAT_NDJSON, MEDIA_TYPES
+
+router = APIRouter(
+    prefix="/exports",
+    tags=["exports"]
+)
+
+# Left out of the patient export (avatar is a path to an uploaded image)
+PATIENT_EXCLUDED_COLUMNS = {"avatar"}
+
+def _utc_range(column, date_from: Optional[date], date_to: Optional[date]) -> list:
+    """Local-day range [date_from, date_to] on a UTC timestamp column."""
+    conditions = []
+    if date_from:
+        conditions.append(column >= clinic_time.day_start_utc(date_from))
+    if date_to:
+        conditions.append(column < clinic_time.day_start_utc(date_to + timedelta(days=1)))
+    return conditions
+
+def _date_range(column, date_from: Optional[date], date_to: Optional[date]) -> list:
+    conditions = []
+    if date_from:
+        conditions.append(column >= date_from)
+    if date_to:
+        conditions.append(column <= date_to)
+    return conditions
+
+def _response(name: str, statements: list, columns: list, format: str, gzip: bool) -> StreamingResponse:
+    if format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be {FORMAT_CSV} or {FORMAT_NDJSON}")
+    filename = f"{name}_{clinic_time.local_today().isoformat()}.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        stream_export(name, statements, columns, format, gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/patients")
+def export_patients(format: str = FORMAT_CSV, date_from: Optional[date] = None, date_to: Optional[date] = None, gzip: bool = False, current_user: models.User = Depends(dependencies.get_current_user)):
+    """Patients registered between date_from and date_to (local days, inclusive), oldest first."""
+    table = models.Patient.__table__
+    columns = [c for c in table.c if c.name not in PATIENT_EXCLUDED_COLUMNS]
+    statement = (select(*columns).where(*_utc_range(table.c.created_at, date_from, date_to))
+                 .order_by(table.c.created_at, table.c.id))
+    return _response("patients", [statement], [c.name for c in columns], format, gzip)
+
+@router.get("/queue-history")
+def export_queue_history(format: str = FORMAT_CSV, date_from: Optional[date] = None, date_to: Optional[date] = None, gzip: bool = False, current_user: models.User = Depends(dependencies.get_current_user)):
+    """
+    Tickets by appointment time: archived ones first, then the live table.
+    scheduler.cleanup_queues moves a ticket in one transaction, so none
+    appears twice.
+    """
+    from ..scheduler import ARCHIVE_COLUMNS
+    statements = []
+    for table in (models.PatientQueueArchive.__table__, models.PatientQueue.__table__):
+        statements.append(
+            select(*[table.c[name] for name in ARCHIVE_COLUMNS])
+            .where(*_utc_range(table.c.appointmentTime, date_from, date_to))
+            .order_by(table.c.appointmentTime, table.c.id)
+        )
+    return _response("queue_history", statements, ARCHIVE_COLUMNS, format, gzip)
+
+@router.get("/appointments")
+def export_appointments(format: str = FORMAT_CSV, date_from: Optional[date] = None, date_to: Optional[date] = None, gzip: bool = False, current_user: models.User = Depends(dependencies.get_current_user)):
+    """Appointments scheduled between date_from and date_to (inclusive)."""
+    table = models.Appointment.__table__
+    statement = (select(*table.c).where(*_date_range(table.c.appointment_date, date_from, date_to))
+                 .order_by(table.c.appointment_date, table.c.appointment_time, table.c.id))
+    return _response("appointments", [statement], [c.name for c in table.c], format, gzip)
+
+@router.get("/payments")
+def export_payments(format: str = FORMAT_CSV, date_from: Optional[date] = None, date_to: Optional[date] = None, gzip: bool = False, current_user: models.User = Depends(dependencies.get_current_user)):
+    """Payments made between date_from and date_to (local days, inclusive)."""
+    table = models.Payment.__table__
+    statement = (select(*table.c).where(*_utc_range(table.c.created_at, date_from, date_to))
+                 .order_by(table.c.created_at, table.c.id))
+    return _response("payments", [statement], [c.name for c in table.c], format, gzip)
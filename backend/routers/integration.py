@@ -1,6 +1,12 @@
+import json
 from fastapi import APIRouter, Depends, HTTPException
-from ..services.satu_sehat_service import satu_sehat_client
-from ..auth_utils import get_current_user
+from fastapi.responses import StreamingResponse
+from ..services.satu_sehat_service import satu_sehat_client, async_satu_sehat_client
+from ..services.incremental_sync import keep_updated_at
+from ..services.ihs_linking import ihs_linker, KIND_PATIENTS, KIND_DOCTORS
+from ..services.nik_cache import nik_cache
+from ..services.kfa_catalog import kfa_catalog
+from ..auth_utils import get_current_user, get_current_user_released
 from .. import models
 from ..database import get_db
 from sqlalchemy.orm import Session
@@ -11,9 +17,9 @@ router = APIRouter(
 )
 
 @router.get("/satusehat/patient/{nik}")
-def get_patient_from_satusehat(
+async def get_patient_from_satusehat(
     nik: str,
-    current_user: models.User = Depends(get_current_user)
+    current_user: models.User = Depends(get_current_user_released)
 ):
     """
     Fetch Patient details from Satu Sehat by NIK.
@@ -23,63 +29,102 @@ def get_patient_from_satusehat(
          raise HTTPException(status_code=400, detail="Invalid NIK format")
 
     try:
-        patient_data = satu_sehat_client.search_patient_by_nik(nik)
+        patient_data = await async_satu_sehat_client.search_patient_by_nik(nik)
         if not patient_data:
             raise HTTPException(status_code=404, detail="Patient not found in Satu Sehat")
         return patient_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/satusehat/nik-cache/{nik}")
+def invalidate_nik_lookup(
+    nik: str,
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Forget the cached SatuSehat answers for a NIK, e.g. after the patient
+    registered at SatuSehat or their data was corrected there.
+    """
+    return {"status": "success", "deleted": nik_cache.invalidate(nik)}
+
+@router.delete("/satusehat/nik-cache")
+def clear_nik_lookups(current_user: models.User = Depends(get_current_user)):
+    """Forget every cached SatuSehat NIK answer."""
+    return {"status": "success", "deleted": nik_cache.clear()}
+
 @router.get("/kfa/products")
-def search_kfa_products(
+async def search_kfa_products(
     query: str,
     page: int = 1,
     limit: int = 10,
-    current_user: models.User = Depends(get_current_user)
+    current_user: models.User = Depends(get_current_user_released)
 ):
     """
-    Search KFA Products (Medicines).
+    Search KFA Products (Medicines), from the local catalog mirror.
     """
     if not query:
         return []
-        
+
+    if kfa_catalog.ready:
+        return kfa_catalog.search(query, page, limit)
+
+    # Mirror not filled yet (first start, before its first refresh): ask KFA directly
     try:
-        return satu_sehat_client.search_kfa_products(query, page, limit)
+        return await async_satu_sehat_client.search_kfa_products(query, page, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/diagnostic-reports/{patient_id}")
-def get_diagnostic_reports(
-    patient_id: int,
-    db: Session = Depends(get_db),
+@router.post("/kfa/refresh")
+def refresh_kfa_catalog(
+    full: bool = False,
     current_user: models.User = Depends(get_current_user)
 ):
     """
-    Get Diagnostic Reports from Satu Sehat for a local patient.
+    Mirror KFA products changed since the last refresh (all of them with
+    full=true) in the background; progress at /metrics/kfa-catalog.
     """
+    if not kfa_catalog.start_refresh(full):
+        return {"status": "running", "message": "A KFA catalog refresh is already running"}
+    return {"status": "started", "message": f"{'Full' if full else 'Incremental'} KFA catalog refresh started"}
+
+def _patient_ihs_number(db: Session, patient_id: int) -> str:
     # 1. Get Patient
     patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
-        
+
     # 2. Check IHS Number
     ihs_number = patient.ihs_number
     if not ihs_number:
-        # Try to search by NIK if not linked yet
+        # Try to search by NIK if not linked yet (answered from the NIK cache when seen before)
         if patient.identityCard:
             try:
                 ss_data = satu_sehat_client.search_patient_by_nik(patient.identityCard)
                 if ss_data and ss_data.get("ihs_number"):
                     ihs_number = ss_data.get("ihs_number")
-                    # Update DB
+                    # Update DB; a link is not a local change to push to ERPNext
                     patient.ihs_number = ihs_number
+                    keep_updated_at(patient)
                     db.commit()
             except Exception as e:
                 print(f"Error fetching/linking IHS for patient {patient.identityCard}: {e}")
                 # Continue without linking
                 pass
-    
+
     if not ihs_number:
          raise HTTPException(status_code=400, detail="Patient does not have IHS Number linked (and search by NIK failed)")
+    return ihs_number
+
+@router.get("/diagnostic-reports/{patient_id}")
+def get_diagnostic_reports(
+    patient_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Get Diagnostic Reports from Satu Sehat for a local patient.
+    """
+    ihs_number = _patient_ihs_number(db, patient_id)
 
     # 3. Fetch Reports
     try:
@@ -88,42 +133,42 @@ def get_diagnostic_reports(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/diagnostic-reports/{patient_id}/stream")
+def stream_diagnostic_reports(
+    patient_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    The same reports as NDJSON, one per line, latest first. On a first visit
+    each SatuSehat page is sent on as it arrives, so the newest reports show
+    before a long history has loaded. If SatuSehat fails part-way, the
+    last line is {"error": "..."}.
+    """
+    ihs_number = _patient_ihs_number(db, patient_id)
+
+    def lines():
+        try:
+            for report in satu_sehat_client.diagnostic_reports.stream(ihs_number):
+                yield json.dumps(report) + "\n"
+        except Exception as e:
+            print(f"Diagnostic report stream for IHS {ihs_number} failed: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 # --- Sync Endpoints (Doctors) ---
 
 @router.post("/satusehat/doctors/sync")
 def sync_doctors_pull(
-    db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """
-    Pull/Link: Search SatuSehat by NIK for local doctors and update IHS Number.
+    Pull/Link: Look up unlinked doctors on SatuSehat by NIK and store their IHS
+    Number. Runs in the background; poll /satusehat/link-jobs/{id} for progress.
     """
-    try:
-        doctors = db.query(models.DoctorEntity).filter(
-            models.DoctorEntity.identityCard != None
-        ).all()
-        
-        count = 0
-        updated = 0
-        
-        for d in doctors:
-            # Skip if already linked (optional, but good for perf)
-            # if d.ihs_practitioner_number: continue 
-            
-            if len(d.identityCard) != 16: continue
-            
-            result = satu_sehat_client.search_practitioner_by_nik(d.identityCard)
-            if result and result.get("ihs_number"):
-                if d.ihs_practitioner_number != result.get("ihs_number"):
-                    d.ihs_practitioner_number = result.get("ihs_number")
-                    updated += 1
-                count += 1
-        
-        db.commit()
-        return {"status": "success", "message": f"Linked {updated} doctors. Total verified: {count}", "count": updated}
-    except Exception as e:
-        print(f"Error syncing doctors: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    job = ihs_linker.start(KIND_DOCTORS)
+    return {"status": "started", "message": f"Linking doctors in the background (job {job.id})", "count": job.linked, "job": job.to_dict()}
 
 @router.post("/satusehat/doctors/push")
 def sync_doctors_push(
@@ -140,23 +185,23 @@ def sync_doctors_push(
             models.DoctorEntity.ihs_practitioner_number == None
         ).all()
         
+        doctors = [d for d in doctors if len(d.identityCard) == 16]
+
+        # Mapping model to dict for the service, which sends them in transaction Bundles
+        ihs_numbers = satu_sehat_client.create_practitioners([{
+            "identityCard": d.identityCard,
+            "namaDokter": d.namaDokter,
+            "firstName": d.firstName,
+            "lastName": d.lastName
+        } for d in doctors])
+
         count = 0
-        for d in doctors:
-            if len(d.identityCard) != 16: continue
-            
-            # Use the service method which constructs payload
-            # Mapping model to dict for the helper
-            d_data = {
-                "identityCard": d.identityCard,
-                "namaDokter": d.namaDokter,
-                "firstName": d.firstName,
-                "lastName": d.lastName
-            }
-            new_ihs = satu_sehat_client.create_practitioner_on_satusehat(d_data)
+        for d, new_ihs in zip(doctors, ihs_numbers):
             if new_ihs:
                 d.ihs_practitioner_number = new_ihs
+                keep_updated_at(d)
                 count += 1
-                
+
         db.commit()
         return {"status": "success", "message": f"Created {count} new practitioners on SatuSehat.", "count": count}
     except Exception as e:
@@ -167,36 +212,26 @@ def sync_doctors_push(
 
 @router.post("/satusehat/patients/sync")
 def sync_patients_pull(
-    db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user)
 ):
     """
-    Pull/Link: Search SatuSehat by NIK for local patients and update IHS Number.
+    Pull/Link: Look up unlinked patients on SatuSehat by NIK and store their IHS
+    Number. Runs in the background; poll /satusehat/link-jobs/{id} for progress.
     """
-    try:
-        # Get patients with NIK
-        patients = db.query(models.Patient).filter(
-            models.Patient.identityCard != None
-        ).all()
-        
-        updated = 0
-        verified = 0
-        
-        for p in patients:
-            if len(p.identityCard) != 16: continue
-            
-            # Check SS
-            ss_data = satu_sehat_client.search_patient_by_nik(p.identityCard)
-            if ss_data and ss_data.get("ihs_number"):
-                if p.ihs_number != ss_data.get("ihs_number"):
-                    p.ihs_number = ss_data.get("ihs_number")
-                    updated += 1
-                verified += 1
-                
-        db.commit()
-        return {"status": "success", "message": f"Linked {updated} patients. Total verified: {verified}", "count": updated}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    job = ihs_linker.start(KIND_PATIENTS)
+    return {"status": "started", "message": f"Linking patients in the background (job {job.id})", "count": job.linked, "job": job.to_dict()}
+
+@router.get("/satusehat/link-jobs")
+def list_link_jobs(current_user: models.User = Depends(get_current_user)):
+    """Recent IHS linking jobs of this server, newest first."""
+    return [job.to_dict() for job in ihs_linker.jobs()]
+
+@router.get("/satusehat/link-jobs/{job_id}")
+def get_link_job(job_id: str, current_user: models.User = Depends(get_current_user)):
+    job = ihs_linker.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Link job not found")
+    return job.to_dict()
 
 @router.post("/satusehat/patients/push")
 def sync_patients_push(
@@ -213,29 +248,28 @@ def sync_patients_push(
             models.Patient.ihs_number == None
         ).all()
         
+        patients = [p for p in patients if len(p.identityCard) == 16]
+
+        # Convert models to dicts for the service, which sends them in transaction Bundles
+        ihs_numbers = satu_sehat_client.create_patients([{
+            "identityCard": p.identityCard,
+            "firstName": p.firstName,
+            "lastName": p.lastName,
+            "gender": p.gender,
+            "birthday": p.birthday,
+            "phone": p.phone,
+            "address": p.address,
+            "city": p.city,
+            "postalCode": p.postalCode
+        } for p in patients])
+
         count = 0
-        for p in patients:
-            if len(p.identityCard) != 16: continue
-            
-            # Convert model to dict for service
-            p_data = {
-                "identityCard": p.identityCard,
-                "firstName": p.firstName,
-                "lastName": p.lastName,
-                "gender": p.gender,
-                "birthday": p.birthday,
-                "phone": p.phone,
-                "address": p.address,
-                "city": p.city,
-                "postalCode": p.postalCode
-            }
-            
-            # This method attempts to create
-            new_ihs = satu_sehat_client._create_new_patient_on_satusehat(p_data)
+        for p, new_ihs in zip(patients, ihs_numbers):
             if new_ihs:
                 p.ihs_number = new_ihs
+                keep_updated_at(p)
                 count += 1
-                
+
         db.commit()
         return {"status": "success", "message": f"Created {count} new patients on SatuSehat.", "count": count}
     except Exception as e:
@@ -257,30 +291,34 @@ def sync_pharmacists_push(
             models.Pharmacist.ihs_number == None
         ).all()
         
-        count = 0
+        pharmacists = [p for p in pharmacists if len(p.nik) == 16]
+
+        p_data = []
         for p in pharmacists:
-            if len(p.nik) != 16: continue
-            
             # Helper to split name
             parts = p.name.replace("Apt.", "").replace("S.Farm", "").strip().split(" ")
             first_name = parts[0]
             last_name = " ".join(parts[1:]) if len(parts) > 1 else first_name
             # Fallback if first name too short?
-            
+
             # Map to doctor_data format expected by service
-            p_data = {
+            p_data.append({
                 "identityCard": p.nik,
                 "namaDokter": p.name,
                 "firstName": first_name,
                 "lastName": last_name
-            }
-            
-            # Pharmacists are Practitioners too
-            new_ihs = satu_sehat_client.create_practitioner_on_satusehat(p_data)
+            })
+
+        # Pharmacists are Practitioners too
+        ihs_numbers = satu_sehat_client.create_practitioners(p_data)
+
+        count = 0
+        for p, new_ihs in zip(pharmacists, ihs_numbers):
             if new_ihs:
                 p.ihs_number = new_ihs
+                keep_updated_at(p)
                 count += 1
-                
+
         db.commit()
         return {"status": "success", "message": f"Created {count} new pharmacists/practitioners on SatuSehat.", "count": count}
     except Exception as e:
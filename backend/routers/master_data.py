@@ -35,49 +35,37 @@ def create_issuer(issuer: schemas.IssuerBase, db: Session = Depends(database.get
 
 
 
-import requests
+from ..services.http_pool import http_pool
 
 BASE_URL_WILAYAH = "https://www.emsifa.com/api-wilayah-indonesia/api"
 
-from functools import lru_cache
+# The province list never changes; kept once fetched successfully
+_provinces = []
 
-@router.get("/address/provinces")
-@lru_cache(maxsize=1)
-def get_provinces():
+async def _fetch_wilayah(path: str, what: str) -> list:
     try:
-        resp = requests.get(f"{BASE_URL_WILAYAH}/provinces.json", timeout=10)
+        resp = await http_pool.async_client("wilayah").get(f"{BASE_URL_WILAYAH}/{path}")
         if resp.status_code == 200:
             return resp.json()
     except Exception as e:
-        print(f"Error fetching provinces: {e}")
+        print(f"Error fetching {what}: {e}")
     return []
 
+@router.get("/address/provinces")
+async def get_provinces():
+    global _provinces
+    if not _provinces:
+        _provinces = await _fetch_wilayah("provinces.json", "provinces")
+    return _provinces
+
 @router.get("/address/cities/{province_id}")
 async def get_cities(province_id: str):
-    try:
-        resp = requests.get(f"{BASE_URL_WILAYAH}/regencies/{province_id}.json", timeout=10)
-        if resp.status_code == 200:
-            return resp.json()
-    except Exception as e:
-        print(f"Error fetching cities: {e}")
-    return []
+    return await _fetch_wilayah(f"regencies/{province_id}.json", "cities")
 
 @router.get("/address/districts/{city_id}")
 async def get_districts(city_id: str):
-    try:
-        resp = requests.get(f"{BASE_URL_WILAYAH}/districts/{city_id}.json", timeout=10)
-        if resp.status_code == 200:
-            return resp.json()
-    except Exception as e:
-        print(f"Error fetching districts: {e}")
-    return []
+    return await _fetch_wilayah(f"districts/{city_id}.json", "districts")
 
 @router.get("/address/subdistricts/{district_id}")
 async def get_subdistricts(district_id: str):
-    try:
-        resp = requests.get(f"{BASE_URL_WILAYAH}/villages/{district_id}.json", timeout=10)
-        if resp.status_code == 200:
-            return resp.json()
-    except Exception as e:
-        print(f"Error fetching subdistricts: {e}")
-    return []
+    return await _fetch_wilayah(f"villages/{district_id}.json", "subdistricts")
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
 from typing import List
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from .. import models, schemas, database, dependencies
-from ..services.frappe_service import frappe_client
+from ..services.erpnext_push import push_changes, TARGET_MEDICINE
+from ..services.medicine_pull import pull_medicines
 import uuid
 
 router = APIRouter(
@@ -12,7 +13,10 @@ router = APIRouter(
 
 @router.get("/", response_model=List[schemas.Medicine])
 def get_medicines(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    return db.query(models.Medicine).offset(skip).limit(limit).all()
+    # Batches for the whole page in one extra SELECT ... WHERE medicine_id IN (...)
+    return db.query(models.Medicine).options(
+        selectinload(models.Medicine.batches)
+    ).order_by(models.Medicine.id.asc()).offset(skip).limit(limit).all()
 
 @router.post("/", response_model=schemas.Medicine)
 def create_medicine(medicine: schemas.MedicineCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
@@ -42,86 +46,17 @@ def create_medicine(medicine: schemas.MedicineCreate, db: Session = Depends(data
 
 @router.post("/sync")
 def sync_medicines_pull(db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    """Pull data from ERPNext to App"""
-    # 1. Fetch Items from ERPNext
-    items = frappe_client.get_items()
-    if not items:
-        return {"status": "failed", "message": "Failed to fetch items from ERPNext", "count": 0}
-
-    synced_count = 0
-    
-    for item in items:
-        item_code = item.get("name") # In Frappe, name is the ID (item_code)
-        
-        # 2. Get Stock
-        stock_qty = frappe_client.get_item_stock(item_code)
-        
-        # 3. Check if exists
-        existing_med = db.query(models.Medicine).filter(models.Medicine.erpnext_item_code == item_code).first()
-        
-        if existing_med:
-            # Update
-            existing_med.medicineName = item.get("item_name")
-            existing_med.medicineDescription = item.get("description")
-            existing_med.unit = item.get("stock_uom")
-            existing_med.qty = int(stock_qty)
-        else:
-            # Create
-            new_med = models.Medicine(
-                erpnext_item_code=item_code,
-                medicineName=item.get("item_name"),
-                medicineDescription=item.get("description"),
-                unit=item.get("stock_uom"),
-                qty=int(stock_qty),
-                medicinePrice=0,
-                medicineRetailPrice=0
-            )
-            db.add(new_med)
-            
-        synced_count += 1
-    
-    db.commit()
-    return {"status": "success", "count": synced_count}
+    """Pull data from ERPNext to App: items, and stock summed over their Bins, in bulk"""
+    report = pull_medicines(db)
+    if "error" in report:
+        return {"status": "failed", "message": report["error"], "count": 0}
+    return {"status": "success", **report}
 
 @router.post("/sync/push")
-def sync_medicines_push(db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    """Push data from App to ERPNext"""
-    local_meds = db.query(models.Medicine).all()
-    synced_count = 0
-    
-    for med in local_meds:
-        try:
-            # Check if using manual code (e.g. MANUAL-...), maybe we want to create real code in ERP?
-            # For now, we respect the local item code which should be "Item Code" in ERPNext.
-            
-            # Check if exists by Item Code
-            # Optimization: could fetch all items first, but per-item is safer for now.
-            filters = {"item_code": med.erpnext_item_code}
-            existing_erp = frappe_client.get_list("Item", filters=filters)
-            
-            if existing_erp:
-                # Update
-                update_data = {
-                    "item_name": med.medicineName,
-                    "description": med.medicineDescription,
-                    "stock_uom": med.unit,
-                    "standard_rate": med.medicineRetailPrice
-                }
-                frappe_client.update_item(med.erpnext_item_code, update_data)
-            else:
-                # Create
-                frappe_client.create_item(
-                    item_code=med.erpnext_item_code,
-                    item_name=med.medicineName,
-                    stock_uom=med.unit,
-                    description=med.medicineDescription,
-                    standard_rate=med.medicineRetailPrice
-                )
-            synced_count += 1
-        except Exception as e:
-            print(f"Error pushing medicine {med.medicineName}: {e}")
-
-    return {"status": "success", "count": synced_count}
+def sync_medicines_push(full: bool = False, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """Push medicines changed since the last push to ERPNext (full=true: all of them)"""
+    report = push_changes(db, TARGET_MEDICINE, full=full)
+    return {"status": "success", "count": report["pushed"], **report}
 
 @router.put("/{medicine_id}", response_model=schemas.Medicine)
 def update_medicine(medicine_id: int, medicine_update: schemas.MedicineCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
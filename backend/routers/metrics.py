@@ -0,0 +1,80 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+from .. import database
+from ..services.http_pool import http_pool
+from ..services.outbox import outbox_stats
+from ..services.incremental_sync import watermark_stats
+from ..services.nik_cache import nik_cache
+from ..services.patient_listing import patient_counter
+from ..services.queue_cache import queue_snapshot_cache
+from ..services.wait_time import wait_time_estimator
+
+router = APIRouter(
+    prefix="/metrics",
+    tags=["metrics"]
+)
+
+@router.get("/queue-cache")
+def get_queue_cache_metrics():
+    """Hit ratio and rebuild timings of the GET /patients/queue snapshot cache."""
+    return queue_snapshot_cache.stats()
+
+@router.get("/queue-cleanup")
+def get_queue_cleanup_metrics():
+    """Rows touched, chunk timings and lock wait of the last nightly queue cleanup."""
+    from .. import scheduler
+    return scheduler.last_cleanup_report
+
+@router.get("/wait-time")
+def get_wait_time_metrics():
+    """Consultation-length statistics behind estimatedWaitMinutes."""
+    return wait_time_estimator.stats()
+
+@router.get("/outbox")
+def get_outbox_metrics(db: Session = Depends(database.get_db)):
+    """Outbox backlog (pending / processing / dead) and age of the oldest undelivered message."""
+    return outbox_stats(db)
+
+@router.get("/patient-count")
+def get_patient_count_metrics():
+    """Cached patient total behind X-Total-Count on GET /patients, with its age."""
+    return patient_counter.stats()
+
+@router.get("/sync")
+def get_sync_metrics(db: Session = Depends(database.get_db)):
+    """Watermark and outcome of the last incremental ERPNext push per target."""
+    return watermark_stats(db)
+
+@router.get("/http")
+def get_http_metrics():
+    """Connection reuse and per-endpoint latency histograms of the ERPNext / SatuSehat clients."""
+    return http_pool.stats()
+
+@router.get("/satusehat-token")
+def get_satusehat_token_metrics():
+    """SatuSehat OAuth token refreshes (background / forced after a 401), waits and fetch latency."""
+    from ..services.satu_sehat_service import satu_sehat_client
+    return satu_sehat_client.tokens.stats()
+
+@router.get("/nik-cache")
+def get_nik_cache_metrics():
+    """Memory / DB hits, misses and negative answers of the SatuSehat NIK lookup cache."""
+    return nik_cache.stats()
+
+@router.get("/satusehat-bundles")
+def get_satusehat_bundle_metrics():
+    """Transaction Bundles sent, rejected (split and resent) and single-request fallbacks of the SatuSehat push."""
+    from ..services.satu_sehat_service import satu_sehat_client
+    return satu_sehat_client.bundles.stats()
+
+@router.get("/diagnostic-reports")
+def get_diagnostic_report_metrics():
+    """Full fetches, _lastUpdated refreshes and cached patients of the SatuSehat DiagnosticReport cache."""
+    from ..services.satu_sehat_service import satu_sehat_client
+    return satu_sehat_client.diagnostic_reports.stats()
+
+@router.get("/kfa-catalog")
+def get_kfa_catalog_metrics():
+    """Size, build time and search latency of the KFA catalog index, and the last mirror refresh."""
+    from ..services.kfa_catalog import kfa_catalog
+    return kfa_catalog.stats()
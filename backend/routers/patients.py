@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response, UploadFile, File
+from typing import List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from .. import models, schemas, database, dependencies
-from ..services.frappe_service import frappe_client
-from ..services.satu_sehat_service import satu_sehat_client
+from ..services.erpnext_push import push_changes, TARGET_PATIENT
+from ..services.outbox import enqueue
+from ..services.patient_search import index_patient, search_patients as run_patient_search, DEFAULT_LIMIT
+from ..services.patient_listing import list_patients, patient_counter, DEFAULT_LIST_LIMIT
+from ..services.patient_import import import_patients as run_patient_import, detect_format, DEFAULT_BATCH_SIZE
+from ..services.outbox_handlers import TOPIC_FRAPPE_CREATE_PATIENT, TOPIC_FRAPPE_UPDATE_PATIENT, TOPIC_SATUSEHAT_LINK_PATIENT
 
 router = APIRouter(
     prefix="/patients",
@@ -39,7 +43,7 @@ def sync_patients(db: Session = Depends(database.get_db)):
                     gender=p.get("sex", "Male"),
                     birthday=p.get("dob") or "2000-01-01",
                     address=p.get("primary_address", ""),
-                    frappeId=p.get("name"),
+                    frappe_id=p.get("name"),
                     
                     # Defaults
                     religion="Islam",
@@ -56,101 +60,22 @@ def sync_patients(db: Session = Depends(database.get_db)):
                     maritalStatusId=1
                 )
                 db.add(new_p)
+                db.flush()
+                index_patient(db, new_p)
                 count += 1
         db.commit()
+        patient_counter.add(count)
     
     return {"status": "success", "message": f"Synced {count} new contacts from ERPNext"}
 
 @router.post("/sync/push")
-def sync_patients_push(db: Session = Depends(database.get_db)):
-    """Push data from App to ERPNext"""
-    from ..services.frappe_service import frappe_client
-    
-    local_patients = db.query(models.Patient).all()
-    synced_count = 0
-    
-    for pat in local_patients:
-        try:
-            # Prepare data
-            data = {
-                "first_name": pat.firstName,
-                "last_name": pat.lastName,
-                "sex": pat.gender,
-                "mobile": pat.phone,
-                "dob": str(pat.birthday) if pat.birthday else None,
-            }
-            
-            # Check if linked (has frappe_id)
-            if pat.frappeId:
-                 # Update
-                 frappe_client.update_patient(pat.frappeId, data)
-                 synced_count += 1
-            else:
-                 # Create (or Check existence by phone via create_patient logic in service)
-                 # The service `create_patient` handles check-if-exists logic.
-                 resp = frappe_client.create_patient(data)
-                 if resp and "data" in resp:
-                     # Update local ID
-                     new_id = resp["data"].get("name")
-                     pat.frappeId = new_id
-                     synced_count += 1
-                     
-        except Exception as e:
-            print(f"Error pushing patient {pat.firstName}: {e}")
-            
-    db.commit()
-    return {"status": "success", "count": synced_count}
-
-def sync_new_patient(patient_id: int):
-    from ..database import SessionLocal
-    db = SessionLocal()
-    try:
-        patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
-        if not patient: return
-
-        # 1. Sync to Frappe
-        try:
-            # Re-construct dict from model since we don't have the pydantic object here easily without simple mapping
-            # effectively same as patient.dict() but from ORM
-            patient_data = {
-                "first_name": patient.firstName,
-                "last_name": patient.lastName,
-                "sex": patient.gender,
-                "mobile": patient.phone,
-                "dob": str(patient.birthday) if patient.birthday else None,
-                "primary_address": patient.address  # Add other fields as needed for Frappe
-            }
-            
-            frappe_response = frappe_client.create_patient(patient_data)
-            if frappe_response and "data" in frappe_response:
-                 patient.frappeId = frappe_response["data"].get("name")
-        except Exception as e:
-            print(f"Background Frappe Sync Error: {e}")
-
-        # 2. Sync to Satu Sehat
-        try:
-            # Prepare data
-             patient_data_ss = {
-                "firstName": patient.firstName,
-                "lastName": patient.lastName,
-                "identityCard": patient.identityCard,
-                "phone": patient.phone,
-                "gender": patient.gender,
-                "birthday": patient.birthday,
-                "address": patient.address,
-                # Add other fields required for SS if any
-             }
-             ihs_number = satu_sehat_client.post_patient(patient_data_ss)
-             patient.ihs_number = ihs_number
-        except Exception as e:
-            print(f"Background Satu Sehat Sync Error: {e}")
-            
-        db.commit()
-    finally:
-        db.close()
+def sync_patients_push(full: bool = False, db: Session = Depends(database.get_db)):
+    """Push patients changed since the last push to ERPNext (full=true: all of them)"""
+    report = push_changes(db, TARGET_PATIENT, full=full)
+    return {"status": "success", "count": report["pushed"], **report}
 
 @router.post("", response_model=schemas.Patient)
-def create_patient(patient: schemas.PatientCreate, background_tasks: BackgroundTasks, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+def create_patient(patient: schemas.PatientCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     # Check if existing by ID Card
     if db.query(models.Patient).filter(models.Patient.identityCard == patient.identityCard).first():
         raise HTTPException(status_code=400, detail="Patient with this ID Card already exists")
@@ -164,11 +89,17 @@ def create_patient(patient: schemas.PatientCreate, background_tasks: BackgroundT
     
     try:
         db.add(new_patient)
+        db.flush()
+        index_patient(db, new_patient)
+
+        # ERPNext / SatuSehat sync is delivered by the outbox worker after commit
+        enqueue(db, TOPIC_FRAPPE_CREATE_PATIENT, {"patient_id": new_patient.id},
+                idempotency_key=f"{TOPIC_FRAPPE_CREATE_PATIENT}:{new_patient.id}")
+        enqueue(db, TOPIC_SATUSEHAT_LINK_PATIENT, {"patient_id": new_patient.id},
+                idempotency_key=f"{TOPIC_SATUSEHAT_LINK_PATIENT}:{new_patient.id}")
         db.commit()
         db.refresh(new_patient)
-        
-        # Offload sync to background
-        background_tasks.add_task(sync_new_patient, new_patient.id)
+        patient_counter.add()
         
     except IntegrityError:
         db.rollback()
@@ -180,15 +111,20 @@ def create_patient(patient: schemas.PatientCreate, background_tasks: BackgroundT
 
     return new_patient
 
-def sync_update_patient_background(frappe_id: str, data: dict):
-    from ..services.frappe_service import frappe_client
-    try:
-        frappe_client.update_patient(frappe_id, data)
-    except Exception as e:
-        print(f"Failed to sync update to ERPNext: {e}")
+@router.post("/import")
+def import_patients(file: UploadFile = File(...), batch_size: int = DEFAULT_BATCH_SIZE, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """
+    Bulk registration from a CSV (header row = patient field names) or NDJSON
+    file (.ndjson / .jsonl). Valid rows are inserted in batches of
+    `batch_size`; duplicates of existing or earlier rows are reported, not
+    inserted. Returns counts and per-row errors (capped).
+    """
+    report = run_patient_import(db, file.file, detect_format(file.filename, file.content_type), batch_size)
+    patient_counter.add(report["imported"])
+    return report
 
 @router.put("/{patient_id}", response_model=schemas.Patient)
-def update_patient(patient_id: int, patient_update: schemas.PatientCreate, background_tasks: BackgroundTasks, db: Session = Depends(database.get_db)):
+def update_patient(patient_id: int, patient_update: schemas.PatientCreate, db: Session = Depends(database.get_db)):
     # Note: Using PatientCreate schema allows updating all fields
     db_patient = db.query(models.Patient).filter(models.Patient.id == patient_id).first()
     if not db_patient:
@@ -198,37 +134,51 @@ def update_patient(patient_id: int, patient_update: schemas.PatientCreate, backg
     update_data = patient_update.dict(exclude_unset=True)
     for key, value in update_data.items():
         setattr(db_patient, key, value)
+    db.flush()
+    index_patient(db, db_patient)
     
+    # Sync to ERPNext (outbox, same commit). The worker sends the row as it is
+    # then, so a not-yet-created ERPNext patient is covered by the pending create.
+    enqueue(db, TOPIC_FRAPPE_UPDATE_PATIENT, {"patient_id": db_patient.id})
     db.commit()
     db.refresh(db_patient)
-    
-    # Sync to ERPNext (Background)
-    if db_patient.frappe_id:
-        erp_data = {
-            "first_name": patient_update.firstName,
-            "last_name": patient_update.lastName,
-            "sex": patient_update.gender,
-            "mobile": patient_update.phone,
-            "dob": str(patient_update.birthday) if patient_update.birthday else None,
-        }
-        background_tasks.add_task(sync_update_patient_background, db_patient.frappe_id, erp_data)
             
     return db_patient
 
 @router.get("", response_model=List[schemas.Patient])
-def get_patients(skip: int = 0, limit: int = 100, search: str = None, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    return db.query(models.Patient).order_by(models.Patient.firstName.asc()).offset(skip).limit(limit).all()
+def get_patients(response: Response, limit: int = DEFAULT_LIST_LIMIT, cursor: Optional[str] = None, search: Optional[str] = None, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """
+    All patients by first name, or the ranked matches for `search` (same
+    ranking as /patients/search). Pass the X-Next-Cursor response header back
+    as `cursor` for the next page. X-Total-Count estimates the unfiltered
+    total (refreshed about once a minute).
+    """
+    try:
+        if search and search.strip():
+            patients, next_cursor = run_patient_search(db, search, limit, cursor)
+        else:
+            patients, next_cursor = list_patients(db, limit, cursor)
+            response.headers["X-Total-Count"] = str(patient_counter.get(db))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return patients
 
 @router.get("/search", response_model=List[schemas.Patient])
-def search_patients(query: str, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    # Simple search by name or ID
-    return db.query(models.Patient).filter(
-        (models.Patient.firstName.contains(query)) | 
-        (models.Patient.lastName.contains(query)) | 
-        (models.Patient.identityCard.contains(query)) |
-        (models.Patient.phone.contains(query)) |
-        (models.Patient.nomorRekamMedis.contains(query))
-    ).all()
+def search_patients(response: Response, query: str, limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """
+    Ranked search by NIK / phone / MRN (exact or prefix) or name words (prefix).
+    At most `limit` results (capped); pass the X-Next-Cursor response header
+    back as `cursor` for the next page.
+    """
+    try:
+        patients, next_cursor = run_patient_search(db, query, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return patients
 
 @router.get("/{patient_id}", response_model=schemas.Patient)
 def get_patient(patient_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
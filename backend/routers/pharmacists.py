@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from typing import List
 from sqlalchemy.orm import Session
 from .. import models, schemas, database
+from ..services.erpnext_push import push_changes, TARGET_PHARMACIST
 
 router = APIRouter(
     prefix="/pharmacists",
@@ -110,42 +111,7 @@ def sync_pharmacists_pull(db: Session = Depends(database.get_db)):
     return {"status": "success", "count": synced_count, "message": f"Synced {synced_count} pharmacists from ERPNext"}
 
 @router.post("/sync/push")
-def sync_pharmacists_push(db: Session = Depends(database.get_db)):
-    """Push data from App to ERPNext"""
-    from ..services.frappe_service import frappe_client
-    
-    local_pharmacists = db.query(models.Pharmacist).all()
-    synced_count = 0
-    
-    for p in local_pharmacists:
-        try:
-            # Name parts
-            parts = p.name.replace("Apt.", "").replace("S.Farm", "").strip().split(" ")
-            first_name = parts[0]
-            last_name = " ".join(parts[1:]) if len(parts) > 1 else ""
-            
-            # Check if exists in ERPNext
-            filters = {"practitioner_name": p.name}
-            erp_docs = frappe_client.get_list("Healthcare Practitioner", filters=filters)
-            
-            if erp_docs:
-                # Update
-                frappe_id = erp_docs[0].get("name")
-                # p.erp_employee_id = frappe_id # Save back ID
-                
-                update_data = {
-                    "first_name": first_name,
-                    "last_name": last_name,
-                    "department": "Pharmacy" # Force Department
-                }
-                frappe_client.update_practitioner(frappe_id, update_data)
-            else:
-                # Create
-                frappe_client.create_practitioner(first_name, last_name, "Pharmacy")
-            
-            synced_count += 1
-        except Exception as e:
-            print(f"Error pushing pharmacist {p.name}: {e}")
-
-    db.commit() # Save any IDs if we assigned them
-    return {"status": "success", "count": synced_count}
+def sync_pharmacists_push(full: bool = False, db: Session = Depends(database.get_db)):
+    """Push pharmacists changed since the last push to ERPNext (full=true: all of them)"""
+    report = push_changes(db, TARGET_PHARMACIST, full=full)
+    return {"status": "success", "count": report["pushed"], **report}
@@ -1,121 +1,238 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from typing import List
-from sqlalchemy.orm import Session
-from datetime import datetime, timedelta
-from .. import models, schemas, database, dependencies
-from ..services.frappe_service import frappe_client
+from fastapi import APIRouter, Depends, HTTPException, Request, Header
+from fastapi.responses import StreamingResponse, Response
+from typing import List, Optional
+import asyncio
+import json
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from .. import models, schemas, database, dependencies, clinic_time
+from ..database import SessionLocal
+from ..services.queue_numbering import allocate_queue_number
+from ..services.queue_events import queue_event_broker, record_queue_event, status_event_type, format_sse, EVENT_CREATED, EVENT_ESTIMATES
+from ..services.queue_cache import queue_snapshot_cache, etag_matches
+from ..services.queue_dispatch import claim_next_ticket, ClaimContended
+from ..services.wait_time import wait_time_estimator
+from ..services.outbox import enqueue
+from ..services.outbox_handlers import TOPIC_FRAPPE_CREATE_APPOINTMENT
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter(
     prefix="/patients/queue",
     tags=["queues"]
 )
 
+DUPLICATE_TICKET_DETAIL = "Patient already has an active queue for today"
+
 @router.post("", response_model=schemas.PatientQueue)
-def add_to_queue(queue_data: schemas.QueueCreate, background_tasks: BackgroundTasks, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
-    # Timezone Handling (Asia/Jakarta)
-    # We want 'today' to be relative to the clinic's local time (GMT+7)
-    # 00:00 WIB = 17:00 UTC (Yesterday)
-    
-    # Simple fixed offset for now (Asia/Jakarta is UTC+7)
-    utc_now = datetime.utcnow()
-    local_now = utc_now + timedelta(hours=7)
-    today_local = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
-    today_start_utc = today_local - timedelta(hours=7)
-
-    # Lazy Cleanup: Auto-complete old active queues (yesterday or older)
-    old_queues = db.query(models.PatientQueue).filter(
-        models.PatientQueue.userId == queue_data.userId,
-        models.PatientQueue.status.in_(["Waiting", "In Consultation"]),
-        models.PatientQueue.appointmentTime < today_start_utc
-    ).all()
-
-    for old_q in old_queues:
-        old_q.status = "Completed" # Mark as completed/expired so they don't block
-        
-    if old_queues:
-        db.commit()
-
-    # Check for existing active queue for this patient (TODAY ONLY)
-    # Check for existing active queue for this patient (TODAY ONLY)
-    existing_queue = db.query(models.PatientQueue).filter(
+def add_to_queue(queue_data: schemas.QueueCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    # One transaction: duplicate check, number, ticket, stream event and the
+    # ERPNext appointment (outbox) commit together.
+    # Stale tickets from earlier days are left to scheduler.cleanup_queues - they
+    # carry an older activeDay, so they never block today's registration.
+    today = clinic_time.local_today()
+
+    # Check for existing active queue for this patient (TODAY ONLY), via the unique key
+    existing_queue = db.query(models.PatientQueue.id).filter(
         models.PatientQueue.userId == queue_data.userId,
-        models.PatientQueue.status.in_(["Waiting", "In Consultation"]),
-        models.PatientQueue.appointmentTime >= today_start_utc
+        models.PatientQueue.activeDay == today
     ).first()
 
     if existing_queue:
-        raise HTTPException(status_code=400, detail="Patient already has an active queue for today")
-
-    # Determine Prefix (e.g. D = Doctor, P = Polyclinic, DP = Doctor Priority)
-    base_code = "P" if queue_data.queueType == "Polyclinic" else "D"
-    prio_code = "P" if queue_data.isPriority else ""
-    prefix = f"{base_code}{prio_code}"
-
-    # Get last number for this specific type and priority
-    last_queue = db.query(models.PatientQueue).filter(
-        models.PatientQueue.appointmentTime >= today_start_utc,
-        models.PatientQueue.queueType == queue_data.queueType,
-        models.PatientQueue.isPriority == queue_data.isPriority
-    ).order_by(models.PatientQueue.id.desc()).first()
-    
-    if last_queue:
-        # Assuming numberQueue is like "P001", "PP002", "A003", "AP004"
-        # Extract the numeric part after the prefix
-        try:
-            # We know the prefix matches because we filtered by the exact same type/priority
-            last_num_str = last_queue.numberQueue[len(prefix):]
-            last_num = int(last_num_str)
-            new_num = last_num + 1
-        except (ValueError, IndexError):
-            # Fallback if parsing fails
-            new_num = 1
-    else:
-        new_num = 1
-        
-    queue_number = f"{prefix}{new_num:03d}"
+        raise HTTPException(status_code=400, detail=DUPLICATE_TICKET_DETAIL)
+
+    # Reserve the next number from the per-day counter (row-locked until commit)
+    queue_number = allocate_queue_number(db, queue_data.queueType, queue_data.isPriority, today)
 
     new_queue = models.PatientQueue(
         numberQueue=queue_number, 
         userId=queue_data.userId,
         appointmentTime=datetime.utcnow(),
         status="Waiting",
+        activeDay=today,
         isPriority=queue_data.isPriority,
         medicalFacilityPolyDoctorId=queue_data.medicalFacilityPolyDoctorId,
         queueType=queue_data.queueType,
         polyclinic=queue_data.polyclinic
     )
     db.add(new_queue)
-    db.commit()
-    db.refresh(new_queue)
+    try:
+        db.flush()
+    except IntegrityError:
+        # Another terminal registered the same patient between our check and insert
+        db.rollback()
+        raise HTTPException(status_code=400, detail=DUPLICATE_TICKET_DETAIL)
 
-    # Fetch Patient Name for Frappe
-    patient = db.query(models.Patient).filter(models.Patient.id == queue_data.userId).first()
+    payload = record_queue_event(db, EVENT_CREATED, new_queue)
+    patient = new_queue.patient # Loaded by the serialization above
     if patient:
-        bg_data = {
-           "appointmentTime": new_queue.appointmentTime
-        }
-        background_tasks.add_task(frappe_client.create_appointment, bg_data, f"{patient.firstName} {patient.lastName}")
+        enqueue(db, TOPIC_FRAPPE_CREATE_APPOINTMENT, {
+            "queueId": new_queue.id,
+            "appointmentTime": new_queue.appointmentTime,
+            "patientName": f"{patient.firstName} {patient.lastName}"
+        }, idempotency_key=f"{TOPIC_FRAPPE_CREATE_APPOINTMENT}:{new_queue.id}")
+    db.commit()
+    queue_snapshot_cache.bump()
 
-    return new_queue
+    # Same JSON the stream clients get; avoids reloading the ticket after commit
+    return Response(content=payload, media_type="application/json")
 
-@router.get("", response_model=List[schemas.PatientQueue])
-def get_queue(db: Session = Depends(database.get_db)):
-    utc_now = datetime.utcnow()
-    local_now = utc_now + timedelta(hours=7)
-    today_local = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
-    today_start_utc = today_local - timedelta(hours=7)
+def _query_today(db: Session):
+    today_start_utc = clinic_time.today_start_utc()
 
-    return db.query(models.PatientQueue).filter(
+    # Eager-load the nested patient/doctor the schema serializes (no per-row SELECT)
+    return db.query(models.PatientQueue).options(
+        joinedload(models.PatientQueue.patient),
+        joinedload(models.PatientQueue.doctor)
+    ).filter(
         models.PatientQueue.appointmentTime >= today_start_utc
     ).order_by(models.PatientQueue.isPriority.desc(), models.PatientQueue.appointmentTime.asc()).all()
 
+def _annotated_today(db: Session):
+    # Wait estimates come from in-memory stats; no extra queries
+    return wait_time_estimator.annotate(_query_today(db))
+
+def _current_estimates() -> dict:
+    db = SessionLocal()
+    try:
+        return queue_snapshot_cache.estimates(lambda: _annotated_today(db))
+    finally:
+        db.close()
+
+def _with_estimate(payload: str, estimates: dict) -> str:
+    ticket = json.loads(payload)
+    ticket["estimatedWaitMinutes"] = estimates.get(ticket["id"])
+    return json.dumps(ticket)
+
+@router.get("", response_model=List[schemas.PatientQueue])
+def get_queue(if_none_match: Optional[str] = Header(None), db: Session = Depends(database.get_db)):
+    # Served from the versioned snapshot cache; the DB is only hit after a change
+    # or once per refresh interval (wait estimates move with the clock)
+    etag, body = queue_snapshot_cache.get(lambda: _annotated_today(db))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+HEARTBEAT_SECONDS = 15
+
+@router.get("/stream")
+async def stream_queue(request: Request, last_event_id: Optional[str] = Header(None), lastEventId: Optional[int] = None):
+    """
+    Live queue as Server-Sent Events for the queue monitor / display board.
+
+    Sends one `snapshot` event (today's full queue), then only `created`,
+    `status_changed` and `completed` events carrying the changed ticket.
+    Reconnecting clients send Last-Event-ID (or ?lastEventId=) and get just the
+    events they missed. Tickets carry estimatedWaitMinutes; since one change
+    moves the whole line, an `estimates` event ({ticket id: minutes} of every
+    waiting ticket) follows each burst of changes and is repeated every
+    HEARTBEAT_SECONDS, which also keeps the connection alive.
+    """
+    resume_from = lastEventId
+    if last_event_id and last_event_id.isdigit():
+        resume_from = int(last_event_id)
+
+    async def event_stream():
+        # Subscribe first so nothing committed during the snapshot/replay is lost
+        sub = await queue_event_broker.subscribe()
+        try:
+            sent_id = None
+            if resume_from is not None:
+                missed = await run_in_threadpool(queue_event_broker.events_since, resume_from)
+                if missed is not None:
+                    sent_id = resume_from
+                    estimates = await run_in_threadpool(_current_estimates)
+                    for ev in missed:
+                        sent_id = ev.id
+                        yield format_sse(_with_estimate(ev.payload, estimates), ev.eventType, ev.id)
+                    yield format_sse(json.dumps(estimates), EVENT_ESTIMATES)
+
+            while True:
+                if sent_id is None or sub.overflowed:
+                    sub.overflowed = False
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                    sent_id, payload = await run_in_threadpool(queue_event_broker.snapshot, _annotated_today)
+                    yield format_sse(payload, "snapshot", sent_id)
+
+                if await request.is_disconnected():
+                    break
+                try:
+                    ev = await asyncio.wait_for(sub.queue.get(), timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    estimates = await run_in_threadpool(_current_estimates)
+                    yield format_sse(json.dumps(estimates), EVENT_ESTIMATES)
+                    continue
+
+                if ev.id <= sent_id:
+                    continue # Already covered by the snapshot/replay
+                sent_id = ev.id
+                # Shared per-worker snapshot: one rebuild per change, not one per display
+                estimates = await run_in_threadpool(_current_estimates)
+                yield format_sse(_with_estimate(ev.payload, estimates), ev.eventType, ev.id)
+                if sub.queue.empty():
+                    yield format_sse(json.dumps(estimates), EVENT_ESTIMATES)
+        finally:
+            queue_event_broker.unsubscribe(sub)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/next", response_model=schemas.PatientQueue)
+def call_next_patient(scope: schemas.QueueCallNext, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
+    """
+    Claim the next waiting patient for a consultation room (by doctor, by
+    polyclinic, or by doctor within a polyclinic when both are given) and mark
+    the ticket 'In Consultation' in one round trip. Answers 409 with
+    Retry-After when other rooms kept winning the race for the head of the
+    queue; calling again shortly will get a patient.
+    """
+    if scope.medicalFacilityPolyDoctorId is None and not scope.polyclinic:
+        raise HTTPException(status_code=400, detail="medicalFacilityPolyDoctorId or polyclinic is required")
+
+    try:
+        queue_item = claim_next_ticket(db, scope.medicalFacilityPolyDoctorId, scope.polyclinic)
+    except ClaimContended:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Queue is busy, retry", headers={"Retry-After": "1"})
+    if not queue_item:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="No waiting patients in this queue")
+
+    payload = record_queue_event(db, status_event_type(queue_item.status), queue_item)
+    db.commit()
+    queue_snapshot_cache.bump()
+    return Response(content=payload, media_type="application/json")
+
 @router.put("/{queue_id}/status", response_model=schemas.PatientQueue)
 def update_queue_status(queue_id: int, status_update: schemas.QueueUpdateStatus, db: Session = Depends(database.get_db), current_user: models.User = Depends(dependencies.get_current_user)):
     queue_item = db.query(models.PatientQueue).filter(models.PatientQueue.id == queue_id).first()
     if not queue_item:
         raise HTTPException(status_code=404, detail="Queue item not found")
     
+    previous_status = queue_item.status
     queue_item.status = status_update.status
+    if queue_item.status != previous_status:
+        if queue_item.status == "In Consultation":
+            queue_item.calledAt = datetime.utcnow()
+        elif queue_item.status == "Completed":
+            queue_item.completedAt = datetime.utcnow()
+    if queue_item.status in models.ACTIVE_QUEUE_STATUSES:
+        queue_item.activeDay = clinic_time.local_date_of(queue_item.appointmentTime)
+    else:
+        queue_item.activeDay = None
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=DUPLICATE_TICKET_DETAIL)
+
+    record_queue_event(db, status_event_type(queue_item.status), queue_item)
     db.commit()
+    queue_snapshot_cache.bump()
     db.refresh(queue_item)
     return queue_item
@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
 from typing import List
-from ..services.frappe_service import frappe_client
 from .. import models, schemas, database, auth_utils
+from ..services.outbox import enqueue
+from ..services.outbox_handlers import TOPIC_FRAPPE_CREATE_USER, TOPIC_FRAPPE_UPDATE_USER, TOPIC_FRAPPE_DELETE_USER
 
 router = APIRouter(
     prefix="/users",
@@ -56,7 +57,6 @@ def read_users(
 @router.post("/", response_model=schemas.User)
 def create_user(
     user: schemas.UserCreate, 
-    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
@@ -83,25 +83,27 @@ def create_user(
         role=user.role
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    db.flush()
 
-    # Sync to ERPNext (Background)
+    # Sync to ERPNext (outbox, delivered after commit)
     if user.email:
         # Split name
         parts = user.full_name.split(" ", 1)
         first_name = parts[0]
         last_name = parts[1] if len(parts) > 1 else ""
         
-        background_tasks.add_task(frappe_client.create_user, user.email, first_name, last_name, user.role)
-        
+        enqueue(db, TOPIC_FRAPPE_CREATE_USER, {
+            "email": user.email, "first_name": first_name, "last_name": last_name, "role": user.role
+        }, idempotency_key=f"{TOPIC_FRAPPE_CREATE_USER}:{new_user.id}")
+
+    db.commit()
+    db.refresh(new_user)
     return new_user
 
 @router.put("/{user_id}", response_model=schemas.User)
 def update_user(
     user_id: int,
     user_update: schemas.UserUpdate, # Changed from UserCreate
-    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
@@ -141,11 +143,8 @@ def update_user(
     # If password provided
     if user_update.password:
         target_user.password_hash = auth_utils.get_password_hash(user_update.password)
-        
-    db.commit()
-    db.refresh(target_user)
 
-    # Sync to ERPNext (Background Update)
+    # Sync to ERPNext (outbox, same commit)
     if target_user.email:
         data = {}
         if user_update.full_name:
@@ -154,14 +153,15 @@ def update_user(
              if len(parts) > 1: data["last_name"] = parts[1]
              
         if data:
-             background_tasks.add_task(frappe_client.update_erp_user, target_user.email, data)
-             
+             enqueue(db, TOPIC_FRAPPE_UPDATE_USER, {"email": target_user.email, "data": data})
+        
+    db.commit()
+    db.refresh(target_user)
     return target_user
 
 @router.delete("/{user_id}")
 def delete_user(
     user_id: int,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(database.get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
@@ -175,10 +175,10 @@ def delete_user(
     
     email_to_delete = target_user.email     
     db.delete(target_user)
-    db.commit()
-    
-    # Sync delete (Background)
+
+    # Sync delete (outbox, same commit)
     if email_to_delete:
-         background_tasks.add_task(frappe_client.delete_erp_user, email_to_delete)
+         enqueue(db, TOPIC_FRAPPE_DELETE_USER, {"email": email_to_delete})
+    db.commit()
          
     return {"message": "User deleted successfully"}
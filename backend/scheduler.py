@@ -1,57 +1,208 @@
 from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import select, update, insert, delete, text
 from sqlalchemy.orm import Session
 from .database import SessionLocal
-from .models import PatientQueue
-from datetime import datetime
+from .models import PatientQueue, PatientQueueArchive, ACTIVE_QUEUE_STATUSES
+from .services.queue_cache import queue_snapshot_cache
+from . import clinic_time
+from datetime import datetime, timedelta
 import logging
+import os
+import time
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Local days kept in patientqueue (including today); older tickets are archived
+QUEUE_RETENTION_DAYS = max(1, int(os.getenv("QUEUE_RETENTION_DAYS", "1")))
+CLEANUP_CHUNK_SIZE = int(os.getenv("QUEUE_CLEANUP_CHUNK_SIZE", "1000"))
+
+ARCHIVE_COLUMNS = [
+    "id", "numberQueue", "userId", "appointmentTime", "status", "isPriority",
+    "isChecked", "medicalFacilityPolyDoctorId", "queueType", "polyclinic",
+    "calledAt", "completedAt"
+]
+
+# Result of the last run, served by GET /metrics/queue-cleanup
+last_cleanup_report = {}
+
+def _row_lock_time_ms(db: Session):
+    """InnoDB's cumulative row lock wait (server-wide); None on other databases."""
+    if db.get_bind().dialect.name != "mysql":
+        return None
+    row = db.execute(text("SHOW GLOBAL STATUS LIKE 'Innodb_row_lock_time'")).first()
+    return int(row[1]) if row else None
+
+def _run_chunked(db: Session, select_ids, apply_chunk, timings: list) -> int:
+    """
+    Repeatedly pick up to CLEANUP_CHUNK_SIZE ids and apply a set-based
+    statement to them, committing per chunk so locks are held briefly.
+    """
+    touched = 0
+    while True:
+        start = time.perf_counter()
+        ids = [row[0] for row in db.execute(select_ids.limit(CLEANUP_CHUNK_SIZE))]
+        if not ids:
+            break
+        apply_chunk(ids)
+        db.commit()
+        touched += len(ids)
+        timings.append(round((time.perf_counter() - start) * 1000, 2))
+        if len(ids) < CLEANUP_CHUNK_SIZE:
+            break
+    return touched
+
 def cleanup_queues():
     """
     Background job to clean up old queues.
-    Runs daily to mark queues from previous days as 'Completed'.
+    Runs daily: marks queues from previous (local) days as 'Completed' with
+    chunked bulk UPDATEs, then moves tickets older than QUEUE_RETENTION_DAYS
+    into patientqueue_archive so the live table holds about one day of rows.
     """
+    global last_cleanup_report
     logger.info("Running Daily Queue Cleanup...")
     db: Session = SessionLocal()
+    queue_table = PatientQueue.__table__
+    archive_table = PatientQueueArchive.__table__
+    report = {"started_at": datetime.utcnow().isoformat(), "completed": 0, "archived": 0,
+              "complete_chunk_ms": [], "archive_chunk_ms": [], "lock_wait_ms": None}
     try:
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        # Find active queues that are older than today
-        old_queues = db.query(PatientQueue).filter(
-            PatientQueue.status.in_(["Waiting", "In Consultation"]),
-            PatientQueue.appointmentTime < today_start
-        ).all()
-        
-        count = 0
-        for q in old_queues:
-            q.status = "Completed"
-            count += 1
-            
-        if count > 0:
-            db.commit()
-            logger.info(f"Cleaned up {count} old queue entries.")
-        else:
-            logger.info("No old queues found to clean up.")
-            
+        today_start = clinic_time.today_start_utc()
+        archive_before = today_start - timedelta(days=QUEUE_RETENTION_DAYS - 1)
+        lock_time_before = _row_lock_time_ms(db)
+        run_start = time.perf_counter()
+
+        # 1. Complete stale active tickets
+        stale = select(queue_table.c.id).where(
+            queue_table.c.status.in_(ACTIVE_QUEUE_STATUSES),
+            queue_table.c.appointmentTime < today_start
+        ).order_by(queue_table.c.id)
+        report["completed"] = _run_chunked(db, stale, lambda ids: db.execute(
+            update(queue_table).where(queue_table.c.id.in_(ids)).values(status="Completed", activeDay=None)
+        ), report["complete_chunk_ms"])
+
+        # 2. Move tickets past the retention window to the archive
+        expired = select(queue_table.c.id).where(
+            queue_table.c.appointmentTime < archive_before
+        ).order_by(queue_table.c.id)
+
+        def archive_chunk(ids):
+            cols = [queue_table.c[name] for name in ARCHIVE_COLUMNS]
+            db.execute(insert(archive_table).from_select(
+                ARCHIVE_COLUMNS, select(*cols).where(queue_table.c.id.in_(ids))
+            ))
+            db.execute(delete(queue_table).where(queue_table.c.id.in_(ids)))
+
+        report["archived"] = _run_chunked(db, expired, archive_chunk, report["archive_chunk_ms"])
+
+        lock_time_after = _row_lock_time_ms(db)
+        if lock_time_before is not None and lock_time_after is not None:
+            report["lock_wait_ms"] = lock_time_after - lock_time_before
+        report["duration_ms"] = round((time.perf_counter() - run_start) * 1000, 2)
+
+        if report["completed"] or report["archived"]:
+            queue_snapshot_cache.bump()
+        logger.info(
+            f"Queue cleanup: completed {report['completed']}, archived {report['archived']} "
+            f"in {len(report['complete_chunk_ms']) + len(report['archive_chunk_ms'])} chunks, "
+            f"{report['duration_ms']} ms, lock wait {report['lock_wait_ms']} ms"
+        )
+
     except Exception as e:
         logger.error(f"Error during queue cleanup: {e}")
+        report["error"] = str(e)
         db.rollback()
     finally:
         db.close()
+        last_cleanup_report = report
+    return report
+
+def prune_queue_events():
+    """
+    Drop live-stream events older than the retention window.
+    Clients reconnecting after that get a fresh snapshot instead.
+    """
+    from .services.queue_events import prune_queue_events as prune
+    db: Session = SessionLocal()
+    try:
+        deleted = prune(db)
+        logger.info(f"Pruned {deleted} old queue events.")
+    except Exception as e:
+        logger.error(f"Error pruning queue events: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+def prune_outbox():
+    """Drop delivered outbox messages past their retention; dead ones are kept."""
+    from .services.outbox import prune_outbox as prune
+    db: Session = SessionLocal()
+    try:
+        deleted = prune(db)
+        logger.info(f"Pruned {deleted} delivered outbox messages.")
+    except Exception as e:
+        logger.error(f"Error pruning outbox: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+def push_erpnext_changes():
+    """Nightly incremental push of everything changed since the last push (services/erpnext_push.py)."""
+    from .services.erpnext_push import push_changes, PUSH_TARGETS
+    from .services.frappe_service import frappe_client
+    if not frappe_client.base_url:
+        logger.info("FRAPPE_URL not set; skipping ERPNext push.")
+        return
+    for target in PUSH_TARGETS:
+        db: Session = SessionLocal()
+        try:
+            push_changes(db, target)
+        except Exception as e:
+            logger.error(f"Error pushing {target}: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+def refresh_kfa_catalog(full: bool = False):
+    """Mirror KFA farmasi products changed since the last run (all of them with full=True)."""
+    from .services.kfa_catalog import kfa_catalog
+    from .services.satu_sehat_service import satu_sehat_client
+    if not satu_sehat_client.client_id:
+        logger.info("SATUSEHAT_CLIENT_ID not set; skipping KFA catalog refresh.")
+        return
+    try:
+        kfa_catalog.refresh(full)
+    except Exception as e:
+        logger.error(f"Error refreshing KFA catalog: {e}")
+
+def load_kfa_catalog():
+    """At startup: build the KFA search index from the mirror, filling the mirror first if it is empty."""
+    from .services.kfa_catalog import kfa_catalog
+    try:
+        if not kfa_catalog.load():
+            refresh_kfa_catalog(full=True)
+    except Exception as e:
+        logger.error(f"Error loading KFA catalog: {e}")
 
 # Initialize Scheduler
 scheduler = BackgroundScheduler()
 
 # Add Job: Run every day at 00:00 (Midnight)
 scheduler.add_job(cleanup_queues, 'cron', hour=0, minute=0)
+scheduler.add_job(prune_queue_events, 'cron', hour=0, minute=30)
+scheduler.add_job(prune_outbox, 'cron', hour=0, minute=45)
+scheduler.add_job(push_erpnext_changes, 'cron', hour=1, minute=0)
+scheduler.add_job(refresh_kfa_catalog, 'cron', hour=2, minute=0)
+# Weekly full pass, which also drops products KFA no longer lists
+scheduler.add_job(refresh_kfa_catalog, 'cron', day_of_week='sun', hour=3, minute=0, kwargs={"full": True})
 
 def start_scheduler():
     logger.info("Starting Background Scheduler...")
     try:
         scheduler.start()
+        # One-off, right away, off the startup path
+        scheduler.add_job(load_kfa_catalog)
     except Exception as e:
         logger.error(f"Failed to start scheduler: {e}")
 
@@ -135,12 +135,21 @@ class QueueCreate(QueueBase):
 class QueueUpdateStatus(BaseModel):
     status: str
 
+class QueueCallNext(BaseModel):
+    # Scope of the consultation room; at least one is required, both narrow it to that doctor in that polyclinic
+    medicalFacilityPolyDoctorId: Optional[int] = None
+    polyclinic: Optional[str] = None
+
 class PatientQueue(QueueBase):
     id: int
     numberQueue: str
     appointmentTime: datetime
     status: str
     isChecked: bool
+    calledAt: Optional[datetime] = None
+    completedAt: Optional[datetime] = None
+    # Filled in for today's waiting tickets by GET /patients/queue
+    estimatedWaitMinutes: Optional[int] = None
     
     patient: Patient
     doctor: Optional[Doctor] = None
@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Patients whose reports are kept in memory, least recently used dropped first
+CACHE_SIZE = int(os.getenv("DIAGNOSTIC_REPORT_CACHE_SIZE", "1000"))
+# A list checked this recently is served without asking SatuSehat for changes
+FRESH_SECONDS = int(os.getenv("DIAGNOSTIC_REPORT_FRESH_SECONDS", "30"))
+# Full refetch after this long: a _lastUpdated search does not show deleted reports
+MAX_AGE_SECONDS = int(os.getenv("DIAGNOSTIC_REPORT_MAX_AGE_SECONDS", str(24 * 3600)))
+
+def _last_updated(resource: dict):
+    """meta.lastUpdated as (datetime, raw string), or None."""
+    raw = (resource.get("meta") or {}).get("lastUpdated")
+    if not raw:
+        return None
+    try:
+        # fromisoformat() only takes a "Z" suffix from Python 3.11 on
+        parsed = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed, raw
+
+class _Entry:
+    """One patient's cached reports; replaced, never changed, so readers need no lock."""
+
+    def __init__(self, reports: dict, watermark, fetched_at: float, checked_at: float):
+        self.reports = reports
+        self.watermark = watermark
+        self.fetched_at = fetched_at
+        self.checked_at = checked_at
+        self.ordered = sorted(reports.values(), key=lambda r: r.get("effectiveDateTime") or "", reverse=True)
+
+class DiagnosticReportCache:
+    """
+    Per-patient cache of parsed DiagnosticReports.
+
+    fetch(ihs_number, since) yields raw resources page by page (see
+    SatuSehatClient.iter_diagnostic_reports) and parse() turns one into the
+    API shape. The first request for a patient streams reports as the pages
+    arrive and caches them once the last page has been read. Later requests
+    only ask for reports updated since the newest meta.lastUpdated seen,
+    merge them in and serve the list from memory; if that refresh fails the
+    cached list is served as is.
+    """
+
+    def __init__(self, fetch, parse):
+        self._fetch = fetch
+        self._parse = parse
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+        self.full_fetches = 0
+        self.refreshes = 0
+        self.fresh_hits = 0
+        self.refreshed_reports = 0
+        self.refresh_errors = 0
+
+    def stream(self, ihs_number: str):
+        """Parsed reports of a patient, newest first."""
+        entry = self._get(ihs_number)
+        if entry is None:
+            yield from self._fetch_all(ihs_number)
+            return
+        if time.time() - entry.checked_at < FRESH_SECONDS:
+            with self._lock:
+                self.fresh_hits += 1
+        else:
+            entry = self._refresh(ihs_number, entry)
+        yield from entry.ordered
+
+    def _get(self, ihs_number: str):
+        with self._lock:
+            entry = self._entries.get(ihs_number)
+            if entry is None:
+                return None
+            if time.time() - entry.fetched_at >= MAX_AGE_SECONDS:
+                del self._entries[ihs_number]
+                return None
+            self._entries.move_to_end(ihs_number)
+            return entry
+
+    def _put(self, ihs_number: str, entry: _Entry):
+        with self._lock:
+            self._entries[ihs_number] = entry
+            self._entries.move_to_end(ihs_number)
+            while len(self._entries) > CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def _fetch_all(self, ihs_number: str):
+        with self._lock:
+            self.full_fetches += 1
+        started = time.time()
+        reports, watermark = {}, None
+        for resource in self._fetch(ihs_number, None):
+            report = self._parse(resource)
+            # Pages can shift while they are read; a report seen twice is sent once
+            if report["id"] in reports:
+                continue
+            reports[report["id"]] = report
+            watermark = max(filter(None, [watermark, _last_updated(resource)]), default=None)
+            yield report
+        # Only a list read to the end is cached
+        self._put(ihs_number, _Entry(reports, watermark, started, started))
+
+    def _refresh(self, ihs_number: str, entry: _Entry) -> _Entry:
+        started = time.time()
+        since = entry.watermark[1] if entry.watermark else None
+        try:
+            resources = list(self._fetch(ihs_number, since))
+        except Exception as e:
+            with self._lock:
+                self.refresh_errors += 1
+            logger.warning(f"Diagnostic report refresh for {ihs_number} failed, serving cached list: {e}")
+            return entry
+
+        reports, watermark = dict(entry.reports), entry.watermark
+        for resource in resources:
+            report = self._parse(resource)
+            reports[report["id"]] = report
+            watermark = max(filter(None, [watermark, _last_updated(resource)]), default=None)
+        # Without a watermark the "refresh" was a full fetch
+        fetched_at = entry.fetched_at if since else started
+        refreshed = _Entry(reports, watermark, fetched_at, started)
+        self._put(ihs_number, refreshed)
+        with self._lock:
+            self.refreshes += 1
+            self.refreshed_reports += len(resources)
+        return refreshed
+
+    def invalidate(self, ihs_number: str = None):
+        """Drop one patient's reports, or all of them."""
+        with self._lock:
+            if ihs_number is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(ihs_number, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "patients": len(self._entries),
+                "cache_size": CACHE_SIZE,
+                "reports": sum(len(e.reports) for e in self._entries.values()),
+                "full_fetches": self.full_fetches,
+                "refreshes": self.refreshes,
+                "fresh_hits": self.fresh_hits,
+                "refreshed_reports": self.refreshed_reports,
+                "refresh_errors": self.refresh_errors,
+            }
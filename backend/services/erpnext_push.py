@@ -0,0 +1,94 @@
+"""
+Local -> ERPNext push of patients, doctors, medicines, diseases and
+pharmacists, one row at a time, driven incrementally by
+services/incremental_sync.run_push. Each push_* returns True when ERPNext
+accepted the row (the client logs and returns None / [] on failure).
+"""
+from sqlalchemy.orm import Session
+from .. import models
+from .frappe_service import frappe_client
+from .incremental_sync import run_push, keep_updated_at
+
+TARGET_PATIENT = "erpnext.patient"
+TARGET_DOCTOR = "erpnext.doctor"
+TARGET_MEDICINE = "erpnext.medicine"
+TARGET_DISEASE = "erpnext.disease"
+TARGET_PHARMACIST = "erpnext.pharmacist"
+
+def push_patient(db: Session, pat: models.Patient) -> bool:
+    if pat.frappe_id:
+        return frappe_client.update_patient(pat.frappe_id, {
+            "first_name": pat.firstName,
+            "last_name": pat.lastName,
+            "sex": pat.gender,
+            "mobile": pat.phone,
+            "dob": str(pat.birthday) if pat.birthday else None,
+        }) is not None
+    # create_patient links to an existing ERPNext patient with the same mobile
+    resp = frappe_client.create_patient({
+        "firstName": pat.firstName,
+        "lastName": pat.lastName,
+        "gender": pat.gender,
+        "phone": pat.phone,
+        "birthday": pat.birthday,
+    })
+    if not resp or "data" not in resp:
+        return False
+    pat.frappe_id = resp["data"].get("name")
+    keep_updated_at(pat)
+    return True
+
+def _split_name(name: str) -> tuple:
+    parts = (name or "").split(" ", 1)
+    return parts[0], parts[1] if len(parts) > 1 else ""
+
+def _push_practitioner(name: str, first_name: str, last_name: str, department: str) -> bool:
+    # Matched by name, since the ERPNext id isn't stored locally
+    erp_docs = frappe_client.get_list("Healthcare Practitioner", filters={"practitioner_name": name})
+    if erp_docs:
+        return frappe_client.update_practitioner(erp_docs[0].get("name"), {
+            "first_name": first_name,
+            "last_name": last_name,
+            "department": department
+        }) is not None
+    return frappe_client.create_practitioner(first_name, last_name, department) is not None
+
+def push_doctor(db: Session, doc: models.DoctorEntity) -> bool:
+    first_name, last_name = _split_name(doc.namaDokter)
+    return _push_practitioner(doc.namaDokter, first_name, last_name, doc.polyName)
+
+def push_pharmacist(db: Session, p: models.Pharmacist) -> bool:
+    parts = p.name.replace("Apt.", "").replace("S.Farm", "").strip().split(" ")
+    return _push_practitioner(p.name, parts[0], " ".join(parts[1:]), "Pharmacy")
+
+def push_medicine(db: Session, med: models.Medicine) -> bool:
+    # The local item code is the ERPNext Item Code
+    if frappe_client.get_list("Item", filters={"item_code": med.erpnext_item_code}):
+        return frappe_client.update_item(med.erpnext_item_code, {
+            "item_name": med.medicineName,
+            "description": med.medicineDescription,
+            "stock_uom": med.unit,
+            "standard_rate": med.medicineRetailPrice
+        }) is not None
+    return frappe_client.create_item(
+        item_code=med.erpnext_item_code,
+        item_name=med.medicineName,
+        stock_uom=med.unit,
+        description=med.medicineDescription,
+        standard_rate=med.medicineRetailPrice
+    ) is not None
+
+def push_disease(db: Session, disease: models.Disease) -> bool:
+    return bool(frappe_client.create_diagnosis(disease.icd_code, disease.name))
+
+PUSH_TARGETS = {
+    TARGET_PATIENT: (models.Patient, models.Patient.id, push_patient),
+    TARGET_DOCTOR: (models.DoctorEntity, models.DoctorEntity.medicalFacilityPolyDoctorId, push_doctor),
+    TARGET_MEDICINE: (models.Medicine, models.Medicine.id, push_medicine),
+    TARGET_DISEASE: (models.Disease, models.Disease.id, push_disease),
+    TARGET_PHARMACIST: (models.Pharmacist, models.Pharmacist.id, push_pharmacist),
+}
+
+def push_changes(db: Session, target: str, full: bool = False) -> dict:
+    model, pk, push_one = PUSH_TARGETS[target]
+    return run_push(db, target, model, pk, push_one, full=full)
@@ -0,0 +1,172 @@
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Resources per transaction Bundle
+BUNDLE_SIZE = int(os.getenv("SATUSEHAT_BUNDLE_SIZE", "100"))
+# Read timeout for one Bundle POST; the server validates and stores every entry before answering
+BUNDLE_TIMEOUT_SECONDS = int(os.getenv("SATUSEHAT_BUNDLE_TIMEOUT", "60"))
+# Statuses that mean the server refused the content of a transaction (one bad
+# entry); anything else non-2xx is about the server, not the data
+REJECTED_STATUSES = (400, 422)
+
+class TransactionDeferred(Exception):
+    """The server can't take transactions now (429, 5xx, auth): stop, leave the rest for a later run."""
+
+def build_transaction(resources: list) -> dict:
+    """A FHIR transaction Bundle creating each resource (POST to its type)."""
+    return {
+        "resourceType": "Bundle",
+        "type": "transaction",
+        "entry": [
+            {
+                "fullUrl": f"urn:uuid:{uuid.uuid4()}",
+                "resource": resource,
+                "request": {"method": "POST", "url": resource["resourceType"]},
+            }
+            for resource in resources
+        ],
+    }
+
+def created_id(entry: dict):
+    """Id of the resource a transaction-response entry created, or None if it failed."""
+    response = entry.get("response") or {}
+    if not str(response.get("status", "")).startswith("2"):
+        return None
+    resource = entry.get("resource") or {}
+    if resource.get("id"):
+        return resource["id"]
+    # location is "[base/]<Type>/<id>/_history/<version>"
+    location = (response.get("location") or "").split("/_history", 1)[0].rstrip("/")
+    return location.rsplit("/", 1)[-1] or None
+
+def next_link(bundle: dict, base_url: str = None):
+    """URL of the next page of a searchset Bundle, or None on the last page."""
+    for link in bundle.get("link") or []:
+        if link.get("relation") == "next" and link.get("url"):
+            url = link["url"]
+            if base_url and not url.startswith(("http://", "https://")):
+                url = f"{base_url.rstrip('/')}/{url.lstrip('/')}"
+            return url
+    return None
+
+class TransactionBatcher:
+    """
+    Creates many FHIR resources in few requests.
+
+    post_bundle(bundle) returns the transaction-response Bundle, None if
+    the server rejected its content (REJECTED_STATUSES), and raises
+    TransactionDeferred when the server is overloaded or failing;
+    post_single(resource) returns the new id or None. Response entries come
+    back in request order, so each is mapped to its input by position. A
+    transaction is all-or-nothing: a rejected Bundle is split in half and
+    each half sent again, down to single requests, so one bad record costs a
+    few extra requests rather than its whole chunk going one by one. A
+    deferred Bundle stops the push: splitting it would only send more requests
+    to a server that is down. A Bundle lost to a network error is not resent,
+    since it may have been applied. Either way the rows stay unlinked and the
+    next push or NIK link run picks them up.
+    """
+
+    def __init__(self, name: str, post_bundle, post_single, size: int = BUNDLE_SIZE):
+        self.name = name
+        self._post_bundle = post_bundle
+        self._post_single = post_single
+        self.size = max(1, size)
+        self._lock = threading.Lock()
+
+        self.bundles = 0
+        self.rejected = 0
+        self.singles = 0
+        self.created = 0
+        self.failed = 0
+        self.lost = 0
+        self.deferred = 0
+        self.last_push = None
+
+    def push(self, resources: list) -> list:
+        """Create the resources; their new ids (None where creation failed), in input order."""
+        start = time.perf_counter()
+        requests_before = self.bundles + self.singles
+        ids = [None] * len(resources)
+        deferred = 0
+        for offset in range(0, len(resources), self.size):
+            try:
+                self._push(resources, list(range(offset, min(offset + self.size, len(resources)))), ids)
+            except TransactionDeferred as e:
+                deferred = sum(1 for i in ids[offset:] if i is None)
+                logger.warning(f"{self.name} push stopped, {deferred} resources left for a later run: {e}")
+                break
+
+        created = sum(1 for i in ids if i)
+        with self._lock:
+            self.created += created
+            self.failed += len(ids) - created - deferred
+            self.deferred += deferred
+            self.last_push = {
+                "resources": len(resources),
+                "created": created,
+                "deferred": deferred,
+                "requests": self.bundles + self.singles - requests_before,
+                "elapsed_ms": round((time.perf_counter() - start) * 1000, 1),
+            }
+        return ids
+
+    def _push(self, resources: list, indexes: list, ids: list):
+        if len(indexes) == 1:
+            self._single(resources, indexes[0], ids)
+            return
+
+        with self._lock:
+            self.bundles += 1
+        try:
+            response = self._post_bundle(build_transaction([resources[i] for i in indexes]))
+        except TransactionDeferred:
+            raise
+        except Exception as e:
+            with self._lock:
+                self.lost += len(indexes)
+            logger.warning(f"{self.name} transaction of {len(indexes)} resources lost, not resent: {e}")
+            return
+
+        if response is None:
+            with self._lock:
+                self.rejected += 1
+            middle = len(indexes) // 2
+            self._push(resources, indexes[:middle], ids)
+            self._push(resources, indexes[middle:], ids)
+            return
+
+        entries = response.get("entry") or []
+        for position, i in enumerate(indexes):
+            ids[i] = created_id(entries[position]) if position < len(entries) else None
+        # Servers that apply entries one by one (batch semantics) can fail some of them
+        for i in indexes:
+            if ids[i] is None:
+                self._single(resources, i, ids)
+
+    def _single(self, resources: list, i: int, ids: list):
+        with self._lock:
+            self.singles += 1
+        try:
+            ids[i] = self._post_single(resources[i])
+        except Exception as e:
+            logger.warning(f"{self.name} single create failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "bundle_size": self.size,
+                "bundles": self.bundles,
+                "rejected_bundles": self.rejected,
+                "single_requests": self.singles,
+                "created": self.created,
+                "failed": self.failed,
+                "lost": self.lost,
+                "deferred": self.deferred,
+                "last_push": self.last_push,
+            }
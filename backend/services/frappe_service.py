@@ -1,7 +1,7 @@
 import os
-import requests
 import json
 from dotenv import load_dotenv
+from .http_pool import http_pool, timeout
 
 load_dotenv()
 
@@ -17,12 +17,13 @@ class FrappeClient:
             "Content-Type": "application/json",
             "Accept": "application/json"
         }
+        self.session = http_pool.session("erpnext")
 
     def _post(self, doctype: str, data: dict):
         url = f"{self.base_url}/api/resource/{doctype}"
         try:
             print(f"Syncing to Frappe {doctype}...", url)
-            response = requests.post(url, headers=self.headers, json=data, timeout=5)
+            response = self.session.post(url, headers=self.headers, json=data, timeout=timeout(5))
             if response.status_code == 200:
                 print(f"Frappe Sync Success: {response.json()}")
                 return response.json()
@@ -46,7 +47,7 @@ class FrappeClient:
             }
             try:
                 check_url = f"{self.base_url}/api/resource/Patient"
-                check_resp = requests.get(check_url, headers=self.headers, params=existing_params, timeout=5)
+                check_resp = self.session.get(check_url, headers=self.headers, params=existing_params, timeout=timeout(5))
                 if check_resp.status_code == 200:
                     data = check_resp.json().get("data", [])
                     if data:
@@ -68,18 +69,31 @@ class FrappeClient:
         }
         return self._post("Patient", data)
 
-    def create_appointment(self, queue_item: dict, patient_name: str):
+    def create_appointment(self, queue_item: dict, patient_name: str, reference=None):
         # Fallback: Sync to 'Event' (Calendar) since 'Patient Appointment' is missing.
         # Duration 30 mins default
         start_time = queue_item.get("appointmentTime")
         # Ensure start_time is datetime object or ISO string
-        
+
+        description = "Queued from Klinik Admin"
+        if reference is not None:
+            # Event names come from a naming series, so the local ticket id is
+            # kept in the description and looked up first: a retry after a POST
+            # that timed out but was applied must not create a second Event
+            marker = f"[ticket {reference}]"
+            existing = self.get_all("Event", {"description": ["like", f"%{marker}%"]})
+            if existing is None:
+                return None
+            if existing:
+                return {"data": existing[0]}
+            description = f"{description} {marker}"
+
         data = {
             "subject": f"Consultation: {patient_name}",
             "starts_on": str(start_time),
             "status": "Open",
             "event_type": "Public",
-            "description": "Queued from Klinik Admin"
+            "description": description
         }
         return self._post("Event", data)
 
@@ -94,7 +108,7 @@ class FrappeClient:
             "limit_page_length": 500
         }
         try:
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            response = self.session.get(url, headers=self.headers, params=params, timeout=timeout(10))
             if response.status_code == 200:
                 data = response.json()
                 return data.get("data", [])
@@ -108,11 +122,41 @@ class FrappeClient:
                  print(f"Frappe Connection Error: {e}")
             return []
 
+    def get_all(self, doctype: str, filters: dict = {}, fields: list = None, page_length: int = 500, **extra):
+        """
+        Every matching row, page_length at a time (get_list stops at the first
+        page). extra goes into the query string, e.g. order_by, group_by.
+        Returns None if a page could not be read, so callers can tell a
+        failure from an empty list.
+        """
+        url = f"{self.base_url}/api/resource/{doctype}"
+        rows = []
+        while True:
+            params = {
+                "fields": json.dumps(fields or ["name"]),
+                "filters": json.dumps(filters),
+                "limit_start": len(rows),
+                "limit_page_length": page_length,
+                **extra
+            }
+            try:
+                response = self.session.get(url, headers=self.headers, params=params, timeout=timeout(30))
+            except Exception as e:
+                print(f"Frappe Connection Error: {e}")
+                return None
+            if response.status_code != 200:
+                print(f"Frappe Get All {doctype} Failed ({response.status_code}): {response.text[:500]}")
+                return None
+            page = response.json().get("data", [])
+            rows.extend(page)
+            if len(page) < page_length:
+                return rows
+
     def delete_document(self, doctype: str, name: str):
         url = f"{self.base_url}/api/resource/{doctype}/{name}"
         try:
             print(f"Deleting {doctype} {name}...")
-            response = requests.delete(url, headers=self.headers, timeout=5)
+            response = self.session.delete(url, headers=self.headers, timeout=timeout(5))
             if response.status_code == 202 or response.status_code == 200:
                 print(f"Deletion Success.")
                 return True
@@ -129,7 +173,7 @@ class FrappeClient:
         }
         fields = ["name", "item_name", "stock_uom", "description", "standard_rate"]
         try:
-            return self.get_list("Item", filters=filters, fields=fields)
+            return self.get_all("Item", filters=filters, fields=fields, order_by="name asc") or []
         except Exception as e:
             print(f"Frappe Get Items Error: {e}")
             return []
@@ -145,7 +189,7 @@ class FrappeClient:
                 "filters": json.dumps(filters),
                 "limit_page_length": 500
             }
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            response = self.session.get(url, headers=self.headers, params=params, timeout=timeout(10))
             if response.status_code == 200:
                 return response.json().get("data", [])
             return []
@@ -172,7 +216,7 @@ class FrappeClient:
                 "limit_page_length": limit,
                 "order_by": "creation desc"
             }
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            response = self.session.get(url, headers=self.headers, params=params, timeout=timeout(10))
             if response.status_code == 200:
                 return response.json().get("data", [])
             print(f"Frappe Get Patients Failed: {response.text}")
@@ -196,7 +240,7 @@ class FrappeClient:
         url = f"{self.base_url}/api/resource/{doctype}/{name}"
         try:
             print(f"Updating Frappe {doctype} {name}...", url)
-            response = requests.put(url, headers=self.headers, json=data, timeout=5)
+            response = self.session.put(url, headers=self.headers, json=data, timeout=timeout(5))
             if response.status_code == 200:
                 print(f"Frappe Update Success: {response.json()}")
                 return response.json()
@@ -230,7 +274,7 @@ class FrappeClient:
                 "fields": '["actual_qty"]',
                 "filters": json.dumps(filters)
              }
-             response = requests.get(url, headers=self.headers, params=params, timeout=5)
+             response = self.session.get(url, headers=self.headers, params=params, timeout=timeout(5))
              if response.status_code == 200:
                  bins = response.json().get("data", [])
                  total_qty = sum([b.get("actual_qty", 0) for b in bins])
@@ -239,11 +283,36 @@ class FrappeClient:
         except:
              return 0
 
+    def get_stock_by_item(self):
+        """
+        Total actual_qty per item over all warehouses, {item_code: qty}, from
+        Bin grouped by item_code: a request per 500 items rather than one per
+        item. None if ERPNext could not be read.
+        """
+        rows = self.get_all("Bin", fields=["item_code", "sum(actual_qty) as actual_qty"],
+                            group_by="item_code", order_by="item_code asc")
+        if rows is None:
+            # Sites that refuse aggregate fields: every Bin row, summed here
+            rows = self.get_all("Bin", fields=["item_code", "actual_qty"], order_by="name asc")
+        if rows is None:
+            return None
+        stock = {}
+        for row in rows:
+            stock[row.get("item_code")] = stock.get(row.get("item_code"), 0) + (row.get("actual_qty") or 0)
+        return stock
+
     def create_user(self, email: str, first_name: str, last_name: str = "", role_map: str = "System Manager"):
         # Sync to 'User'
         # Determine roles based on internal role?
         # For now, we allow basic creation.
         
+        # User is named by email: if an earlier attempt got through, reuse it
+        existing = self.get_all("User", {"email": email})
+        if existing is None:
+            return None
+        if existing:
+            return {"data": existing[0]}
+
         # ERPNext User requires Email and First Name.
         data = {
             "email": email,
@@ -260,7 +329,10 @@ class FrappeClient:
         return self._put("User", email, data)
     
     def delete_erp_user(self, email: str):
-        return self.delete_document("User", email)
+        if self.delete_document("User", email):
+            return True
+        # Already gone counts as deleted (e.g. an earlier attempt timed out after ERPNext applied it)
+        return self.get_all("User", {"email": email}) == []
 
     # --- Diagnosis / Disease ---
     def create_diagnosis(self, icd_code: str, description: str):
@@ -0,0 +1,274 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connections kept alive per host, and whether callers wait for a free one
+# instead of opening extras (the per-host limit)
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "1") == "1"
+# Hosts whose pools are cached per session
+POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "4"))
+
+# (connect, read) timeouts in seconds; callers pass their own read timeout
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+DEFAULT_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+
+# Retries: connection failures for every method, 429/5xx answers only for
+# idempotent ones (GET/PUT/DELETE/HEAD/OPTIONS). The n-th retry waits
+# BACKOFF_FACTOR * 2^(n-1) plus up to BACKOFF_JITTER seconds (the first one
+# goes at once), capped at BACKOFF_MAX, or what Retry-After asks for.
+RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR", "0.3"))
+BACKOFF_JITTER = float(os.getenv("HTTP_BACKOFF_JITTER", "0.3"))
+BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "10"))
+RETRY_STATUSES = (429, 502, 503, 504)
+IDEMPOTENT_METHODS = Retry.DEFAULT_ALLOWED_METHODS
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def timeout(read: float = DEFAULT_READ_TIMEOUT) -> tuple:
+    return (CONNECT_TIMEOUT, read)
+
+def async_timeout(read: float = DEFAULT_READ_TIMEOUT) -> httpx.Timeout:
+    """timeout() for PooledAsyncClient; waiting for a free connection counts as reading."""
+    return httpx.Timeout(read, connect=CONNECT_TIMEOUT)
+
+def backoff_seconds(retry: int, response=None) -> float:
+    """Wait before the retry-th retry, the same schedule urllib3's Retry uses for the sync sessions."""
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(BACKOFF_MAX, float(retry_after))
+    if retry <= 1:
+        return 0.0
+    return min(BACKOFF_MAX, BACKOFF_FACTOR * 2 ** (retry - 1) + random.uniform(0, BACKOFF_JITTER))
+
+def endpoint_label(method: str, url: str) -> str:
+    """
+    "GET /api/resource/Patient/{id}" for ".../api/resource/Patient/PAT-0001".
+    Paths are kept up to the first capitalised segment (the FHIR resource or
+    ERPNext doctype); anything after it is a document id.
+    """
+    segments = [s for s in urlsplit(url).path.split("/") if s]
+    for i, segment in enumerate(segments):
+        if segment[:1].isupper():
+            if i + 1 < len(segments):
+                segments = segments[:i + 1] + ["{id}"]
+            break
+    return f"{method.upper()} /{'/'.join(segments)}"
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.statuses = {}
+
+    def observe(self, elapsed_ms: float, status, retries: int):
+        i = 0
+        while i < len(LATENCY_BUCKETS_MS) and elapsed_ms > LATENCY_BUCKETS_MS[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.retries += retries
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if status is None:
+            self.errors += 1
+        else:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def quantile(self, q: float):
+        """Upper bound of the bucket holding the q-th request (None if it is the open one)."""
+        rank, seen = q * self.count, 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self) -> dict:
+        labels = [f"le_{b}ms" for b in LATENCY_BUCKETS_MS] + ["inf"]
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "statuses": {str(k): v for k, v in sorted(self.statuses.items())},
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+class PooledSession(requests.Session):
+    """
+    requests.Session with keep-alive pools, retries and a default (connect,
+    read) timeout, timing every call into its pool's per-endpoint histograms.
+    """
+
+    def __init__(self, pool: "HttpPool", name: str):
+        super().__init__()
+        self._pool = pool
+        self.name = name
+        retry = Retry(
+            total=RETRIES, backoff_factor=BACKOFF_FACTOR, backoff_jitter=BACKOFF_JITTER, backoff_max=BACKOFF_MAX,
+            status_forcelist=RETRY_STATUSES, allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            respect_retry_after_header=True,
+            # Hand the last 429/5xx back to the caller instead of raising, like a plain request would
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_MAXSIZE,
+                                   pool_block=POOL_BLOCK, max_retries=retry)
+        self.mount("https://", self.adapter)
+        self.mount("http://", self.adapter)
+
+    def request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", timeout())
+        start = time.perf_counter()
+        status, retries = None, 0
+        try:
+            response = super().request(method, url, *args, **kwargs)
+            status = response.status_code
+            history = getattr(getattr(response.raw, "retries", None), "history", None)
+            retries = len(history) if history else 0
+            return response
+        finally:
+            self._pool.observe(self.name, endpoint_label(method, url), (time.perf_counter() - start) * 1000, status, retries)
+
+    def connection_stats(self) -> list:
+        """Connections opened vs requests sent per host: a low ratio means keep-alive is working."""
+        pools = self.adapter.poolmanager.pools
+        hosts = []
+        for key in pools.keys():
+            try:
+                pool = pools[key]
+            except KeyError:
+                continue
+            hosts.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+            })
+        return hosts
+
+class PooledAsyncClient(httpx.AsyncClient):
+    """
+    httpx.AsyncClient counterpart of PooledSession for async routes: same
+    connection cap, timeouts and retry policy, timed into the same histograms.
+    """
+
+    def __init__(self, pool: "HttpPool", name: str):
+        limits = httpx.Limits(max_connections=POOL_MAXSIZE, max_keepalive_connections=POOL_MAXSIZE)
+        # The transport retries failed connects; status retries are done in send()
+        super().__init__(timeout=async_timeout(), limits=limits,
+                         transport=httpx.AsyncHTTPTransport(retries=RETRIES, limits=limits))
+        self._pool = pool
+        self.name = name
+        self.loop = asyncio.get_running_loop()
+
+    async def send(self, request, **kwargs):
+        start = time.perf_counter()
+        status, retries = None, 0
+        try:
+            while True:
+                response = await super().send(request, **kwargs)
+                if (response.status_code not in RETRY_STATUSES or request.method not in IDEMPOTENT_METHODS
+                        or retries >= RETRIES):
+                    break
+                await response.aclose()
+                retries += 1
+                await asyncio.sleep(backoff_seconds(retries, response))
+            status = response.status_code
+            return response
+        finally:
+            self._pool.observe(self.name, endpoint_label(request.method, str(request.url)),
+                               (time.perf_counter() - start) * 1000, status, retries)
+
+class HttpPool:
+    """
+    One PooledSession per outbound integration (ERPNext, SatuSehat), shared by
+    every caller in the process so TCP/TLS connections are reused across
+    requests and threads, plus a PooledAsyncClient per integration for async
+    routes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._async_clients = {}
+        self._histograms = {}
+
+    def session(self, name: str) -> PooledSession:
+        with self._lock:
+            if name not in self._sessions:
+                self._sessions[name] = PooledSession(self, name)
+            return self._sessions[name]
+
+    def async_client(self, name: str) -> PooledAsyncClient:
+        """Must be called from the event loop. Its connections belong to that loop, so a client
+        made on another loop (a test harness restarting the app) is replaced, not reused."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(name)
+            if client is None or client.loop is not loop:
+                client = self._async_clients[name] = PooledAsyncClient(self, name)
+            return client
+
+    async def aclose(self):
+        """Close the async clients of the running loop (app shutdown)."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clients = [c for c in self._async_clients.values() if c.loop is loop]
+            self._async_clients = {n: c for n, c in self._async_clients.items() if c.loop is not loop}
+        for client in clients:
+            await client.aclose()
+
+    def observe(self, name: str, endpoint: str, elapsed_ms: float, status, retries: int):
+        with self._lock:
+            histogram = self._histograms.get((name, endpoint))
+            if histogram is None:
+                histogram = self._histograms[(name, endpoint)] = LatencyHistogram()
+            histogram.observe(elapsed_ms, status, retries)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            sessions = dict(self._sessions)
+            names = sorted(set(sessions) | set(self._async_clients))
+            histograms = {key: h.to_dict() for key, h in self._histograms.items()}
+        return {
+            "config": {
+                "pool_maxsize": POOL_MAXSIZE,
+                "pool_block": POOL_BLOCK,
+                "connect_timeout": CONNECT_TIMEOUT,
+                "default_read_timeout": DEFAULT_READ_TIMEOUT,
+                "retries": RETRIES,
+                "backoff_factor": BACKOFF_FACTOR,
+                "backoff_jitter": BACKOFF_JITTER,
+            },
+            "clients": {
+                name: {
+                    # Keep-alive counters of the sync session; async calls only show up in the histograms
+                    "hosts": sessions[name].connection_stats() if name in sessions else [],
+                    "endpoints": {endpoint: h for (n, endpoint), h in sorted(histograms.items()) if n == name},
+                }
+                for name in names
+            },
+        }
+
+http_pool = HttpPool()
@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, update, func
+from ..database import SessionLocal
+from .. import models
+from .rate_limit import TokenBucket
+from .satu_sehat_service import satu_sehat_client
+
+logger = logging.getLogger(__name__)
+
+# Parallel NIK lookups, and the overall request rate they share
+LINK_CONCURRENCY = int(os.getenv("IHS_LINK_CONCURRENCY", "8"))
+LINK_RATE_PER_SECOND = float(os.getenv("IHS_LINK_RATE", "10"))
+LINK_BURST = int(os.getenv("IHS_LINK_BURST", "10"))
+# Rows resolved and committed together
+LINK_BATCH_SIZE = int(os.getenv("IHS_LINK_BATCH_SIZE", "100"))
+# Finished jobs kept for GET .../link-jobs
+KEPT_JOBS = 20
+
+KIND_PATIENTS = "patients"
+KIND_DOCTORS = "doctors"
+
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+def _targets(kind: str) -> tuple:
+    """(table, id column, NIK column, IHS column, lookup) of a job kind."""
+    if kind == KIND_PATIENTS:
+        table = models.Patient.__table__
+        return (table, table.c.id, table.c.identityCard, table.c.ihs_number,
+                satu_sehat_client.search_patient_by_nik)
+    table = models.DoctorEntity.__table__
+    return (table, table.c.medicalFacilityPolyDoctorId, table.c.identityCard, table.c.ihs_practitioner_number,
+            satu_sehat_client.search_practitioner_by_nik)
+
+class LinkJob:
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = STATUS_RUNNING
+        self.total = 0
+        self.processed = 0
+        self.linked = 0
+        self.not_found = 0
+        self.error = None
+        self.started_at = datetime.utcnow()
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "linked": self.linked,
+            "not_found": self.not_found,
+            "progress": round(self.processed / self.total, 4) if self.total else (1.0 if self.status == STATUS_DONE else 0.0),
+            "rate_per_second": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+class IhsLinker:
+    """
+    Background linking of local patients / doctors to their SatuSehat IHS
+    number by NIK. Only unlinked rows with a 16-digit NIK are looked up;
+    lookups run LINK_CONCURRENCY at a time behind one token bucket, and each
+    batch of LINK_BATCH_SIZE is written in a short transaction of its own.
+    Jobs live in this process; at most one per kind runs at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def start(self, kind: str) -> LinkJob:
+        with self._lock:
+            for job in self._jobs.values():
+                if job.kind == kind and job.status == STATUS_RUNNING:
+                    return job
+            job = LinkJob(kind)
+            self._jobs[job.id] = job
+            finished = [j for j in self._jobs.values() if j.status != STATUS_RUNNING]
+            for old in sorted(finished, key=lambda j: j.started_at)[:-KEPT_JOBS]:
+                del self._jobs[old.id]
+        threading.Thread(target=self._run, args=(job,), name=f"ihs-link-{job.id}", daemon=True).start()
+        return job
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.started_at, reverse=True)
+
+    def _run(self, job: LinkJob):
+        table, id_col, nik_col, ihs_col, lookup = _targets(job.kind)
+        pending = [ihs_col.is_(None), nik_col.isnot(None), nik_col.like("_" * 16)]
+        bucket = TokenBucket(LINK_RATE_PER_SECOND, LINK_BURST)
+
+        def resolve(nik: str):
+            bucket.acquire()
+            try:
+                result = lookup(nik)
+            except Exception as e:
+                logger.warning(f"IHS lookup failed: {e}")
+                return None
+            return (result or {}).get("ihs_number") or None
+
+        db = SessionLocal()
+        try:
+            job.total = db.execute(select(func.count()).select_from(table).where(*pending)).scalar()
+            db.rollback()
+            # Fail fast on bad credentials instead of once per looked-up row
+            if not satu_sehat_client.get_access_token():
+                raise Exception("Failed to get SatuSehat access token")
+
+            last_id = None
+            with ThreadPoolExecutor(max_workers=LINK_CONCURRENCY) as pool:
+                while True:
+                    query = select(id_col, nik_col).where(*pending).order_by(id_col).limit(LINK_BATCH_SIZE)
+                    if last_id is not None:
+                        query = query.where(id_col > last_id)
+                    rows = db.execute(query).all()
+                    db.rollback()
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
+
+                    found = [(row_id, ihs) for (row_id, _), ihs in zip(rows, pool.map(resolve, [nik for _, nik in rows])) if ihs]
+                    for row_id, ihs in found:
+                        # Only fill an empty link, and leave updated_at alone: this is not a local edit
+                        db.execute(update(table).where(id_col == row_id, ihs_col.is_(None))
+                                   .values({ihs_col: ihs, table.c.updated_at: table.c.updated_at}))
+                    db.commit()
+                    job.processed += len(rows)
+                    job.linked += len(found)
+                    job.not_found += len(rows) - len(found)
+            job.status = STATUS_DONE
+        except Exception as e:
+            logger.error(f"IHS link job {job.id} failed: {e}")
+            db.rollback()
+            job.status, job.error = STATUS_FAILED, str(e)
+        finally:
+            db.close()
+            job.finished_at = datetime.utcnow()
+            logger.info(f"IHS link job {job.id} ({job.kind}): {job.linked}/{job.processed} linked, {job.status}")
+
+ihs_linker = IhsLinker()
@@ -0,0 +1,113 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Callable
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+PUSH_BATCH_SIZE = int(os.getenv("SYNC_PUSH_BATCH_SIZE", "200"))
+# Rows changed within this window are left for the next run: a transaction
+# that is still open may yet commit a row with an updated_at behind them
+SETTLE_SECONDS = int(os.getenv("SYNC_SETTLE_SECONDS", "60"))
+
+def keep_updated_at(obj):
+    """
+    Write the row's current updated_at back with the next flush, so onupdate
+    doesn't fire. For write-backs of remote ids (frappe_id, ihs_number) that
+    are the result of a push, not a local change to push again.
+    """
+    flag_modified(obj, "updated_at")
+
+def get_watermark(db: Session, target: str) -> models.SyncWatermark:
+    watermark = db.query(models.SyncWatermark).filter(models.SyncWatermark.target == target).first()
+    if not watermark:
+        watermark = models.SyncWatermark(target=target, lastId=0, lastPushed=0, lastFailed=0)
+        db.add(watermark)
+        db.flush()
+    return watermark
+
+def _changed_batch(db: Session, model, pk, after: tuple, until: datetime, limit: int) -> list:
+    query = db.query(model).filter(model.updated_at < until)
+    if after[0] is not None:
+        # (updated_at, pk) > after, with the leading bound spelled out for the index
+        query = query.filter(
+            model.updated_at >= after[0],
+            or_(model.updated_at > after[0], and_(model.updated_at == after[0], pk > after[1])),
+        )
+    return query.order_by(model.updated_at.asc(), pk.asc()).limit(limit).all()
+
+def run_push(db: Session, target: str, model, pk, push_one: Callable, full: bool = False) -> dict:
+    """
+    Push the rows of `model` changed since the target's watermark, oldest
+    change first, with push_one(db, row) -> bool. Commits after every batch.
+
+    The watermark only moves past rows that were pushed: after the first
+    failure the run carries on, but the next one starts again from the failed
+    row (pushes are updates-or-creates keyed on the remote side, so repeating
+    the rows after it is harmless). full=True starts from the beginning.
+    """
+    watermark = get_watermark(db, target)
+    if full:
+        watermark.lastUpdatedAt, watermark.lastId = None, 0
+    after = (watermark.lastUpdatedAt, watermark.lastId)
+    until = datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+    run_started = datetime.utcnow()
+
+    changed, pushed, failed, first_error = 0, 0, 0, None
+    while True:
+        rows = _changed_batch(db, model, pk, after, until, PUSH_BATCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            changed += 1
+            try:
+                ok = push_one(db, row)
+                error = None if ok else "remote call failed"
+            except Exception as e:
+                ok, error = False, str(e)
+            if ok:
+                pushed += 1
+                if not failed:
+                    watermark.lastUpdatedAt, watermark.lastId = row.updated_at, getattr(row, pk.key)
+            else:
+                failed += 1
+                first_error = first_error or f"{target} {getattr(row, pk.key)}: {error}"
+        last = rows[-1]
+        after = (last.updated_at, getattr(last, pk.key))
+        db.commit()
+        if len(rows) < PUSH_BATCH_SIZE:
+            break
+
+    watermark.lastRunAt = run_started
+    watermark.lastPushed, watermark.lastFailed, watermark.lastError = pushed, failed, first_error
+    if not failed:
+        watermark.lastSuccessAt = run_started
+    db.commit()
+    logger.info(f"Incremental push {target}: {changed} changed, {pushed} pushed, {failed} failed")
+    return {
+        "target": target,
+        "changed": changed,
+        "pushed": pushed,
+        "failed": failed,
+        "error": first_error,
+        "watermark": watermark.lastUpdatedAt.isoformat() if watermark.lastUpdatedAt else None,
+    }
+
+def watermark_stats(db: Session) -> list:
+    return [
+        {
+            "target": w.target,
+            "last_updated_at": w.lastUpdatedAt,
+            "last_id": w.lastId,
+            "last_run_at": w.lastRunAt,
+            "last_success_at": w.lastSuccessAt,
+            "last_pushed": w.lastPushed,
+            "last_failed": w.lastFailed,
+            "last_error": w.lastError,
+        }
+        for w in db.query(models.SyncWatermark).order_by(models.SyncWatermark.target)
+    ]
@@ -0,0 +1,239 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from .. import models
+from .incremental_sync import get_watermark
+from .patient_search import normalize_words
+from .satu_sehat_service import satu_sehat_client
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_TARGET = "kfa.farmasi"
+# Products per KFA request while mirroring
+PAGE_SIZE = int(os.getenv("KFA_MIRROR_PAGE_SIZE", "100"))
+# from_date has day precision: an incremental refresh starts a day before the last good one
+OVERLAP_DAYS = 1
+MAX_QUERY_WORDS = 4
+MAX_LIMIT = 50
+
+class _KfaIndex:
+    """
+    Immutable search index: products sorted by normalized name, and a sorted
+    list of (token, product) postings over the words of each product's name,
+    KFA code and manufacturer. A prefix is two bisects on either list.
+    """
+
+    def __init__(self, products: list):
+        keyed = sorted((" ".join(normalize_words(p["name"])), p["item_code"], p) for p in products)
+        self.names = [name for name, _, _ in keyed]
+        self.products = [product for _, _, product in keyed]
+        self.words = []
+        postings = []
+        for i, product in enumerate(self.products):
+            words = set(normalize_words(product["name"]) + normalize_words(product["item_code"])
+                        + normalize_words(product["manufacturer"]))
+            # " w1 w2 ...": "has a word starting with x" is a substring test for " x"
+            self.words.append(" " + " ".join(words))
+            postings.extend((word, i) for word in words)
+        postings.sort()
+        self.tokens = [token for token, _ in postings]
+        self.ids = [i for _, i in postings]
+
+    @staticmethod
+    def _prefix_range(values: list, prefix: str) -> tuple:
+        start = bisect_left(values, prefix)
+        return start, bisect_left(values, prefix + "\x7f", start)
+
+    def search(self, words: list, offset: int, limit: int) -> list:
+        if not words:
+            return []
+        wanted = offset + limit
+
+        # Names starting with the query come first; with names sorted that is one range
+        name_start, name_end = self._prefix_range(self.names, " ".join(words))
+        ranked = list(range(name_start, min(name_end, name_start + wanted)))
+
+        if len(ranked) < wanted:
+            # Then any product with a word starting with each query word, by name.
+            # Candidates come from the word with the fewest postings.
+            ranges = {word: self._prefix_range(self.tokens, word) for word in words}
+            key = min(ranges, key=lambda w: ranges[w][1] - ranges[w][0])
+            start, end = ranges[key]
+            ids = self.ids[start:end]
+            if start < end and self.tokens[start] != self.tokens[end - 1]:
+                # Postings of several tokens: merge them into name order
+                ids = sorted(set(ids))
+            rest = [" " + w for w in words if w != key]
+            for i in ids:
+                if name_start <= i < name_end:
+                    continue
+                if all(w in self.words[i] for w in rest):
+                    ranked.append(i)
+                    if len(ranked) == wanted:
+                        break
+        return [dict(self.products[i]) for i in ranked[offset:wanted]]
+
+class KfaCatalog:
+    """
+    Local mirror of the KFA farmasi catalog, for medicine autocomplete.
+
+    refresh() pages through KFA's products/all into kfa_products: everything
+    on a full refresh (products it no longer lists are deactivated), only
+    products updated since the last good run otherwise, tracked in the
+    kfa.farmasi sync watermark. Searches are answered from an in-memory index
+    of the active rows, rebuilt after each refresh and swapped in whole, so
+    they never wait for KFA and keep working while it is down. Results have
+    the shape of SatuSehatClient._parse_kfa_product.
+    """
+
+    def __init__(self):
+        self._index = _KfaIndex([])
+        self._refresh_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.built_at = None
+        self.build_ms = 0.0
+        self.searches = 0
+        self.total_search_us = 0.0
+        self.max_search_us = 0.0
+        self.last_refresh = None
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._index.products)
+
+    def load(self) -> int:
+        """(Re)build the index from the mirror table. Returns the products indexed."""
+        start = time.perf_counter()
+        db = SessionLocal()
+        try:
+            rows = db.query(models.KfaProduct.data).filter(models.KfaProduct.active == True).all()
+            products = [satu_sehat_client._parse_kfa_product(json.loads(row.data)) for row in rows]
+        finally:
+            db.close()
+        index = _KfaIndex(products)
+        self._index = index
+        with self._stats_lock:
+            self.built_at = datetime.utcnow()
+            self.build_ms = (time.perf_counter() - start) * 1000
+        logger.info(f"KFA index: {len(products)} products, {len(index.tokens)} tokens in {self.build_ms:.0f} ms")
+        return len(products)
+
+    def search(self, query: str, page: int = 1, limit: int = 10) -> list:
+        start = time.perf_counter()
+        limit = max(1, min(limit, MAX_LIMIT))
+        words = normalize_words(query)[:MAX_QUERY_WORDS]
+        results = self._index.search(words, (max(page, 1) - 1) * limit, limit)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+        with self._stats_lock:
+            self.searches += 1
+            self.total_search_us += elapsed_us
+            self.max_search_us = max(self.max_search_us, elapsed_us)
+        return results
+
+    def _upsert(self, db: Session, items: list, synced_at: datetime) -> int:
+        items = [item for item in items if item.get("kfa_code")]
+        existing = {
+            p.kfa_code: p for p in
+            db.query(models.KfaProduct).filter(models.KfaProduct.kfa_code.in_([i["kfa_code"] for i in items]))
+        }
+        for item in items:
+            row = existing.get(item["kfa_code"])
+            if row is None:
+                row = existing[item["kfa_code"]] = models.KfaProduct(kfa_code=item["kfa_code"])
+                db.add(row)
+            row.name = (item.get("name") or "")[:255]
+            row.data = json.dumps(item)
+            row.active = item.get("active", True) is not False
+            row.syncedAt = synced_at
+        return len(items)
+
+    def refresh(self, full: bool = False):
+        """
+        Mirror changed products (all of them with full=True) and rebuild the
+        index. Returns the run report, or None if a refresh is already running.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return None
+        try:
+            return self._refresh(full)
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self, full: bool) -> dict:
+        start = time.perf_counter()
+        run_started = datetime.utcnow()
+        report = {"started_at": run_started.isoformat(), "full": full, "pages": 0, "products": 0, "deactivated": 0}
+        db = SessionLocal()
+        try:
+            watermark = get_watermark(db, WATERMARK_TARGET)
+            # Commit a new watermark row now: a failing first page rolls back
+            db.commit()
+            if not full and watermark.lastSuccessAt is None:
+                full = report["full"] = True
+            from_date = None if full else (watermark.lastSuccessAt - timedelta(days=OVERLAP_DAYS)).date().isoformat()
+            report["from_date"] = from_date
+            try:
+                page = 1
+                while True:
+                    items = satu_sehat_client.fetch_kfa_page(page, PAGE_SIZE, from_date)
+                    report["products"] += self._upsert(db, items, run_started)
+                    report["pages"] += 1
+                    db.commit()
+                    if len(items) < PAGE_SIZE:
+                        break
+                    page += 1
+                if full:
+                    # Read to the end: whatever KFA did not list any more is gone from the catalog
+                    report["deactivated"] = db.query(models.KfaProduct).filter(
+                        models.KfaProduct.active == True, models.KfaProduct.syncedAt < run_started
+                    ).update({"active": False}, synchronize_session=False)
+                watermark.lastSuccessAt, watermark.lastError = run_started, None
+            except Exception as e:
+                db.rollback()
+                report["error"] = watermark.lastError = str(e)[:2000]
+                logger.error(f"KFA catalog refresh stopped after {report['pages']} pages: {e}")
+            watermark.lastRunAt = run_started
+            watermark.lastPushed, watermark.lastFailed = report["products"], int("error" in report)
+            db.commit()
+        finally:
+            db.close()
+
+        # Pages stored before an error are as good as the rest
+        if report["products"] or report["deactivated"] or not self.ready:
+            report["indexed"] = self.load()
+        report["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"KFA catalog refresh: {report}")
+        with self._stats_lock:
+            self.last_refresh = report
+        return report
+
+    def start_refresh(self, full: bool = False) -> bool:
+        """refresh() in a background thread; False if one is already running."""
+        if self._refresh_lock.locked():
+            return False
+        threading.Thread(target=self.refresh, args=(full,), name="kfa-catalog-refresh", daemon=True).start()
+        return True
+
+    def stats(self) -> dict:
+        index = self._index
+        with self._stats_lock:
+            return {
+                "products": len(index.products),
+                "tokens": len(index.tokens),
+                "built_at": self.built_at.isoformat() if self.built_at else None,
+                "build_ms": round(self.build_ms, 1),
+                "refreshing": self._refresh_lock.locked(),
+                "searches": self.searches,
+                "avg_search_us": round(self.total_search_us / self.searches, 1) if self.searches else 0.0,
+                "max_search_us": round(self.max_search_us, 1),
+                "last_refresh": self.last_refresh,
+            }
+
+kfa_catalog = KfaCatalog()
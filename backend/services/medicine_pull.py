@@ -0,0 +1,106 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+from .. import models
+from .frappe_service import frappe_client
+from .erpnext_push import TARGET_MEDICINE
+from .incremental_sync import get_watermark
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT / UPDATE executemany
+WRITE_BATCH_SIZE = int(os.getenv("MEDICINE_PULL_BATCH_SIZE", "1000"))
+
+# Medicine columns that come from ERPNext
+PULLED_COLUMNS = ("medicineName", "medicineDescription", "unit", "qty")
+# updated_at of the rows a pull creates: below the erpnext.medicine push
+# watermark, so the push doesn't send ERPNext's own items back to it
+PULLED_UPDATED_AT = datetime(1970, 1, 1)
+
+def _pulled_values(item: dict, stock: dict) -> dict:
+    return {
+        "medicineName": item.get("item_name"),
+        "medicineDescription": item.get("description"),
+        "unit": item.get("stock_uom"),
+        "qty": int(stock.get(item.get("name"), 0) or 0),
+    }
+
+def pull_medicines(db: Session) -> dict:
+    """
+    Bring medicinecore in line with ERPNext's Item list and Bin stock.
+
+    Two paginated reads from ERPNext (items; stock summed per item_code by
+    Bin), one SELECT of the linked medicines, then bulk INSERTs for new items
+    and executemany UPDATEs for the rows whose pulled columns changed.
+    Data that came from ERPNext is not a local change for the
+    erpnext.medicine push: updates keep updated_at and new rows are dated
+    PULLED_UPDATED_AT. New rows take ERPNext's standard_rate as their retail
+    price; linked rows keep their local prices. Commits once.
+
+    Returns the run report, or one with "error" (nothing written) if ERPNext
+    could not be read: a failed stock read must not zero every medicine.
+    """
+    start = time.perf_counter()
+    report = {"count": 0, "created": 0, "updated": 0, "unchanged": 0}
+
+    items = frappe_client.get_items()
+    if not items:
+        report["error"] = "Failed to fetch items from ERPNext"
+        return report
+    stock = frappe_client.get_stock_by_item()
+    if stock is None:
+        report["error"] = "Failed to fetch stock from ERPNext"
+        return report
+
+    table = models.Medicine.__table__
+    existing = {
+        row.erpnext_item_code: row for row in db.execute(
+            select(table.c.id, table.c.erpnext_item_code, *(table.c[c] for c in PULLED_COLUMNS))
+            .where(table.c.erpnext_item_code.isnot(None))
+        )
+    }
+
+    inserts, updates, seen = [], [], set()
+    for item in items:
+        item_code = item.get("name") # In Frappe, name is the ID (item_code)
+        if not item_code or item_code in seen:
+            continue
+        seen.add(item_code)
+        values = _pulled_values(item, stock)
+        row = existing.get(item_code)
+        if row is None:
+            inserts.append({
+                "erpnext_item_code": item_code, "medicinePrice": 0,
+                "medicineRetailPrice": int(item.get("standard_rate") or 0),
+                "updated_at": PULLED_UPDATED_AT, **values
+            })
+        elif any(getattr(row, c) != values[c] for c in PULLED_COLUMNS):
+            # Bind names must differ from the column names in an UPDATE
+            updates.append({"b_id": row.id, **{f"b_{c}": values[c] for c in PULLED_COLUMNS}})
+        else:
+            report["unchanged"] += 1
+        report["count"] += 1
+
+    for i in range(0, len(inserts), WRITE_BATCH_SIZE):
+        db.execute(insert(table), inserts[i:i + WRITE_BATCH_SIZE])
+    if inserts:
+        watermark = get_watermark(db, TARGET_MEDICINE)
+        if watermark.lastUpdatedAt is None:
+            # Never pushed (or reset by a full push): start just after the pulled rows
+            watermark.lastUpdatedAt, watermark.lastId = PULLED_UPDATED_AT + timedelta(seconds=1), 0
+    if updates:
+        statement = (
+            update(table).where(table.c.id == bindparam("b_id"))
+            .values(updated_at=table.c.updated_at, **{c: bindparam(f"b_{c}") for c in PULLED_COLUMNS})
+        )
+        for i in range(0, len(updates), WRITE_BATCH_SIZE):
+            db.execute(statement, updates[i:i + WRITE_BATCH_SIZE])
+    db.commit()
+
+    report["created"], report["updated"] = len(inserts), len(updates)
+    report["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    logger.info(f"Medicine pull from ERPNext: {report}")
+    return report
@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import anyio
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from ..database import SessionLocal
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+KIND_PATIENT = "patient"
+KIND_PRACTITIONER = "practitioner"
+
+# A NIK that resolved keeps its answer for long (IHS numbers don't change);
+# "not registered" is re-checked soon, since registration can happen any time.
+# A TTL of 0 turns caching of that kind of answer off.
+POSITIVE_TTL_SECONDS = int(os.getenv("NIK_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+NEGATIVE_TTL_SECONDS = int(os.getenv("NIK_CACHE_NEGATIVE_TTL_SECONDS", "900"))
+# Entries kept in process memory, least recently used dropped first
+MEMORY_SIZE = int(os.getenv("NIK_CACHE_SIZE", "10000"))
+
+class NikLookupCache:
+    """
+    Two-tier cache of SatuSehat search-by-NIK answers: an in-process LRU in
+    front of the nik_lookups table, which survives restarts and is shared by
+    all workers. fetch(nik) returns (result, cacheable): result is the parsed
+    resource or None for "no match"; failed lookups are not cacheable and so
+    are retried on the next call. Invalidation clears this process's memory
+    and the table; other workers' memory entries run out with their TTL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+
+    def _from_memory(self, key: tuple):
+        """(True, result) for a fresh entry, (False, None) otherwise."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return False, None
+            result, expires_at = entry
+            if time.time() >= expires_at:
+                del self._memory[key]
+                return False, None
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            self.negative_hits += result is None
+            return True, result
+
+    def _remember(self, key: tuple, result, expires_at: float):
+        with self._lock:
+            self._memory[key] = (result, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > MEMORY_SIZE:
+                self._memory.popitem(last=False)
+
+    def _from_db(self, key: tuple):
+        db = SessionLocal()
+        try:
+            row = db.get(models.NikLookup, key)
+            if row is None or row.expiresAt <= datetime.utcnow():
+                return False, None
+            result = json.loads(row.result) if row.result else None
+            expires_at = time.time() + (row.expiresAt - datetime.utcnow()).total_seconds()
+        finally:
+            db.close()
+        self._remember(key, result, expires_at)
+        with self._lock:
+            self.db_hits += 1
+            self.negative_hits += result is None
+        return True, result
+
+    def _store(self, key: tuple, result):
+        ttl = POSITIVE_TTL_SECONDS if result is not None else NEGATIVE_TTL_SECONDS
+        with self._lock:
+            self.misses += 1
+            if ttl <= 0:
+                return
+            self.stores += 1
+        self._remember(key, result, time.time() + ttl)
+        now = datetime.utcnow()
+        values = {"result": json.dumps(result) if result is not None else None,
+                  "fetchedAt": now, "expiresAt": now + timedelta(seconds=ttl)}
+        db = SessionLocal()
+        try:
+            row = db.get(models.NikLookup, key)
+            if row is None:
+                db.add(models.NikLookup(kind=key[0], nik=key[1], **values))
+            else:
+                for name, value in values.items():
+                    setattr(row, name, value)
+            db.commit()
+        except IntegrityError:
+            # Another worker stored the same NIK first; its answer is as good as ours
+            db.rollback()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Could not persist NIK lookup {key[0]}: {e}")
+        finally:
+            db.close()
+
+    def lookup(self, kind: str, nik: str, fetch):
+        key = (kind, nik)
+        found, result = self._from_memory(key)
+        if found:
+            return result
+        found, result = self._from_db(key)
+        if found:
+            return result
+        result, cacheable = fetch(nik)
+        if cacheable:
+            self._store(key, result)
+        else:
+            with self._lock:
+                self.misses += 1
+        return result
+
+    async def alookup(self, kind: str, nik: str, afetch):
+        """lookup() for the event loop; the DB tier runs in a worker thread."""
+        key = (kind, nik)
+        found, result = self._from_memory(key)
+        if found:
+            return result
+        found, result = await anyio.to_thread.run_sync(self._from_db, key)
+        if found:
+            return result
+        result, cacheable = await afetch(nik)
+        if cacheable:
+            await anyio.to_thread.run_sync(self._store, key, result)
+        else:
+            with self._lock:
+                self.misses += 1
+        return result
+
+    def invalidate(self, nik: str, kind: str = None) -> int:
+        """Forget one NIK (of one kind, or all kinds). Returns the rows deleted."""
+        return self.invalidate_many([nik], kind)
+
+    def invalidate_many(self, niks: list, kind: str = None) -> int:
+        """invalidate() for a batch of NIKs, in one DELETE."""
+        niks = {nik for nik in niks if nik}
+        if not niks:
+            return 0
+        statement = delete(models.NikLookup).where(models.NikLookup.nik.in_(niks))
+        if kind is not None:
+            statement = statement.where(models.NikLookup.kind == kind)
+        return self._forget(lambda key: key[1] in niks and (kind is None or key[0] == kind), statement)
+
+    def clear(self) -> int:
+        """Forget every cached answer. Returns the rows deleted."""
+        return self._forget(lambda key: True, delete(models.NikLookup))
+
+    def _forget(self, matches, statement) -> int:
+        with self._lock:
+            for key in [k for k in self._memory if matches(k)]:
+                del self._memory[key]
+            self.invalidations += 1
+        db = SessionLocal()
+        try:
+            deleted = db.execute(statement).rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "memory_entries": len(self._memory),
+                "memory_size": MEMORY_SIZE,
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_ratio": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+                "stores": self.stores,
+                "invalidations": self.invalidations,
+                "positive_ttl_seconds": POSITIVE_TTL_SECONDS,
+                "negative_ttl_seconds": NEGATIVE_TTL_SECONDS,
+            }
+
+nik_cache = NikLookupCache()
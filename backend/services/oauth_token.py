@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+import time
+import anyio
+
+logger = logging.getLogger(__name__)
+
+# Treat a token as expired this long before the server says it is
+EXPIRY_MARGIN_SECONDS = int(os.getenv("SATUSEHAT_TOKEN_EXPIRY_MARGIN", "60"))
+# Within this window before (margin-adjusted) expiry, callers still get the
+# current token but a background refresh is started
+REFRESH_AHEAD_SECONDS = int(os.getenv("SATUSEHAT_TOKEN_REFRESH_AHEAD", "300"))
+# Longest a caller waits for somebody else's refresh
+REFRESH_WAIT_SECONDS = 30
+
+class TokenManager:
+    """
+    Thread-safe OAuth client-credentials token holder.
+
+    fetch() requests a new token and returns (access_token, expires_in) or
+    None. Only one fetch is ever in flight: callers arriving while it runs
+    wait for its result instead of sending their own. A token about to expire
+    is refreshed in the background while callers keep using it, and
+    get(stale=token) after a 401 drops that token and refreshes, unless
+    another caller already replaced it.
+    """
+
+    def __init__(self, name: str, fetch):
+        self.name = name
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._token = None
+        self._expires_at = 0.0
+        self._refreshing = False
+
+        self.refreshes = 0
+        self.failures = 0
+        self.background_refreshes = 0
+        self.forced_refreshes = 0
+        self.waits = 0
+        self.last_refresh_ms = 0.0
+        self.total_refresh_ms = 0.0
+        self.max_refresh_ms = 0.0
+        self.last_error = None
+
+    def _valid(self, now: float) -> bool:
+        return self._token is not None and now < self._expires_at
+
+    def _drop_stale(self, stale):
+        if stale is not None and stale == self._token:
+            self._token, self._expires_at = None, 0.0
+            self.forced_refreshes += 1
+
+    def get(self, stale: str = None, block: bool = True):
+        """
+        A valid access token, or None if it cannot be had. With block=False
+        returns None instead of fetching or waiting (for the async fast path).
+        """
+        with self._lock:
+            self._drop_stale(stale)
+            now = time.monotonic()
+            if self._valid(now):
+                if now >= self._expires_at - REFRESH_AHEAD_SECONDS and not self._refreshing:
+                    self._refreshing = True
+                    self.background_refreshes += 1
+                    threading.Thread(target=self._refresh, name=f"{self.name}-token-refresh", daemon=True).start()
+                return self._token
+            if not block:
+                return None
+            if self._refreshing:
+                self.waits += 1
+                self._done.wait_for(lambda: not self._refreshing, timeout=REFRESH_WAIT_SECONDS)
+                return self._token if self._valid(time.monotonic()) else None
+            self._refreshing = True
+        return self._refresh()
+
+    async def aget(self, stale: str = None):
+        """get() for the event loop: only a refresh (or waiting for one) goes to a worker thread."""
+        return self.get(stale, block=False) or await anyio.to_thread.run_sync(self.get)
+
+    def _refresh(self):
+        start = time.perf_counter()
+        result, error = None, None
+        try:
+            result = self._fetch()
+        except Exception as e:
+            error = str(e)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._refreshing = False
+            self.refreshes += 1
+            self.last_refresh_ms = elapsed_ms
+            self.total_refresh_ms += elapsed_ms
+            self.max_refresh_ms = max(self.max_refresh_ms, elapsed_ms)
+            if result and result[0]:
+                token, expires_in = result
+                self._token = token
+                self._expires_at = time.monotonic() + max(0, int(expires_in) - EXPIRY_MARGIN_SECONDS)
+                self.last_error = None
+            else:
+                # A failed background refresh leaves the current token in use until it expires
+                self.failures += 1
+                self.last_error = error or "token request failed"
+                logger.warning(f"{self.name} token refresh failed: {self.last_error}")
+            self._done.notify_all()
+            return self._token if self._valid(time.monotonic()) else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "has_token": self._valid(time.monotonic()),
+                "expires_in_seconds": round(max(0.0, self._expires_at - time.monotonic()), 1) if self._token else 0.0,
+                "refreshing": self._refreshing,
+                "refreshes": self.refreshes,
+                "failures": self.failures,
+                "background_refreshes": self.background_refreshes,
+                "forced_refreshes": self.forced_refreshes,
+                "waits": self.waits,
+                "last_refresh_ms": round(self.last_refresh_ms, 3),
+                "avg_refresh_ms": round(self.total_refresh_ms / self.refreshes, 3) if self.refreshes else 0.0,
+                "max_refresh_ms": round(self.max_refresh_ms, 3),
+                "last_error": self.last_error,
+            }
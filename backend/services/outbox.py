@@ -0,0 +1,171 @@
+import json
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func, or_, and_, insert
+from sqlalchemy.orm import Session
+from .. import models
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 10
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 3600
+# A claimed message whose worker died is handed out again after this
+LEASE_SECONDS = 300
+DONE_RETENTION = timedelta(days=7)
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_DEAD = "dead"
+
+class OutboxRetry(Exception):
+    """Raised by a handler when the remote call did not go through."""
+
+_handlers = {}
+
+def handler(topic: str):
+    """Register the function that performs `topic`: fn(db, payload)."""
+    def register(fn):
+        _handlers[topic] = fn
+        return fn
+    return register
+
+def enqueue(db: Session, topic: str, payload: dict, idempotency_key: Optional[str] = None) -> models.OutboxMessage:
+    """
+    Add a side effect to the caller's transaction; it is only visible to the
+    worker once the caller commits. A message whose key is already queued
+    makes the commit fail with IntegrityError, so callers pick keys that are
+    unique per intended effect (default: random).
+    """
+    message = models.OutboxMessage(
+        topic=topic,
+        payload=json.dumps(payload, default=str),
+        idempotencyKey=idempotency_key or f"{topic}:{uuid.uuid4().hex}",
+        status=STATUS_PENDING,
+        attempts=0,
+        nextAttemptAt=datetime.utcnow()
+    )
+    db.add(message)
+    return message
+
+def enqueue_many(db: Session, messages: list):
+    """
+    Bulk enqueue() for imports: one multi-row INSERT for a list of
+    (topic, payload, idempotency_key) tuples, in the caller's transaction.
+    """
+    if not messages:
+        return
+    now = datetime.utcnow()
+    db.execute(insert(models.OutboxMessage.__table__), [
+        {
+            "topic": topic,
+            "payload": json.dumps(payload, default=str),
+            "idempotencyKey": idempotency_key or f"{topic}:{uuid.uuid4().hex}",
+            "status": STATUS_PENDING,
+            "attempts": 0,
+            "nextAttemptAt": now,
+            "created_at": now,
+        }
+        for topic, payload, idempotency_key in messages
+    ])
+
+def backoff_seconds(attempts: int) -> float:
+    # Exponential with full jitter, so failed batches don't retry in lockstep
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempts))
+
+def claim_batch(db: Session, limit: int) -> list:
+    """
+    Claim up to `limit` due messages for this worker and commit the claim.
+    The conditional UPDATE is atomic per row, so concurrent workers never get
+    the same message; expired leases are picked up again.
+    """
+    now = datetime.utcnow()
+    due = or_(
+        and_(models.OutboxMessage.status == STATUS_PENDING, models.OutboxMessage.nextAttemptAt <= now),
+        and_(models.OutboxMessage.status == STATUS_PROCESSING, models.OutboxMessage.lockedUntil < now)
+    )
+    ids = [row.id for row in db.query(models.OutboxMessage.id).filter(due).order_by(models.OutboxMessage.id).limit(limit)]
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    db.query(models.OutboxMessage).filter(models.OutboxMessage.id.in_(ids), due).update({
+        "status": STATUS_PROCESSING,
+        "lockedBy": token,
+        "lockedUntil": now + timedelta(seconds=LEASE_SECONDS)
+    }, synchronize_session=False)
+    db.commit()
+    return [row.id for row in db.query(models.OutboxMessage.id).filter(
+        models.OutboxMessage.lockedBy == token,
+        models.OutboxMessage.status == STATUS_PROCESSING
+    ).order_by(models.OutboxMessage.id)]
+
+def process_message(db: Session, message_id: int) -> bool:
+    """Run one claimed message and record the outcome. True if it succeeded."""
+    message = db.query(models.OutboxMessage).filter(models.OutboxMessage.id == message_id).first()
+    if not message or message.status != STATUS_PROCESSING:
+        return False
+
+    fn = _handlers.get(message.topic)
+    try:
+        if fn is None:
+            raise OutboxRetry(f"No handler registered for {message.topic}")
+        fn(db, json.loads(message.payload))
+    except Exception as e:
+        # Drop whatever the handler left half-done, then record the failure
+        db.rollback()
+        message = db.query(models.OutboxMessage).filter(models.OutboxMessage.id == message_id).first()
+        message.attempts += 1
+        message.lastError = str(e)[:2000]
+        message.lockedBy = None
+        message.lockedUntil = None
+        if message.attempts >= MAX_ATTEMPTS:
+            message.status = STATUS_DEAD
+            logger.error(f"Outbox message {message.id} ({message.topic}) gave up after {message.attempts} attempts: {e}")
+        else:
+            message.status = STATUS_PENDING
+            message.nextAttemptAt = datetime.utcnow() + timedelta(seconds=backoff_seconds(message.attempts))
+            logger.warning(f"Outbox message {message.id} ({message.topic}) failed, attempt {message.attempts}: {e}")
+        db.commit()
+        return False
+
+    message.status = STATUS_DONE
+    message.attempts += 1
+    message.lastError = None
+    message.lockedBy = None
+    message.lockedUntil = None
+    message.processed_at = datetime.utcnow()
+    db.commit()
+    return True
+
+def prune_outbox(db: Session) -> int:
+    cutoff = datetime.utcnow() - DONE_RETENTION
+    deleted = db.query(models.OutboxMessage).filter(
+        models.OutboxMessage.status == STATUS_DONE,
+        models.OutboxMessage.processed_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def outbox_stats(db: Session) -> dict:
+    """Backlog depth per status and age of the oldest undelivered message."""
+    now = datetime.utcnow()
+    counts = dict(db.query(models.OutboxMessage.status, func.count(models.OutboxMessage.id)).group_by(models.OutboxMessage.status).all())
+    oldest = db.query(func.min(models.OutboxMessage.created_at)).filter(
+        models.OutboxMessage.status.in_([STATUS_PENDING, STATUS_PROCESSING])
+    ).scalar()
+    by_topic = db.query(models.OutboxMessage.topic, func.count(models.OutboxMessage.id)).filter(
+        models.OutboxMessage.status.in_([STATUS_PENDING, STATUS_PROCESSING])
+    ).group_by(models.OutboxMessage.topic).all()
+    return {
+        "pending": counts.get(STATUS_PENDING, 0),
+        "processing": counts.get(STATUS_PROCESSING, 0),
+        "done": counts.get(STATUS_DONE, 0),
+        "dead": counts.get(STATUS_DEAD, 0),
+        "oldest_pending_age_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0,
+        "backlog_by_topic": dict(by_topic),
+    }
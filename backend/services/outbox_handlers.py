@@ -0,0 +1,104 @@
+"""
+ERPNext / SatuSehat side effects performed by backend/outbox_worker.py.
+
+The clients log and return None on failure, so a None result raises
+OutboxRetry and the message is retried with backoff. Handlers re-read the
+local row, so a retry always pushes current data, and skip work that an
+earlier attempt already finished (frappe_id / ihs_number set). Creates
+without a local link look the ERPNext document up by a deterministic key
+first (user email, ticket id), so a POST that timed out after ERPNext applied
+it is not repeated.
+"""
+from sqlalchemy.orm import Session
+from .. import models
+from .frappe_service import frappe_client
+from .satu_sehat_service import satu_sehat_client
+from .outbox import handler, OutboxRetry
+from .incremental_sync import keep_updated_at
+
+TOPIC_FRAPPE_CREATE_PATIENT = "frappe.create_patient"
+TOPIC_FRAPPE_UPDATE_PATIENT = "frappe.update_patient"
+TOPIC_SATUSEHAT_LINK_PATIENT = "satusehat.link_patient"
+TOPIC_FRAPPE_CREATE_APPOINTMENT = "frappe.create_appointment"
+TOPIC_FRAPPE_CREATE_USER = "frappe.create_user"
+TOPIC_FRAPPE_UPDATE_USER = "frappe.update_user"
+TOPIC_FRAPPE_DELETE_USER = "frappe.delete_user"
+
+def _patient(db: Session, payload: dict):
+    return db.query(models.Patient).filter(models.Patient.id == payload["patient_id"]).first()
+
+@handler(TOPIC_FRAPPE_CREATE_PATIENT)
+def create_frappe_patient(db: Session, payload: dict):
+    patient = _patient(db, payload)
+    if not patient or patient.frappe_id:
+        return
+    resp = frappe_client.create_patient({
+        "firstName": patient.firstName,
+        "lastName": patient.lastName,
+        "gender": patient.gender,
+        "phone": patient.phone,
+        "birthday": patient.birthday,
+    })
+    if not resp or "data" not in resp:
+        raise OutboxRetry("Frappe create_patient failed")
+    patient.frappe_id = resp["data"].get("name")
+    keep_updated_at(patient)
+
+@handler(TOPIC_FRAPPE_UPDATE_PATIENT)
+def update_frappe_patient(db: Session, payload: dict):
+    patient = _patient(db, payload)
+    # Not in ERPNext yet: the pending create will carry the current data
+    if not patient or not patient.frappe_id:
+        return
+    resp = frappe_client.update_patient(patient.frappe_id, {
+        "first_name": patient.firstName,
+        "last_name": patient.lastName,
+        "sex": patient.gender,
+        "mobile": patient.phone,
+        "dob": str(patient.birthday) if patient.birthday else None,
+    })
+    if resp is None:
+        raise OutboxRetry("Frappe update_patient failed")
+
+@handler(TOPIC_SATUSEHAT_LINK_PATIENT)
+def link_satusehat_patient(db: Session, payload: dict):
+    patient = _patient(db, payload)
+    if not patient or patient.ihs_number:
+        return
+    ihs_number = satu_sehat_client.post_patient({
+        "firstName": patient.firstName,
+        "lastName": patient.lastName,
+        "identityCard": patient.identityCard,
+        "phone": patient.phone,
+        "gender": patient.gender,
+        "birthday": patient.birthday,
+        "address": patient.address,
+    })
+    if not ihs_number:
+        raise OutboxRetry("SatuSehat patient lookup/create returned no IHS number")
+    patient.ihs_number = ihs_number
+    keep_updated_at(patient)
+
+@handler(TOPIC_FRAPPE_CREATE_APPOINTMENT)
+def create_frappe_appointment(db: Session, payload: dict):
+    resp = frappe_client.create_appointment(
+        {"appointmentTime": payload["appointmentTime"]}, payload["patientName"], reference=payload.get("queueId")
+    )
+    if resp is None:
+        raise OutboxRetry("Frappe create_appointment failed")
+
+@handler(TOPIC_FRAPPE_CREATE_USER)
+def create_frappe_user(db: Session, payload: dict):
+    resp = frappe_client.create_user(payload["email"], payload["first_name"], payload["last_name"], payload["role"])
+    if resp is None:
+        raise OutboxRetry("Frappe create_user failed")
+
+@handler(TOPIC_FRAPPE_UPDATE_USER)
+def update_frappe_user(db: Session, payload: dict):
+    if frappe_client.update_erp_user(payload["email"], payload["data"]) is None:
+        raise OutboxRetry("Frappe update_erp_user failed")
+
+@handler(TOPIC_FRAPPE_DELETE_USER)
+def delete_frappe_user(db: Session, payload: dict):
+    if not frappe_client.delete_erp_user(payload["email"]):
+        raise OutboxRetry("Frappe delete_erp_user failed")
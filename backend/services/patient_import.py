@@ -0,0 +1,175 @@
+import codecs
+import csv
+import json
+import logging
+import os
+from typing import Iterator, Optional
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from .. import models, schemas
+from .outbox import enqueue_many
+from .outbox_handlers import TOPIC_FRAPPE_CREATE_PATIENT, TOPIC_SATUSEHAT_LINK_PATIENT
+from .patient_search import name_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = int(os.getenv("PATIENT_IMPORT_BATCH_SIZE", "500"))
+MAX_BATCH_SIZE = 5000
+# The report lists the first errors only, so it stays small for any file size
+MAX_REPORTED_ERRORS = 1000
+
+FORMAT_CSV = "csv"
+FORMAT_NDJSON = "ndjson"
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in (content_type or ""):
+        return FORMAT_NDJSON
+    return FORMAT_CSV
+
+def _text_lines(binary) -> Iterator[str]:
+    # Incremental decode; a UTF-8 BOM (Excel CSV export) is dropped
+    return codecs.getreader("utf-8-sig")(binary)
+
+def iter_rows(binary, fmt: str) -> Iterator[tuple]:
+    """(row_number, dict or parse error message) for each data row of the upload."""
+    lines = _text_lines(binary)
+    if fmt == FORMAT_NDJSON:
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, f"Invalid JSON: {e}"
+                continue
+            yield number, row if isinstance(row, dict) else "Expected a JSON object"
+        return
+    reader = csv.DictReader(lines)
+    for row in reader:
+        # Empty cells mean "not given", so optional columns fall back to None
+        yield reader.line_num, {k.strip(): v.strip() for k, v in row.items() if k and v is not None and v.strip()}
+
+def _validation_message(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+def _existing_keys(db: Session) -> tuple:
+    """NIKs and phone numbers already registered, in one streamed query."""
+    nik, phones = set(), set()
+    query = db.query(models.Patient.identityCard, models.Patient.phone).yield_per(10000)
+    for identity_card, phone in query:
+        nik.add(identity_card)
+        phones.add(phone)
+    return nik, phones
+
+def _insert_batch(db: Session, batch: list):
+    """Insert one batch of (row_number, PatientCreate) with tokens and outbox messages; caller commits."""
+    db.execute(insert(models.Patient.__table__), [patient.model_dump() for _, patient in batch])
+    # MySQL has no INSERT ... RETURNING; NIK is unique, so look the ids up by it
+    ids = dict(db.execute(
+        select(models.Patient.identityCard, models.Patient.id)
+        .where(models.Patient.identityCard.in_([patient.identityCard for _, patient in batch]))
+    ).all())
+
+    tokens, messages = [], []
+    for _, patient in batch:
+        patient_id = ids[patient.identityCard]
+        tokens.extend({"token": t, "patient_id": patient_id} for t in name_tokens(patient.firstName, patient.lastName))
+        # Rows that already carry the remote ids need no sync
+        if not patient.frappe_id:
+            messages.append((TOPIC_FRAPPE_CREATE_PATIENT, {"patient_id": patient_id},
+                             f"{TOPIC_FRAPPE_CREATE_PATIENT}:{patient_id}"))
+        if not patient.ihs_number:
+            messages.append((TOPIC_SATUSEHAT_LINK_PATIENT, {"patient_id": patient_id},
+                             f"{TOPIC_SATUSEHAT_LINK_PATIENT}:{patient_id}"))
+    if tokens:
+        db.execute(insert(models.PatientSearchToken.__table__), tokens)
+    enqueue_many(db, messages)
+
+def _flush(db: Session, batch: list, report: ImportReport):
+    if not batch:
+        return
+    try:
+        _insert_batch(db, batch)
+        db.commit()
+        report.imported += len(batch)
+        return
+    except IntegrityError:
+        db.rollback()
+    # Someone registered one of these patients meanwhile; retry row by row to find it
+    for number, patient in batch:
+        try:
+            _insert_batch(db, [(number, patient)])
+            db.commit()
+            report.imported += 1
+        except IntegrityError:
+            db.rollback()
+            report.error(number, f"Patient with NIK {patient.identityCard} or phone {patient.phone} already exists")
+
+def import_patients(db: Session, binary, fmt: str = FORMAT_CSV, batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    """
+    Register patients from a CSV (header row = PatientCreate field names) or
+    NDJSON upload. Rows are read as a stream and committed every `batch_size`
+    valid rows, so memory stays flat apart from the NIK / phone sets used for
+    duplicate checks. ERPNext / SatuSehat sync goes to the outbox. Returns the
+    report: counts plus the first MAX_REPORTED_ERRORS row errors.
+    """
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+    report = ImportReport()
+    known_nik, known_phones = _existing_keys(db)
+
+    batch = []
+    try:
+        for number, row in iter_rows(binary, fmt):
+            report.rows += 1
+            if isinstance(row, str):
+                report.error(number, row)
+                continue
+            try:
+                patient = schemas.PatientCreate(**row)
+            except ValidationError as e:
+                report.error(number, _validation_message(e))
+                continue
+            if patient.identityCard in known_nik:
+                report.error(number, f"Patient with NIK {patient.identityCard} already exists")
+                continue
+            if patient.phone in known_phones:
+                report.error(number, f"Patient with phone {patient.phone} already exists")
+                continue
+            known_nik.add(patient.identityCard)
+            known_phones.add(patient.phone)
+
+            batch.append((number, patient))
+            if len(batch) >= batch_size:
+                _flush(db, batch, report)
+                batch = []
+    except (csv.Error, UnicodeDecodeError) as e:
+        # Earlier batches are committed already; keep them and report where reading stopped
+        report.error(report.rows + 1, f"Unreadable file, import stopped: {e}")
+    _flush(db, batch, report)
+
+    logger.info(f"Patient import: {report.imported}/{report.rows} rows imported, {report.failed} failed")
+    return report.as_dict()
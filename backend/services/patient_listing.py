@@ -0,0 +1,109 @@
+import base64
+import json
+import threading
+import time
+from typing import Optional
+from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import Session
+from .. import models
+
+DEFAULT_LIST_LIMIT = 100
+MAX_LIST_LIMIT = 500
+# How stale the X-Total-Count estimate may get before it is recounted
+COUNT_TTL_SECONDS = 60
+
+def encode_list_cursor(first_name: Optional[str], patient_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([first_name, patient_id]).encode()).decode()
+
+def decode_list_cursor(cursor: str) -> tuple:
+    try:
+        first_name, patient_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if first_name is not None and not isinstance(first_name, str):
+            raise ValueError
+        return first_name, int(patient_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def list_patients(db: Session, limit: int = DEFAULT_LIST_LIMIT, cursor: Optional[str] = None) -> tuple:
+    """
+    Patients ordered by (firstName, id), one keyset page at a time: every page
+    is a range scan of ix_patientcore_firstname_id starting after the cursor,
+    so page 10,000 costs what page one does. Returns (patients, next_cursor);
+    next_cursor is None on the last page. Raises ValueError on a bad cursor.
+    """
+    limit = max(1, min(limit, MAX_LIST_LIMIT))
+    first_name_col, id_col = models.Patient.firstName, models.Patient.id
+    query = db.query(models.Patient)
+    if cursor:
+        first_name, patient_id = decode_list_cursor(cursor)
+        if first_name is None:
+            # NULL names sort first (MySQL / SQLite); finish those, then the rest
+            query = query.filter(or_(
+                and_(first_name_col.is_(None), id_col > patient_id),
+                first_name_col.isnot(None),
+            ))
+        else:
+            # (firstName, id) > cursor, with the leading bound spelled out so the
+            # planner starts a range scan there instead of scanning the index
+            query = query.filter(
+                first_name_col >= first_name,
+                or_(first_name_col > first_name, id_col > patient_id),
+            )
+    patients = query.order_by(first_name_col.asc(), id_col.asc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(patients) > limit:
+        patients = patients[:limit]
+        next_cursor = encode_list_cursor(patients[-1].firstName, patients[-1].id)
+    return patients, next_cursor
+
+class PatientCounter:
+    """
+    Approximate number of patients for X-Total-Count.
+
+    COUNT(*) on the patient table is a full index scan, too slow to run per
+    page. The count is taken at most once per COUNT_TTL_SECONDS; patients
+    created by this worker in between are added on top (add()), and the next
+    recount picks up whatever other workers created.
+    """
+
+    def __init__(self, ttl_seconds: float = COUNT_TTL_SECONDS):
+        self._lock = threading.Lock()
+        self._ttl = ttl_seconds
+        self._count = None
+        self._counted_at = 0.0
+
+        self.recounts = 0
+        self.last_recount_ms = 0.0
+
+    def add(self, n: int = 1):
+        with self._lock:
+            if self._count is not None:
+                self._count += n
+
+    def get(self, db: Session) -> int:
+        with self._lock:
+            if self._count is not None and time.monotonic() - self._counted_at < self._ttl:
+                return self._count
+
+        start = time.perf_counter()
+        count = db.query(func.count(models.Patient.id)).scalar() or 0
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._count = count
+            self._counted_at = time.monotonic()
+            self.recounts += 1
+            self.last_recount_ms = elapsed_ms
+            return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "count": self._count,
+                "age_seconds": round(time.monotonic() - self._counted_at, 1) if self._count is not None else None,
+                "recounts": self.recounts,
+                "last_recount_ms": round(self.last_recount_ms, 3),
+            }
+
+patient_counter = PatientCounter()
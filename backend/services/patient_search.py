@@ -0,0 +1,365 @@
+import base64
+import json
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Optional
+from sqlalchemy import select, literal, and_, or_, exists, insert, func
+from sqlalchemy.orm import Session
+from .. import models
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+# Query words beyond this are ignored
+MAX_QUERY_WORDS = 4
+# A shorter leading name word only matches whole tokens ("a" would match half the table)
+MIN_WORD_PREFIX = 2
+# Shortest identifier that is also matched as a prefix. A NIK starts with the
+# 6-digit region code most of our patients share, so it needs region + birth date.
+MIN_PREFIX_LENGTH = {"identityCard": 12, "phone": 6, "nomorRekamMedis": 5}
+IDENTIFIER_COLUMNS = ("identityCard", "phone", "nomorRekamMedis")
+
+# Result tiers, best first. Within a tier rows come in index order (matched
+# value, then id), so every page is a bounded index scan, however many match.
+TIER_IDENTIFIER_EXACT = 0
+TIER_NIK_PREFIX = 1
+TIER_PHONE_PREFIX = 2
+TIER_MRN_PREFIX = 3
+TIER_NAME_EXACT = 4
+TIER_NAME_PREFIX = 5
+TIER_NAME_FUZZY = 6
+
+# Phonetic / skeleton keys share the token table behind these marks, which
+# sort outside [a-z0-9] so word-prefix ranges never reach them. Phonetic keys
+# sort first, so the capped fuzzy candidate scan reads them before skeletons.
+PHONETIC_MARK = "#"
+SKELETON_MARK = "~"
+MIN_SKELETON_LENGTH = 3
+# Fuzzy matching reads at most FUZZY_SCAN_LIMIT key postings of the longest
+# query word and ranks the FUZZY_CANDIDATES that fit every word and are closest
+# by length (a lower bound of the edit distance)
+FUZZY_SCAN_LIMIT = 5000
+FUZZY_CANDIDATES = 200
+
+# Old (pre-1972) and loan-word spellings -> modern Indonesian, applied in order
+_SPELLING_RULES = [
+    ("oe", "u"), ("dj", "j"), ("tj", "c"), ("sj", "sy"), ("nj", "ny"),
+    ("ch", "kh"), ("kh", "h"), ("ph", "f"), ("th", "t"), ("dh", "d"),
+    ("q", "k"), ("x", "ks"), ("v", "f"), ("z", "s"),
+]
+_VOWELS = set("aeiouy")
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+_IDENTIFIER = re.compile(r"^[0-9+\-\s./]+$|^[A-Za-z]*[-/]?[0-9][A-Za-z0-9\-/.]*$")
+
+def normalize_words(text: Optional[str]) -> list:
+    """Lowercase ASCII words: accents folded, punctuation dropped."""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+    return [w for w in _NON_ALNUM.split(folded) if w]
+
+def _collapse_doubles(word: str) -> str:
+    return "".join(ch for i, ch in enumerate(word) if i == 0 or ch != word[i - 1])
+
+def phonetic_key(word: str) -> str:
+    """
+    Spelling-insensitive form of one normalized word: old spellings modernised
+    (Soekarno -> sukarno, Djoko -> joko), doubled letters collapsed
+    (Muhammad -> muhamad) and a trailing 'h' dropped (Nurhalizah -> nurhaliza).
+    """
+    for old, new in _SPELLING_RULES:
+        word = word.replace(old, new)
+    word = _collapse_doubles(word)
+    if len(word) > 3 and word.endswith("h"):
+        word = word[:-1]
+    return word
+
+def skeleton_key(word: str) -> str:
+    """First letter plus consonants of the phonetic key (Mohammad / Muhamad -> mhmd)."""
+    key = phonetic_key(word)
+    return _collapse_doubles(key[:1] + "".join(ch for ch in key[1:] if ch not in _VOWELS))
+
+def word_keys(word: str) -> list:
+    """Index tokens carrying the phonetic and (if long enough) skeleton key of a word."""
+    keys = [PHONETIC_MARK + phonetic_key(word)]
+    skeleton = skeleton_key(word)
+    if len(skeleton) >= MIN_SKELETON_LENGTH:
+        keys.append(SKELETON_MARK + skeleton)
+    return keys
+
+def name_tokens(first_name: Optional[str], last_name: Optional[str]) -> set:
+    tokens = set()
+    for word in normalize_words(first_name) + normalize_words(last_name):
+        tokens.add(word[:64])
+        if word.isalpha():
+            tokens.update(key[:64] for key in word_keys(word))
+    return tokens
+
+# Names repeat heavily across patients, so the same pairs come up on every query
+@lru_cache(maxsize=65536)
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance (insert / delete / substitute, cost 1 each)."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+def index_patient(db: Session, patient: models.Patient):
+    """(Re)write the search tokens of one patient; call after flush, before commit."""
+    table = models.PatientSearchToken.__table__
+    db.execute(table.delete().where(table.c.patient_id == patient.id))
+    tokens = name_tokens(patient.firstName, patient.lastName)
+    if tokens:
+        db.execute(insert(table), [{"token": t, "patient_id": patient.id} for t in tokens])
+
+def reindex_all(conn, chunk_size: int = 5000) -> int:
+    """Rebuild patient_search_tokens for every patient, in id chunks (re-runnable)."""
+    patients = models.Patient.__table__
+    tokens = models.PatientSearchToken.__table__
+    last_id, total = 0, 0
+    while True:
+        rows = conn.execute(
+            select(patients.c.id, patients.c.firstName, patients.c.lastName)
+            .where(patients.c.id > last_id).order_by(patients.c.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return total
+        ids = [row.id for row in rows]
+        conn.execute(tokens.delete().where(tokens.c.patient_id.in_(ids)))
+        batch = [
+            {"token": token, "patient_id": row.id}
+            for row in rows for token in name_tokens(row.firstName, row.lastName)
+        ]
+        if batch:
+            conn.execute(insert(tokens), batch)
+        last_id = ids[-1]
+        total += len(rows)
+
+def _upper_bound(prefix: str) -> str:
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def _prefix_range(column, prefix: str):
+    # Range instead of LIKE 'x%', so every dialect/collation can use the B-tree
+    return and_(column >= prefix, column < _upper_bound(prefix))
+
+def _identifier_forms(query: str) -> dict:
+    """How the query would be stored in each identifier column."""
+    raw = query.strip()
+    compact = re.sub(r"[\s\-./]", "", raw)
+    phone = compact
+    # Phone numbers typed in international form
+    if compact.startswith("+62"):
+        phone = "0" + compact[3:]
+    elif compact.startswith("62") and len(compact) > 4:
+        phone = "0" + compact[2:]
+    return {"identityCard": compact, "phone": phone, "nomorRekamMedis": raw}
+
+def _after(key_col, id_col, after):
+    """Keyset condition: rows strictly after (key, id) in (key_col, id_col) order."""
+    key, patient_id = after
+    if key_col is None:
+        return id_col > patient_id
+    return or_(key_col > key, and_(key_col == key, id_col > patient_id))
+
+def _page(id_col, key_col, conditions, after, n):
+    key = key_col if key_col is not None else literal("")
+    if after is not None:
+        conditions = list(conditions) + [_after(key_col, id_col, after)]
+    order = [id_col] if key_col is None else [key_col, id_col]
+    return select(id_col.label("patient_id"), key.label("key")).where(*conditions).order_by(*order).limit(n)
+
+def _not_listed(alias, id_col, matches: list) -> list:
+    # NOT EXISTS on an alias: one primary-key probe per row, and NULL-safe
+    # where NOT (col IN ...) would drop rows with a NULL column
+    if not matches:
+        return []
+    return [~exists().where(alias.c.id == id_col, or_(*matches))]
+
+def _tiers(db: Session, query: str, words: list) -> list:
+    """
+    [(tier, build(after, n))] for this query, best tier first. Every tier
+    leaves out the patients an earlier tier lists, so a patient shows up once
+    across all pages, not just once per page.
+    """
+    p = models.Patient.__table__
+    pi = p.alias("identified")
+    identified = []
+    tiers = []
+
+    if _IDENTIFIER.match(query):
+        forms = _identifier_forms(query)
+        values = sorted(set(v for v in forms.values() if v))
+        exact = or_(*[p.c[c].in_(values) for c in IDENTIFIER_COLUMNS])
+        tiers.append((TIER_IDENTIFIER_EXACT, lambda after, n: _page(p.c.id, None, [exact], after, n)))
+        identified.append(or_(*[pi.c[c].in_(values) for c in IDENTIFIER_COLUMNS]))
+        for tier, column_name in ((TIER_NIK_PREFIX, "identityCard"), (TIER_PHONE_PREFIX, "phone"), (TIER_MRN_PREFIX, "nomorRekamMedis")):
+            value = forms[column_name]
+            if len(value) < MIN_PREFIX_LENGTH[column_name]:
+                continue
+            column = p.c[column_name]
+            match = [column > value, column < _upper_bound(value)] + _not_listed(pi, p.c.id, identified)
+            tiers.append((tier, lambda after, n, column=column, match=match: _page(p.c.id, column, match, after, n)))
+            identified.append(and_(pi.c[column_name] > value, pi.c[column_name] < _upper_bound(value)))
+
+    if words:
+        def not_identified(id_col):
+            return _not_listed(pi, id_col, identified)
+        tiers.extend(_name_tiers(words, not_identified))
+        tiers.append((TIER_NAME_FUZZY, lambda after, n: _fuzzy_page(db, words, not_identified, after, n)))
+    return tiers
+
+def _listed_by_name_tiers(table, id_col, words: list):
+    """The name tiers' match (every word a token prefix; a short longest word a whole token)."""
+    driver_word = max(words, key=len)
+    conditions = []
+    for i, word in enumerate(words):
+        o = table.alias(f"listed{i}")
+        exact_only = word == driver_word and len(word) < MIN_WORD_PREFIX
+        conditions.append(exists().where(
+            o.c.patient_id == id_col, o.c.token == word if exact_only else _prefix_range(o.c.token, word)
+        ))
+    return and_(*conditions)
+
+def _fuzzy_page(db: Session, words: list, not_identified, after, n) -> list:
+    """
+    Patients whose name words share a phonetic or skeleton key with every
+    query word, ranked by total edit distance to the query (then id).
+    Both the postings scanned and the candidates ranked are capped, so the
+    cost does not grow with the table. Patients the earlier tiers list are
+    left out before the cap, and the cap keeps phonetic before skeleton
+    matches and, within those, names closest to the longest word in length.
+    """
+    table = models.PatientSearchToken.__table__
+    alpha_words = [w for w in words if w.isalpha()]
+    if not alpha_words:
+        return []
+    driver_word = max(alpha_words, key=len)
+    if len(driver_word) < MIN_WORD_PREFIX:
+        return []
+
+    postings = table.alias("postings")
+    d = select(postings.c.token, postings.c.patient_id).where(
+        postings.c.token.in_(word_keys(driver_word))
+    ).order_by(postings.c.token, postings.c.patient_id).limit(FUZZY_SCAN_LIMIT).subquery("driver")
+    conditions = []
+    for i, word in enumerate(w for w in words if w != driver_word):
+        o = table.alias(f"w{i}")
+        accepts = _prefix_range(o.c.token, word)
+        if word.isalpha() and len(word) >= MIN_WORD_PREFIX:
+            accepts = or_(accepts, o.c.token.in_(word_keys(word)))
+        conditions.append(exists().where(o.c.patient_id == d.c.patient_id, accepts))
+    conditions.append(~_listed_by_name_tiers(table, d.c.patient_id, words))
+    conditions.extend(not_identified(d.c.patient_id))
+
+    # Closest length of any name word (not a key token, those sort outside a-z)
+    r = table.alias("raw")
+    length_gap = select(func.min(func.abs(func.length(r.c.token) - len(driver_word)))).where(
+        r.c.patient_id == d.c.patient_id, r.c.token >= "a", r.c.token < "{"
+    ).scalar_subquery()
+    candidate_ids = list(dict.fromkeys(
+        row.patient_id for row in db.execute(
+            select(d.c.patient_id).where(*conditions)
+            .order_by(d.c.token, length_gap, d.c.patient_id).limit(FUZZY_CANDIDATES)
+        )
+    ))
+    if not candidate_ids:
+        return []
+
+    p = models.Patient.__table__
+    ranked = []
+    for row in db.execute(select(p.c.id, p.c.firstName, p.c.lastName).where(p.c.id.in_(candidate_ids))):
+        name_words = normalize_words(row.firstName) + normalize_words(row.lastName)
+        if not name_words:
+            continue
+        distance = sum(min(edit_distance(word, w) for w in name_words) for word in words)
+        ranked.append((f"{distance:04d}", row.id))
+    ranked.sort()
+    if after is not None:
+        ranked = [r for r in ranked if r > (after[0], after[1])]
+    return ranked[:n]
+
+def _name_tiers(words: list, not_identified) -> list:
+    """
+    Patients whose name has a token starting with every query word. The
+    longest word drives the token index scan (whole-word matches first, then
+    longer words alphabetically); the other words are checked per candidate
+    through (patient_id, token), so a trailing one-letter word stays cheap.
+    """
+    table = models.PatientSearchToken.__table__
+    driver_word = max(words, key=len)
+    others = list(words)
+    others.remove(driver_word)
+
+    d = table.alias("driver")
+    also_matches = []
+    for i, word in enumerate(others):
+        o = table.alias(f"w{i}")
+        also_matches.append(exists().where(o.c.patient_id == d.c.patient_id, _prefix_range(o.c.token, word)))
+    also_matches.extend(not_identified(d.c.patient_id))
+
+    tiers = [(TIER_NAME_EXACT, lambda after, n: _page(d.c.patient_id, None, [d.c.token == driver_word] + also_matches, after, n))]
+
+    if len(driver_word) >= MIN_WORD_PREFIX:
+        e = table.alias("seen")
+        prefix_match = [
+            d.c.token > driver_word, d.c.token < _upper_bound(driver_word),
+            # Once per patient: skip if an exact or an earlier prefix token already listed them
+            ~exists().where(
+                e.c.patient_id == d.c.patient_id, e.c.token >= driver_word, e.c.token < d.c.token
+            ),
+        ] + also_matches
+        tiers.append((TIER_NAME_PREFIX, lambda after, n: _page(d.c.patient_id, d.c.token, prefix_match, after, n)))
+    return tiers
+
+def encode_cursor(tier: int, key: str, patient_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([tier, key, patient_id]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        tier, key, patient_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(tier), str(key), int(patient_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def search_patients(db: Session, query: str, limit: int = DEFAULT_LIMIT, cursor: Optional[str] = None) -> tuple:
+    """
+    Ranked patient search. Order: exact NIK / phone / MRN, then NIK, phone and
+    MRN prefixes, then patients with a whole-word name match, then name-word
+    prefixes, then spelling variants by edit distance. Returns (patients,
+    next_cursor); next_cursor is None on the last page. Raises ValueError on
+    a bad cursor.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    query = (query or "").strip()
+    words = normalize_words(query)[:MAX_QUERY_WORDS]
+
+    start_tier, after = TIER_IDENTIFIER_EXACT, None
+    if cursor:
+        start_tier, key, patient_id = decode_cursor(cursor)
+        after = (key, patient_id)
+
+    rows = []
+    for tier, build in _tiers(db, query, words):
+        if tier < start_tier:
+            continue
+        page = build(after if tier == start_tier else None, limit + 1 - len(rows))
+        if tier != TIER_NAME_FUZZY:
+            page = [(row.key, row.patient_id) for row in db.execute(page)]
+        rows.extend((tier, key, patient_id) for key, patient_id in page)
+        if len(rows) > limit:
+            break
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*rows[-1])
+
+    ids = [patient_id for _, _, patient_id in rows]
+    by_id = {p.id: p for p in db.query(models.Patient).filter(models.Patient.id.in_(ids))} if ids else {}
+    return [by_id[i] for i in ids if i in by_id], next_cursor
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+import time
+from .. import clinic_time
+from .queue_events import serialize_tickets
+
+# Wait estimates depend on elapsed consultation time, so a snapshot is also
+# rebuilt when it is older than this, even without writes
+ESTIMATE_REFRESH_SECONDS = 60
+
+class QueueSnapshotCache:
+    """
+    Pre-serialized JSON of today's queue, tagged with a version number.
+
+    Writers (add_to_queue, update_queue_status, scheduler.cleanup_queues) call
+    bump() after they commit; changes made by other workers arrive through the
+    queue event broker, which bumps too. A snapshot is rebuilt only when the
+    version or the local day changed since the last build, or every
+    ESTIMATE_REFRESH_SECONDS so the wait estimates in it keep moving. Only one
+    caller rebuilds at a time; the others wait for its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._version = 0
+        self._key = None
+        self._etag = None
+        self._body = None
+        self._estimates = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.last_rebuild_ms = 0.0
+        self.total_rebuild_ms = 0.0
+        self.max_rebuild_ms = 0.0
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def bump(self, *_):
+        with self._lock:
+            self._version += 1
+
+    def _current_key(self) -> tuple:
+        return clinic_time.local_today(), self._version, int(time.time() // ESTIMATE_REFRESH_SECONDS)
+
+    def _lookup(self, build) -> tuple:
+        with self._lock:
+            key = self._current_key()
+            if self._key == key:
+                self.hits += 1
+                return self._etag, self._body, self._estimates
+
+        with self._build_lock:
+            with self._lock:
+                if self._key == key:
+                    # Built by the caller we waited for
+                    self.hits += 1
+                    return self._etag, self._body, self._estimates
+                self.misses += 1
+
+            start = time.perf_counter()
+            tickets = build()
+            body = serialize_tickets(tickets).encode("utf-8")
+            estimates = {q.id: q.estimatedWaitMinutes for q in tickets if q.estimatedWaitMinutes is not None}
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            # Content hash, so every worker hands out the same ETag for the same queue
+            etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+            with self._lock:
+                self.rebuilds += 1
+                self.last_rebuild_ms = elapsed_ms
+                self.total_rebuild_ms += elapsed_ms
+                self.max_rebuild_ms = max(self.max_rebuild_ms, elapsed_ms)
+                # Don't cache if a write landed while we were building
+                if self._version == key[1]:
+                    self._key, self._etag, self._body, self._estimates = key, etag, body, estimates
+            return etag, body, estimates
+
+    def get(self, build) -> tuple:
+        """(etag, body) for today's queue; build() returns today's annotated tickets on a miss."""
+        etag, body, _ = self._lookup(build)
+        return etag, body
+
+    def estimates(self, build) -> dict:
+        """{ticket id: estimatedWaitMinutes} of the waiting tickets in the same snapshot. Don't mutate."""
+        return self._lookup(build)[2]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "rebuilds": self.rebuilds,
+                "last_rebuild_ms": round(self.last_rebuild_ms, 3),
+                "avg_rebuild_ms": round(self.total_rebuild_ms / self.rebuilds, 3) if self.rebuilds else 0.0,
+                "max_rebuild_ms": round(self.max_rebuild_ms, 3),
+            }
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+queue_snapshot_cache = QueueSnapshotCache()
@@ -0,0 +1,81 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+from .. import models, clinic_time
+
+# Dialects with SELECT ... FOR UPDATE SKIP LOCKED (MySQL 8+, PostgreSQL 9.5+)
+SKIP_LOCKED_DIALECTS = ("mysql", "postgresql")
+# Head-of-queue candidates read per attempt
+CLAIM_BATCH_SIZE = 5
+MAX_CLAIM_ATTEMPTS = 20
+
+class ClaimContended(Exception):
+    """Every candidate read went to another room first; patients are still waiting, call again."""
+
+QUEUE_ORDER = (
+    models.PatientQueue.isPriority.desc(),
+    models.PatientQueue.appointmentTime.asc(),
+    models.PatientQueue.id.asc(),
+)
+
+def _candidate_ids(db: Session, doctor_id: Optional[int], polyclinic: Optional[str], exclude: set) -> list:
+    scope = []
+    if doctor_id is not None:
+        scope.append(models.PatientQueue.medicalFacilityPolyDoctorId == doctor_id)
+    if polyclinic:
+        scope.append(models.PatientQueue.polyclinic == polyclinic)
+
+    query = db.query(models.PatientQueue.id).filter(
+        models.PatientQueue.status == "Waiting",
+        models.PatientQueue.appointmentTime >= clinic_time.today_start_utc(),
+        and_(*scope)
+    )
+    if exclude:
+        query = query.filter(models.PatientQueue.id.notin_(exclude))
+    return [row.id for row in query.order_by(*QUEUE_ORDER).limit(CLAIM_BATCH_SIZE)]
+
+def claim_next_ticket(db: Session, doctor_id: Optional[int] = None, polyclinic: Optional[str] = None) -> Optional[models.PatientQueue]:
+    """
+    Move the highest-priority waiting ticket for a doctor, a polyclinic, or a
+    doctor within a polyclinic (both given) to 'In Consultation' and return
+    it, or None if nobody is waiting. Runs in the caller's transaction; two
+    rooms calling at once never get the same ticket.
+
+    Candidates are read without locks first and only those rows are locked by
+    primary key, so a room never holds locks on the rest of the queue. Raises
+    ClaimContended if other rooms won every candidate for MAX_CLAIM_ATTEMPTS
+    reads: the queue is not empty, the caller should roll back and retry.
+    """
+    use_skip_locked = db.get_bind().dialect.name in SKIP_LOCKED_DIALECTS
+    tried = set()
+
+    for _ in range(MAX_CLAIM_ATTEMPTS):
+        candidate_ids = _candidate_ids(db, doctor_id, polyclinic, tried)
+        if not candidate_ids:
+            return None
+        tried.update(candidate_ids)
+
+        if use_skip_locked:
+            # Rows another room is claiming right now are skipped, not waited on
+            ticket = db.query(models.PatientQueue).filter(
+                models.PatientQueue.id.in_(candidate_ids),
+                models.PatientQueue.status == "Waiting"
+            ).order_by(*QUEUE_ORDER).with_for_update(skip_locked=True).first()
+            if ticket:
+                ticket.status = "In Consultation"
+                ticket.calledAt = datetime.utcnow()
+                return ticket
+            continue
+
+        # No row locks (SQLite): compare-and-set on status, next candidate if another room won
+        for queue_id in candidate_ids:
+            claimed = db.query(models.PatientQueue).filter(
+                models.PatientQueue.id == queue_id,
+                models.PatientQueue.status == "Waiting"
+            ).update({"status": "In Consultation", "calledAt": datetime.utcnow()}, synchronize_session=False)
+            if claimed:
+                return db.query(models.PatientQueue).populate_existing().filter(
+                    models.PatientQueue.id == queue_id
+                ).first()
+    raise ClaimContended()
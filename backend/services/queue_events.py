@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from .. import models, schemas
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+EVENT_CREATED = "created"
+EVENT_STATUS_CHANGED = "status_changed"
+EVENT_COMPLETED = "completed"
+# Stream-only: {ticket id: estimatedWaitMinutes}, not stored in queue_events
+EVENT_ESTIMATES = "estimates"
+
+POLL_INTERVAL_SECONDS = 0.5
+POLL_BATCH_SIZE = 500
+SUBSCRIBER_BUFFER = 1000
+# Ids are handed out at INSERT but become visible at COMMIT, so a lower id can
+# show up after a higher one. A missing id is waited for this long before it
+# is treated as a rolled-back insert.
+GAP_TIMEOUT_SECONDS = 5
+EVENT_RETENTION = timedelta(days=2)
+
+def serialize_ticket(queue_item: models.PatientQueue) -> str:
+    return schemas.PatientQueue.model_validate(queue_item).model_dump_json()
+
+def serialize_tickets(queue_items) -> str:
+    return "[" + ",".join(serialize_ticket(q) for q in queue_items) + "]"
+
+def record_queue_event(db: Session, event_type: str, queue_item: models.PatientQueue):
+    """
+    Append an event for the live stream. Call before db.commit() so the event
+    is written in the same transaction as the ticket change.
+    Returns the serialized ticket.
+    """
+    payload = serialize_ticket(queue_item)
+    db.add(models.QueueEvent(
+        eventType=event_type,
+        queueId=queue_item.id,
+        payload=payload
+    ))
+    return payload
+
+def status_event_type(status: str) -> str:
+    return EVENT_COMPLETED if status == "Completed" else EVENT_STATUS_CHANGED
+
+def format_sse(data: str, event: Optional[str] = None, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+def prune_queue_events(db: Session) -> int:
+    cutoff = datetime.utcnow() - EVENT_RETENTION
+    deleted = db.query(models.QueueEvent).filter(models.QueueEvent.created_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+class Subscriber:
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        # Set when the client fell too far behind; it gets a fresh snapshot instead
+        self.overflowed = False
+
+class QueueEventBroker:
+    """
+    Fans queue events out to the stream connections of this worker.
+
+    The queue_events table is the broker: every uvicorn worker tails it with one
+    cheap indexed query per poll interval (no matter how many displays are
+    connected) and pushes new rows to its local subscribers. It stands in for a
+    Redis/NATS pub-sub channel; swapping one in only means replacing
+    _fetch_since() and the publish side in record_queue_event().
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        # Every id <= _last_id has been dispatched (or given up on). Events go out
+        # strictly in id order, so this is also the watermark for snapshots/replay.
+        self._last_id = 0
+        # Committed events above a gap, held back until the gap closes -> event;
+        # missing ids below them -> first seen time
+        self._pending = {}
+        self._gaps = {}
+        self._listeners = []
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, callback):
+        """callback(event) runs for every new event, whichever worker wrote it."""
+        self._listeners.append(callback)
+
+    def _fetch_since(self, last_id: int, limit: int = POLL_BATCH_SIZE) -> List[models.QueueEvent]:
+        db = SessionLocal()
+        try:
+            return db.query(models.QueueEvent).filter(
+                models.QueueEvent.id > last_id
+            ).order_by(models.QueueEvent.id.asc()).limit(limit).all()
+        finally:
+            db.close()
+
+    def _latest_id(self) -> int:
+        db = SessionLocal()
+        try:
+            return db.query(func.max(models.QueueEvent.id)).scalar() or 0
+        finally:
+            db.close()
+
+    async def start(self):
+        if self._task and not self._task.done():
+            return
+        self._last_id = await run_in_threadpool(self._latest_id)
+        self._task = asyncio.create_task(self._poll_loop())
+
+    async def _poll_loop(self):
+        while True:
+            try:
+                events = await run_in_threadpool(self._fetch_since, self._last_id)
+                fresh = [ev for ev in events if ev.id not in self._pending]
+                for ev in fresh:
+                    self._pending[ev.id] = ev
+                self._release()
+                if len(fresh) == POLL_BATCH_SIZE:
+                    continue # Catching up, poll again right away
+            except Exception as e:
+                logger.error(f"Queue event poll failed: {e}")
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+    def _release(self):
+        """Dispatch pending events in contiguous id order, stopping at the first open gap."""
+        if not self._pending:
+            return
+        now = asyncio.get_running_loop().time()
+        for gap_id in range(self._last_id + 1, max(self._pending)):
+            if gap_id not in self._pending:
+                self._gaps.setdefault(gap_id, now)
+
+        while True:
+            next_id = self._last_id + 1
+            ev = self._pending.pop(next_id, None)
+            if ev is not None:
+                self._dispatch(ev)
+            elif next_id in self._gaps and now - self._gaps[next_id] > GAP_TIMEOUT_SECONDS:
+                pass # Never committed
+            else:
+                break
+            self._gaps.pop(next_id, None)
+            self._last_id = next_id
+
+    def _dispatch(self, ev: models.QueueEvent):
+        for callback in self._listeners:
+            try:
+                callback(ev)
+            except Exception as e:
+                logger.error(f"Queue event listener failed: {e}")
+        for sub in list(self._subscribers):
+            if sub.overflowed:
+                continue
+            try:
+                sub.queue.put_nowait(ev)
+            except asyncio.QueueFull:
+                sub.overflowed = True
+
+    async def subscribe(self) -> Subscriber:
+        await self.start()
+        sub = Subscriber()
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subscribers.discard(sub)
+
+    def events_since(self, last_id: int) -> Optional[List[models.QueueEvent]]:
+        """
+        Events after last_id for a reconnecting client, or None if some of them
+        were already pruned (the client must start over from a snapshot).
+        Stops at the dispatch watermark; anything later arrives through the
+        subscription in id order.
+        """
+        watermark = self._last_id
+        db = SessionLocal()
+        try:
+            oldest = db.query(func.min(models.QueueEvent.id)).scalar()
+            if oldest is None or oldest > last_id + 1:
+                return None
+            return db.query(models.QueueEvent).filter(
+                models.QueueEvent.id > last_id,
+                models.QueueEvent.id <= watermark
+            ).order_by(models.QueueEvent.id.asc()).all()
+        finally:
+            db.close()
+
+    def snapshot(self, query_today) -> tuple:
+        """
+        (event id, JSON list of today's tickets). The id is the dispatch
+        watermark, read before the tickets: every event up to it is committed and
+        in the snapshot, and every later one is still to be dispatched (a late
+        commit below max(id) included).
+        """
+        last_id = self._last_id
+        db = SessionLocal()
+        try:
+            return last_id, serialize_tickets(query_today(db))
+        finally:
+            db.close()
+
+queue_event_broker = QueueEventBroker()
@@ -0,0 +1,53 @@
+from datetime import date
+from sqlalchemy.orm import Session
+from .. import models
+
+def queue_prefix(queue_type: str, is_priority: bool) -> str:
+    # Determine Prefix (e.g. D = Doctor, P = Polyclinic, DP = Doctor Priority)
+    base_code = "P" if queue_type == "Polyclinic" else "D"
+    prio_code = "P" if is_priority else ""
+    return f"{base_code}{prio_code}"
+
+def _counter_upsert(dialect_name: str, key: dict):
+    """
+    INSERT the day's counter row at 1, or bump it by one if it already exists.
+    A single statement, so the row lock is taken (and held until commit) by the
+    database itself instead of a read-then-write in Python.
+    """
+    values = dict(key, lastNumber=1)
+    bump = models.QueueCounter.lastNumber + 1
+
+    if dialect_name == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        return insert(models.QueueCounter).values(**values).on_duplicate_key_update(lastNumber=bump)
+
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Queue counter upsert not supported on {dialect_name}")
+
+    return insert(models.QueueCounter).values(**values).on_conflict_do_update(
+        index_elements=["counterDate", "queueType", "isPriority"],
+        set_={"lastNumber": bump}
+    )
+
+def allocate_queue_number(db: Session, queue_type: str, is_priority: bool, counter_date: date) -> str:
+    """
+    Reserve the next ticket number for (local day, queueType, isPriority).
+
+    Runs inside the caller's transaction: the counter row stays locked until the
+    caller commits, and a rollback gives the number back.
+    """
+    key = {"counterDate": counter_date, "queueType": queue_type, "isPriority": bool(is_priority)}
+    db.execute(_counter_upsert(db.get_bind().dialect.name, key))
+
+    # Same transaction, so this reads our own increment
+    new_num = db.query(models.QueueCounter.lastNumber).filter(
+        models.QueueCounter.counterDate == counter_date,
+        models.QueueCounter.queueType == queue_type,
+        models.QueueCounter.isPriority == bool(is_priority)
+    ).scalar()
+
+    return f"{queue_prefix(queue_type, is_priority)}{new_num:03d}"
@@ -0,0 +1,33 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, at most `burst`
+    banked. acquire() blocks until a token is available, so callers sharing
+    a bucket never exceed the rate on average.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+                self.waited_seconds += wait
+            time.sleep(wait)
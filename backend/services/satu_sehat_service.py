@@ -1,8 +1,11 @@
 import os
-import requests
-import time
 from pathlib import Path
 from dotenv import load_dotenv
+from .http_pool import http_pool, timeout, async_timeout
+from .oauth_token import TokenManager
+from .fhir_bundle import TransactionBatcher, TransactionDeferred, BUNDLE_TIMEOUT_SECONDS, REJECTED_STATUSES, next_link
+from .diagnostic_reports import DiagnosticReportCache
+from .nik_cache import nik_cache, KIND_PATIENT, KIND_PRACTITIONER
 
 # Explicitly load .env from backend/ directory
 env_path = Path(__file__).parent.parent / '.env'
@@ -12,6 +15,11 @@ SATUSEHAT_AUTH_URL = os.getenv("SATUSEHAT_AUTH_URL")
 SATUSEHAT_BASE_URL = os.getenv("SATUSEHAT_BASE_URL")
 SATUSEHAT_CLIENT_ID = os.getenv("SATUSEHAT_CLIENT_ID")
 SATUSEHAT_CLIENT_SECRET = os.getenv("SATUSEHAT_CLIENT_SECRET")
+# KFA is often on Staging even if FHIR is on Dev, or user requested specific URL.
+# User specified: https://api-satusehat-stg.dto.kemkes.go.id/kfa-v2
+KFA_BASE_HOST = os.getenv("KFA_BASE_URL", "https://api-satusehat-stg.dto.kemkes.go.id")
+# DiagnosticReports per search page
+REPORT_PAGE_SIZE = int(os.getenv("SATUSEHAT_REPORT_PAGE_SIZE", "50"))
 
 class SatuSehatClient:
     def __init__(self):
@@ -19,17 +27,25 @@ class SatuSehatClient:
         self.base_url = SATUSEHAT_BASE_URL
         self.client_id = SATUSEHAT_CLIENT_ID
         self.client_secret = SATUSEHAT_CLIENT_SECRET
-        self._access_token = None
-        self._token_expiry = 0
+        self.tokens = TokenManager("satusehat", self._fetch_token)
+        self.bundles = TransactionBatcher("satusehat", self._post_bundle, self._create_resource)
+        self.diagnostic_reports = DiagnosticReportCache(self.iter_diagnostic_reports, self._parse_diagnostic_report)
+        self.session = http_pool.session("satusehat")
 
     def get_access_token(self):
         """
         Returns a valid access token. Refreshes if expired.
         """
-        if self._access_token and time.time() < self._token_expiry:
-            return self._access_token
+        return self.tokens.get()
 
+    def _fetch_token(self):
+        """(access_token, expires_in) from the OAuth endpoint; called by self.tokens, one at a time."""
         print("Refeshing SatuSehat Token...")
+        url, headers, data = self._token_request()
+        response = self.session.post(url, headers=headers, data=data, timeout=timeout(10))
+        return self._parse_token_response(response)
+
+    def _token_request(self) -> tuple:
         url = f"{self.auth_url}/accesstoken?grant_type=client_credentials"
         headers = {
             "Content-Type": "application/x-www-form-urlencoded"
@@ -38,24 +54,31 @@ class SatuSehatClient:
             "client_id": self.client_id,
             "client_secret": self.client_secret
         }
-
-        try:
-            response = requests.post(url, headers=headers, data=data, timeout=10)
-            if response.status_code == 200:
-                result = response.json()
-                self._access_token = result.get("access_token")
-                # expires_in is in seconds (e.g. 3599). Subtract a buffer (e.g. 60s)
-                expires_in = int(result.get("expires_in", 3600))
-                self._token_expiry = time.time() + expires_in - 60
-                print("SatuSehat Token Refreshed.")
-                return self._access_token
-            else:
-                print(f"SatuSehat Token Error: {response.text}")
-                return None
-        except Exception as e:
-            print(f"SatuSehat Connection Error: {e}")
+        return url, headers, data
+
+    def _parse_token_response(self, response):
+        if response.status_code == 200:
+            result = response.json()
+            # expires_in is in seconds (e.g. 3599); the token manager keeps a safety margin
+            print("SatuSehat Token Refreshed.")
+            return result.get("access_token"), int(result.get("expires_in", 3600))
+        else:
+            print(f"SatuSehat Token Error: {response.text}")
             return None
 
+    def _send(self, method: str, url: str, token: str, headers: dict, **kwargs):
+        """
+        Request with the bearer token. A 401 means the token was revoked or
+        expired early: it is replaced (once for all callers) and the request
+        sent one more time.
+        """
+        response = self.session.request(method, url, headers={**headers, "Authorization": f"Bearer {token}"}, **kwargs)
+        if response.status_code == 401:
+            token = self.tokens.get(stale=token)
+            if token:
+                response = self.session.request(method, url, headers={**headers, "Authorization": f"Bearer {token}"}, **kwargs)
+        return response
+
     def post_patient(self, patient_data: dict):
         """
         Sync patient to SatuSehat.
@@ -111,7 +134,7 @@ class SatuSehatClient:
 
         try:
             print(f"Searching SatuSehat by Demographics: {params}")
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            response = self._send("GET", url, token, headers=headers, params=params, timeout=timeout(10))
             if response.status_code == 200:
                 bundle = response.json()
                 if bundle.get("total", 0) > 0 and bundle.get("entry"):
@@ -123,15 +146,22 @@ class SatuSehatClient:
             return None
 
     def _create_new_patient_on_satusehat(self, patient_data: dict):
-        token = self.get_access_token()
-        if not token: return None
-        
-        url = f"{self.base_url}/Patient"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
+        ihs = self._create_resource(self._patient_resource(patient_data))
+        if ihs:
+            # The NIK was just looked up and cached as not registered
+            nik_cache.invalidate(patient_data.get("identityCard"), KIND_PATIENT)
+        return ihs
+
+    def create_patients(self, patients: list) -> list:
+        """
+        Create many Patients through transaction Bundles (see fhir_bundle).
+        Returns the IHS numbers, None where creation failed, in input order.
+        """
+        ihs_numbers = self.bundles.push([self._patient_resource(p) for p in patients])
+        nik_cache.invalidate_many([p.get("identityCard") for p, ihs in zip(patients, ihs_numbers) if ihs], KIND_PATIENT)
+        return ihs_numbers
+
+    def _patient_resource(self, patient_data: dict) -> dict:
         # Map Gender
         gender = patient_data.get("gender", "unknown").lower()
         if gender not in ["male", "female", "other", "unknown"]:
@@ -180,25 +210,64 @@ class SatuSehatClient:
             ]
         }
         
+        return payload
+
+    def _create_resource(self, resource: dict):
+        """POST one resource to /<resourceType>; returns its new id or None."""
+        kind = resource["resourceType"]
+        token = self.get_access_token()
+        if not token: return None
+
+        url = f"{self.base_url}/{kind}"
+        headers = {
+            "Content-Type": "application/json"
+        }
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=15)
+            response = self._send("POST", url, token, headers=headers, json=resource, timeout=timeout(15))
             if response.status_code in [200, 201]:
                 data = response.json()
                 ihs = data.get("id")
-                print(f"Successfully Created Patient. IHS: {ihs}")
+                print(f"Successfully Created {kind}. IHS: {ihs}")
                 return ihs
             else:
-                print(f"Failed to create patient ({response.status_code}): {response.text}")
+                print(f"Failed to create {kind.lower()} ({response.status_code}): {response.text}")
                 return None
         except Exception as e:
-            print(f"Create Patient Request Error: {e}")
+            print(f"Create {kind} Request Error: {e}")
             return None
 
+    def _post_bundle(self, bundle: dict):
+        """
+        POST a transaction Bundle to the FHIR base URL. Returns the
+        transaction-response, None if the server rejected its content (400 /
+        422); raises TransactionDeferred when the server is unavailable (429,
+        5xx, a 401 left after the token refresh), and other errors when the
+        outcome is unknown (network).
+        """
+        token = self.get_access_token()
+        if not token:
+            raise RuntimeError("no SatuSehat access token")
+        headers = {
+            "Content-Type": "application/json"
+        }
+        response = self._send("POST", self.base_url, token, headers=headers, json=bundle, timeout=timeout(BUNDLE_TIMEOUT_SECONDS))
+        if response.status_code in [200, 201]:
+            return response.json()
+        if response.status_code not in REJECTED_STATUSES:
+            raise TransactionDeferred(f"SatuSehat answered {response.status_code}: {response.text[:200]}")
+        print(f"Transaction Bundle of {len(bundle['entry'])} rejected ({response.status_code}): {response.text[:500]}")
+        return None
+
     def search_patient_by_nik(self, nik: str):
         """
         Search patient by NIK using FHIR Endpoint.
         GET /Patient?identifier=https://fhir.kemkes.go.id/id/nik|[NIK]
+        Answers are cached (services/nik_cache.py).
         """
+        return nik_cache.lookup(KIND_PATIENT, nik, self._fetch_patient_by_nik)
+
+    def _fetch_patient_by_nik(self, nik: str):
+        """(parsed patient or None if not registered, whether that answer may be cached)"""
         token = self.get_access_token()
         if not token:
             raise Exception("Failed to get Access Token")
@@ -213,22 +282,22 @@ class SatuSehatClient:
 
         try:
             print(f"Searching SatuSehat for NIK: {nik}")
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            response = self._send("GET", url, token, headers=headers, params=params, timeout=timeout(10))
             if response.status_code == 200:
                 bundle = response.json()
                 if bundle.get("total", 0) > 0 and bundle.get("entry"):
                     # Success
                     entry = bundle["entry"][0]["resource"]
-                    return self._parse_patient_resource(entry)
+                    return self._parse_patient_resource(entry), True
                 else:
                     print("No patient found with that NIK")
-                    return None
+                    return None, True
             else:
                 print(f"SatuSehat Search Error ({response.status_code}): {response.text}")
-                return None
+                return None, False
         except Exception as e:
             print(f"SatuSehat Request Error: {e}")
-            return None
+            return None, False
 
     def _parse_patient_resource(self, resource: dict):
         """
@@ -280,10 +349,7 @@ class SatuSehatClient:
         if not token:
             raise Exception("Failed to get Access Token")
 
-        # KFA is often on Staging even if FHIR is on Dev, or user requested specific URL.
-        # User specified: https://api-satusehat-stg.dto.kemkes.go.id/kfa-v2
-        base_host = "https://api-satusehat-stg.dto.kemkes.go.id"
-        url = f"{base_host}/kfa-v2/products/all"
+        url = f"{KFA_BASE_HOST}/kfa-v2/products/all"
         
         headers = {
             "Authorization": f"Bearer {token}"
@@ -298,27 +364,11 @@ class SatuSehatClient:
         try:
             print(f"Searching KFA URL: {url}")
             print(f"Params: {params}")
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            response = self._send("GET", url, token, headers=headers, params=params, timeout=timeout(10))
             
             if response.status_code == 200:
                 data = response.json()
-                # Debug Logging
-                import json
-                print(f"KFA Raw Response: {json.dumps(data)[:500]}...") 
-                
-                # Check different response structures just in case
-                items = []
-                if "items" in data:
-                     items = data["items"].get("data", [])
-                elif "result" in data:
-                     items = data["result"].get("data", [])
-                elif "data" in data:
-                     # Direct data array or data wrapper?
-                     if isinstance(data["data"], list):
-                         items = data["data"]
-                     else:
-                         items = data.get("data", {}).get("data", [])
-                
+                items = self._kfa_items(data)
                 print(f"Found {len(items)} items.")
                 return [self._parse_kfa_product(i) for i in items]
             else:
@@ -328,6 +378,44 @@ class SatuSehatClient:
             print(f"KFA Request Error: {e}")
             return []
 
+    def fetch_kfa_page(self, page: int, size: int, from_date: str = None) -> list:
+        """
+        One page of the KFA farmasi catalog, raw items, for the local mirror
+        (services/kfa_catalog.py). from_date (YYYY-MM-DD) limits it to
+        products updated since. Raises on errors.
+        """
+        token = self.get_access_token()
+        if not token:
+            raise Exception("Failed to get Access Token")
+
+        url = f"{KFA_BASE_HOST}/kfa-v2/products/all"
+        params = {
+            "page": page,
+            "size": size,
+            "product_type": "farmasi"
+        }
+        if from_date:
+            params["from_date"] = from_date
+        response = self._send("GET", url, token, headers={}, params=params, timeout=timeout(30))
+        if response.status_code != 200:
+            raise Exception(f"KFA catalog page {page} failed ({response.status_code}): {response.text[:200]}")
+        return self._kfa_items(response.json())
+
+    def _kfa_items(self, data: dict) -> list:
+        # Check different response structures just in case
+        items = []
+        if "items" in data:
+             items = data["items"].get("data", [])
+        elif "result" in data:
+             items = data["result"].get("data", [])
+        elif "data" in data:
+             # Direct data array or data wrapper?
+             if isinstance(data["data"], list):
+                 items = data["data"]
+             else:
+                 items = data.get("data", {}).get("data", [])
+        return items
+
     def _parse_kfa_product(self, item: dict):
         """
         Parse KFA Item to simplified format
@@ -356,39 +444,47 @@ class SatuSehatClient:
 
     def get_diagnostic_reports(self, ihs_number: str):
         """
-        Fetch Diagnostic Reports for a specific patient (IHS Number).
-        GET /DiagnosticReport?subject={ihs_number}
+        Fetch Diagnostic Reports for a specific patient (IHS Number),
+        through self.diagnostic_reports (only changes are fetched for a
+        patient seen before).
         """
-        token = self.get_access_token()
-        if not token:
-            raise Exception("Failed to get Access Token")
+        try:
+            return list(self.diagnostic_reports.stream(ihs_number))
+        except Exception as e:
+            print(f"SatuSehat Request Error: {e}")
+            return []
 
+    def iter_diagnostic_reports(self, ihs_number: str, since: str = None):
+        """
+        DiagnosticReport resources of a patient, latest first.
+        GET /DiagnosticReport?subject={ihs_number}, then each Bundle.link "next",
+        requested only once the caller has consumed the previous page.
+        since limits the search to reports updated at or after that
+        meta.lastUpdated. Raises on errors.
+        """
         url = f"{self.base_url}/DiagnosticReport"
-        headers = {
-            "Authorization": f"Bearer {token}"
-        }
         params = {
             "subject": ihs_number,
-            "_sort": "-date" # Sort by latest
+            "_sort": "-date", # Sort by latest
+            "_count": REPORT_PAGE_SIZE
         }
-
-        try:
-            print(f"Fetching Diagnostic Reports for IHS: {ihs_number}")
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-            
-            if response.status_code == 200:
-                bundle = response.json()
-                if bundle.get("total", 0) > 0 and bundle.get("entry"):
-                    items = [e["resource"] for e in bundle["entry"]]
-                    return [self._parse_diagnostic_report(i) for i in items]
-                else:
-                    return []
-            else:
-                print(f"SatuSehat DiagnosticReport Error ({response.status_code}): {response.text}")
-                return []
-        except Exception as e:
-            print(f"SatuSehat Request Error: {e}")
-            return []
+        if since:
+            params["_lastUpdated"] = f"ge{since}"
+
+        print(f"Fetching Diagnostic Reports for IHS: {ihs_number}" + (f" updated since {since}" if since else ""))
+        while url:
+            # A long history can outlive a token
+            token = self.get_access_token()
+            if not token:
+                raise Exception("Failed to get Access Token")
+            response = self._send("GET", url, token, headers={}, params=params, timeout=timeout(10))
+            if response.status_code != 200:
+                raise Exception(f"SatuSehat DiagnosticReport Error ({response.status_code}): {response.text}")
+            bundle = response.json()
+            for entry in bundle.get("entry") or []:
+                yield entry["resource"]
+            # The next link carries the search parameters
+            url, params = next_link(bundle, self.base_url), None
 
     def _parse_diagnostic_report(self, resource: dict):
         """
@@ -432,7 +528,12 @@ class SatuSehatClient:
         """
         Search practitioner by NIK using FHIR Endpoint.
         GET /Practitioner?identifier=https://fhir.kemkes.go.id/id/nik|[NIK]
+        Answers are cached (services/nik_cache.py).
         """
+        return nik_cache.lookup(KIND_PRACTITIONER, nik, self._fetch_practitioner_by_nik)
+
+    def _fetch_practitioner_by_nik(self, nik: str):
+        """(parsed practitioner or None if not registered, whether that answer may be cached)"""
         token = self.get_access_token()
         if not token:
             raise Exception("Failed to get Access Token")
@@ -447,40 +548,47 @@ class SatuSehatClient:
 
         try:
             print(f"Searching SatuSehat Practitioner for NIK: {nik}")
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            response = self._send("GET", url, token, headers=headers, params=params, timeout=timeout(10))
             if response.status_code == 200:
                 bundle = response.json()
                 if bundle.get("total", 0) > 0 and bundle.get("entry"):
                     entry = bundle["entry"][0]["resource"]
-                    return {
-                        "ihs_number": entry.get("id"),
-                        "name": entry.get("name", [{}])[0].get("text", "Unknown"),
-                        "active": entry.get("active", False)
-                    }
+                    return self._parse_practitioner_resource(entry), True
                 else:
                     print("No practitioner found with that NIK")
-                    return None
+                    return None, True
             else:
                 print(f"SatuSehat Practitioner Search Error ({response.status_code}): {response.text}")
-                return None
+                return None, False
         except Exception as e:
             print(f"SatuSehat Request Error: {e}")
-            return None
+            return None, False
+
+    def _parse_practitioner_resource(self, resource: dict):
+        return {
+            "ihs_number": resource.get("id"),
+            "name": resource.get("name", [{}])[0].get("text", "Unknown"),
+            "active": resource.get("active", False)
+        }
 
     def create_practitioner_on_satusehat(self, doctor_data: dict):
         """
         Create a new Practitioner in SatuSehat
         POST /Practitioner
         """
-        token = self.get_access_token()
-        if not token: return None
-        
-        url = f"{self.base_url}/Practitioner"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
+        print(f"Creating Practitioner: {doctor_data.get('namaDokter', 'Unknown')}...")
+        ihs = self._create_resource(self._practitioner_resource(doctor_data))
+        if ihs:
+            nik_cache.invalidate(doctor_data.get("identityCard"), KIND_PRACTITIONER)
+        return ihs
+
+    def create_practitioners(self, practitioners: list) -> list:
+        """create_patients() for Practitioners (doctors and pharmacists)."""
+        ihs_numbers = self.bundles.push([self._practitioner_resource(d) for d in practitioners])
+        nik_cache.invalidate_many([d.get("identityCard") for d, ihs in zip(practitioners, ihs_numbers) if ihs], KIND_PRACTITIONER)
+        return ihs_numbers
+
+    def _practitioner_resource(self, doctor_data: dict) -> dict:
         name_text = doctor_data.get("namaDokter", "Unknown")
         
         # Simple Gender Guessing for Dummy Data (Optional, default unknown)
@@ -512,20 +620,7 @@ class SatuSehatClient:
             "birthDate": "1990-01-01" # Dummy birthdate mandated
         }
         
-        try:
-            print(f"Creating Practitioner: {name_text}...")
-            response = requests.post(url, headers=headers, json=payload, timeout=15)
-            if response.status_code in [200, 201]:
-                data = response.json()
-                ihs = data.get("id")
-                print(f"Successfully Created Practitioner. IHS: {ihs}")
-                return ihs
-            else:
-                print(f"Failed to create practitioner ({response.status_code}): {response.text}")
-                return None
-        except Exception as e:
-            print(f"Create Practitioner Request Error: {e}")
-            return None
+        return payload
 
     def create_coverage(self, ihs_number: str, insurance_name: str, insurance_number: str, method: str):
         """
@@ -582,7 +677,7 @@ class SatuSehatClient:
 
         try:
             print(f"Creating Coverage for {ihs_number} - {payor_name}...")
-            response = requests.post(url, headers=headers, json=payload, timeout=15)
+            response = self._send("POST", url, token, headers=headers, json=payload, timeout=timeout(15))
             if response.status_code in [200, 201]:
                 data = response.json()
                 cov_id = data.get("id")
@@ -596,3 +691,103 @@ class SatuSehatClient:
             return None
 
 satu_sehat_client = SatuSehatClient()
+
+class AsyncSatuSehatClient:
+    """
+    Non-blocking SatuSehatClient for async routes: the lookups are awaited on
+    the event loop instead of holding a threadpool slot while SatuSehat
+    answers. Shares the access token and the response parsing of the sync
+    client it wraps.
+    """
+
+    def __init__(self, client: SatuSehatClient):
+        self._client = client
+
+    @property
+    def http(self):
+        return http_pool.async_client("satusehat")
+
+    async def get_access_token(self):
+        return await self._client.tokens.aget()
+
+    async def _send(self, method: str, url: str, token: str, headers: dict, **kwargs):
+        """SatuSehatClient._send on the async client."""
+        response = await self.http.request(method, url, headers={**headers, "Authorization": f"Bearer {token}"}, **kwargs)
+        if response.status_code == 401:
+            token = await self._client.tokens.aget(stale=token)
+            if token:
+                response = await self.http.request(method, url, headers={**headers, "Authorization": f"Bearer {token}"}, **kwargs)
+        return response
+
+    async def _search_by_nik(self, resource_type: str, nik: str):
+        """(first {resource_type} resource whose NIK identifier matches or None, whether that answer may be cached)"""
+        token = await self.get_access_token()
+        if not token:
+            raise Exception("Failed to get Access Token")
+
+        url = f"{self._client.base_url}/{resource_type}"
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+        params = {
+            "identifier": f"https://fhir.kemkes.go.id/id/nik|{nik}"
+        }
+
+        try:
+            print(f"Searching SatuSehat {resource_type} for NIK: {nik}")
+            response = await self._send("GET", url, token, headers=headers, params=params, timeout=async_timeout(10))
+            if response.status_code == 200:
+                bundle = response.json()
+                if bundle.get("total", 0) > 0 and bundle.get("entry"):
+                    return bundle["entry"][0]["resource"], True
+                print(f"No {resource_type.lower()} found with that NIK")
+                return None, True
+            print(f"SatuSehat {resource_type} Search Error ({response.status_code}): {response.text}")
+            return None, False
+        except Exception as e:
+            print(f"SatuSehat Request Error: {e}")
+            return None, False
+
+    async def _fetch_patient_by_nik(self, nik: str):
+        resource, cacheable = await self._search_by_nik("Patient", nik)
+        return (self._client._parse_patient_resource(resource) if resource else None), cacheable
+
+    async def _fetch_practitioner_by_nik(self, nik: str):
+        resource, cacheable = await self._search_by_nik("Practitioner", nik)
+        return (self._client._parse_practitioner_resource(resource) if resource else None), cacheable
+
+    async def search_patient_by_nik(self, nik: str):
+        return await nik_cache.alookup(KIND_PATIENT, nik, self._fetch_patient_by_nik)
+
+    async def search_practitioner_by_nik(self, nik: str):
+        return await nik_cache.alookup(KIND_PRACTITIONER, nik, self._fetch_practitioner_by_nik)
+
+    async def search_kfa_products(self, query: str, page: int = 1, limit: int = 10):
+        token = await self.get_access_token()
+        if not token:
+            raise Exception("Failed to get Access Token")
+
+        url = f"{KFA_BASE_HOST}/kfa-v2/products/all"
+        headers = {
+            "Authorization": f"Bearer {token}"
+        }
+        params = {
+            "page": page,
+            "size": limit,
+            "product_type": "farmasi",
+            "keyword": query
+        }
+
+        try:
+            response = await self._send("GET", url, token, headers=headers, params=params, timeout=async_timeout(10))
+            if response.status_code == 200:
+                items = self._client._kfa_items(response.json())
+                print(f"Found {len(items)} items.")
+                return [self._client._parse_kfa_product(i) for i in items]
+            print(f"KFA Search Error ({response.status_code}): {response.text}")
+            return []
+        except Exception as e:
+            print(f"KFA Request Error: {e}")
+            return []
+
+async_satu_sehat_client = AsyncSatuSehatClient(satu_sehat_client)
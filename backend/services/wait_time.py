@@ -0,0 +1,166 @@
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, union_all
+from sqlalchemy.orm import Session
+from .. import models
+from .queue_events import EVENT_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = 0.2
+WINDOW_SIZE = 50
+DEFAULT_SERVICE_MINUTES = 10.0
+# Tickets left open over a break would drag the averages up
+MAX_SERVICE_MINUTES = 120
+REBUILD_DAYS = 14
+
+class ServiceTimeStats:
+    """Running consultation length (minutes): EWMA plus the last WINDOW_SIZE samples."""
+    __slots__ = ("ewma", "window", "count")
+
+    def __init__(self):
+        self.ewma = None
+        self.window = deque(maxlen=WINDOW_SIZE)
+        self.count = 0
+
+    def add(self, minutes: float):
+        self.ewma = minutes if self.ewma is None else EWMA_ALPHA * minutes + (1 - EWMA_ALPHA) * self.ewma
+        self.window.append(minutes)
+        self.count += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.window:
+            return None
+        ordered = sorted(self.window)
+        return ordered[min(len(ordered) - 1, round(p / 100 * (len(ordered) - 1)))]
+
+def _scope_keys(doctor_id, polyclinic) -> list:
+    keys = []
+    if doctor_id is not None:
+        keys.append(("doctor", doctor_id))
+    if polyclinic:
+        keys.append(("polyclinic", polyclinic))
+    return keys
+
+def _queue_key(queue_item) -> tuple:
+    # The line a ticket actually waits in: its doctor, else its polyclinic
+    if queue_item.medicalFacilityPolyDoctorId is not None:
+        return ("doctor", queue_item.medicalFacilityPolyDoctorId)
+    return ("polyclinic", queue_item.polyclinic or queue_item.queueType)
+
+def _parse_time(value) -> Optional[datetime]:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+class WaitTimeEstimator:
+    """
+    Streaming service-time statistics per doctor and per polyclinic, fed by
+    'completed' queue events (calledAt -> completedAt). Every worker listens to
+    the queue event broker, so all workers learn from every consultation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._overall = ServiceTimeStats()
+
+    def observe(self, doctor_id, polyclinic, called_at, completed_at):
+        if not called_at or not completed_at:
+            return
+        minutes = (completed_at - called_at).total_seconds() / 60
+        if minutes <= 0 or minutes > MAX_SERVICE_MINUTES:
+            return
+        with self._lock:
+            for key in _scope_keys(doctor_id, polyclinic):
+                stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = ServiceTimeStats()
+                stats.add(minutes)
+            self._overall.add(minutes)
+
+    def on_queue_event(self, ev: models.QueueEvent):
+        """Queue event broker listener."""
+        if ev.eventType != EVENT_COMPLETED:
+            return
+        data = json.loads(ev.payload)
+        self.observe(
+            data.get("medicalFacilityPolyDoctorId"), data.get("polyclinic"),
+            _parse_time(data.get("calledAt")), _parse_time(data.get("completedAt"))
+        )
+
+    def service_minutes(self, doctor_id, polyclinic) -> float:
+        with self._lock:
+            for key in _scope_keys(doctor_id, polyclinic):
+                stats = self._stats.get(key)
+                if stats is not None:
+                    return stats.ewma
+            if self._overall.count:
+                return self._overall.ewma
+        return DEFAULT_SERVICE_MINUTES
+
+    def annotate(self, queue_items, now: Optional[datetime] = None):
+        """
+        Set estimatedWaitMinutes on today's tickets (given in call order) from
+        the current estimates only; no queries. Waiting tickets get the time left
+        on the patient being seen plus one consultation per ticket ahead of them.
+        """
+        now = now or datetime.utcnow()
+        backlog = {}
+        for q in queue_items:
+            if q.status == "In Consultation":
+                key = _queue_key(q)
+                elapsed = (now - q.calledAt).total_seconds() / 60 if q.calledAt else 0
+                remaining = max(self.service_minutes(q.medicalFacilityPolyDoctorId, q.polyclinic) - elapsed, 0)
+                backlog[key] = backlog.get(key, 0) + remaining
+
+        for q in queue_items:
+            if q.status != "Waiting":
+                q.estimatedWaitMinutes = None
+                continue
+            key = _queue_key(q)
+            wait = backlog.get(key, 0)
+            q.estimatedWaitMinutes = round(wait)
+            backlog[key] = wait + self.service_minutes(q.medicalFacilityPolyDoctorId, q.polyclinic)
+        return queue_items
+
+    def rebuild(self, db: Session) -> int:
+        """Replay the last REBUILD_DAYS of finished consultations (live + archived tickets)."""
+        since = datetime.utcnow() - timedelta(days=REBUILD_DAYS)
+        parts = []
+        for table in (models.PatientQueue.__table__, models.PatientQueueArchive.__table__):
+            parts.append(select(
+                table.c.medicalFacilityPolyDoctorId, table.c.polyclinic, table.c.calledAt, table.c.completedAt
+            ).where(table.c.completedAt >= since, table.c.calledAt.isnot(None)))
+        history = union_all(*parts).subquery()
+        rows = db.execute(select(history).order_by(history.c.completedAt)).all()
+
+        with self._lock:
+            self._stats = {}
+            self._overall = ServiceTimeStats()
+        for row in rows:
+            self.observe(row.medicalFacilityPolyDoctorId, row.polyclinic, row.calledAt, row.completedAt)
+        logger.info(f"Wait-time estimator rebuilt from {len(rows)} consultations")
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._lock:
+            scopes = list(self._stats.items())
+            overall = self._overall
+        def describe(stats):
+            return {
+                "samples": stats.count,
+                "ewma_minutes": round(stats.ewma, 1) if stats.ewma is not None else None,
+                "p50_minutes": round(stats.percentile(50), 1) if stats.window else None,
+                "p90_minutes": round(stats.percentile(90), 1) if stats.window else None,
+            }
+        return {
+            "overall": describe(overall),
+            "scopes": [dict(scope=kind, key=key, **describe(stats)) for (kind, key), stats in scopes],
+        }
+
+wait_time_estimator = WaitTimeEstimator()
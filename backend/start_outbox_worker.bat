@@ -0,0 +1,6 @@
+@echo off
+cd /d "%~dp0"
+cd ..
+echo Starting Klinik Admin Outbox Worker...
+python -m backend.outbox_worker
+pause
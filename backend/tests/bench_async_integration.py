@@ -0,0 +1,115 @@
+"""
+Load test: queue and login endpoints while SatuSehat is slow.
+
+Runs the API under uvicorn against mock_satusehat.py with 2s of latency and
+floods it with NIK lookups, once through a copy of the old sync route (each
+lookup parks a threadpool slot) and once through the async
+GET /integration/satusehat/patient/{nik}. Meanwhile GET /patients/queue and
+POST /auth/login are timed: with the sync route they queue behind the
+exhausted AnyIO threadpool, with the async one they stay fast.
+
+Usage:
+    python backend/tests/bench_async_integration.py [lookups] [latency_ms]
+"""
+import sys
+import os
+import asyncio
+import statistics
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "async_integration.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+LOOKUPS = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+LATENCY_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 2000
+PROBES = 10
+
+from mock_satusehat import start_mock_satusehat
+
+mock, mock_url = start_mock_satusehat(latency_ms=LATENCY_MS, jitter_ms=0)
+os.environ["SATUSEHAT_AUTH_URL"] = os.environ["SATUSEHAT_BASE_URL"] = mock_url
+
+import logging
+import httpx
+import uvicorn
+from backend.main import app
+from backend.database import SessionLocal
+from backend import models, auth_utils
+from backend.services.satu_sehat_service import satu_sehat_client
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+@app.get("/bench/sync-satusehat/{nik}")
+def old_get_patient_from_satusehat(nik: str):
+    # The route as it was: a sync def, so the lookup holds a threadpool slot
+    return satu_sehat_client.search_patient_by_nik(nik)
+
+def seed():
+    db = SessionLocal()
+    db.add(models.User(username="bench", password_hash=auth_utils.get_password_hash("bench123"),
+                       full_name="Bench", role="Administrator"))
+    db.commit()
+    db.close()
+
+def serve() -> str:
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{server.servers[0].sockets[0].getsockname()[1]}"
+
+async def probe(client, headers) -> tuple:
+    """ms of GET /patients/queue and POST /auth/login, PROBES times each."""
+    queue, login = [], []
+    for _ in range(PROBES):
+        start = time.perf_counter()
+        assert (await client.get("/patients/queue", headers=headers)).status_code == 200
+        queue.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        assert (await client.post("/auth/login", data={"username": "bench", "password": "bench123"})).status_code == 200
+        login.append((time.perf_counter() - start) * 1000)
+    return queue, login
+
+def report(label, queue, login, elapsed=None):
+    extra = f"  ({LOOKUPS} lookups done in {elapsed:.1f}s)" if elapsed else ""
+    print(f"{label:<28} queue p50 {statistics.median(queue):7.1f}ms max {max(queue):7.1f}ms | "
+          f"login p50 {statistics.median(login):7.1f}ms max {max(login):7.1f}ms{extra}")
+
+async def under_load(client, headers, path) -> tuple:
+    start = time.perf_counter()
+    lookups = [asyncio.create_task(client.get(f"{path}/3171{i:012d}", headers=headers)) for i in range(LOOKUPS)]
+    await asyncio.sleep(0.5)
+    queue, login = await probe(client, headers)
+    responses = await asyncio.gather(*lookups)
+    assert all(r.status_code in (200, 404, 500) for r in responses)
+    return queue, login, time.perf_counter() - start
+
+async def main():
+    seed()
+    base_url = serve()
+    satu_sehat_client.get_access_token()
+    limits = httpx.Limits(max_connections=LOOKUPS + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as client:
+        token = (await client.post("/auth/login", data={"username": "bench", "password": "bench123"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        print(f"SatuSehat latency {LATENCY_MS:.0f}ms, {LOOKUPS} concurrent NIK lookups")
+        report("idle", *await probe(client, headers))
+        before_queue, before_login, elapsed = await under_load(client, headers, "/bench/sync-satusehat")
+        report("lookups via sync route", before_queue, before_login, elapsed)
+        after_queue, after_login, elapsed = await under_load(client, headers, "/integration/satusehat/patient")
+        report("lookups via async route", after_queue, after_login, elapsed)
+
+    # A probe that lands behind the lookups in the threadpool queue shows up as the max
+    assert max(after_queue + after_login) < LATENCY_MS / 4, "queue/login waited on SatuSehat"
+    assert max(before_queue + before_login) > LATENCY_MS, "sync route did not hold up the threadpool"
+    print("OK: slow SatuSehat lookups no longer hold up the queue and login endpoints")
+    mock.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
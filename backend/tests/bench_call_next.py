@@ -0,0 +1,112 @@
+"""
+Contention benchmark for "call next patient" (services.queue_dispatch).
+
+Seeds today's waiting tickets spread over a few polyclinics, then runs one
+thread per consultation room, each calling claim_next_ticket + commit in its
+own session until its polyclinic is empty. Fails if any ticket is claimed
+twice or left waiting; reports per-call latency and throughput.
+
+Usage:
+    python backend/tests/bench_call_next.py [rooms] [tickets]
+
+Runs against a throwaway SQLite file (compare-and-set path) unless
+DATABASE_URL points at a scratch MySQL schema (SKIP LOCKED path).
+"""
+import sys
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "call_next.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from backend.database import SessionLocal, engine, Base
+from backend import models
+from backend.services.queue_dispatch import claim_next_ticket, ClaimContended
+
+ROOMS = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+TICKETS = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+POLYCLINICS = ["Umum", "Gigi", "Anak", "Kandungan"]
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(models.Issuer.__table__), [{"issuer": "General", "nama": "Umum"}])
+        conn.execute(insert(models.MaritalStatus.__table__), [{"display": "Single"}])
+        conn.execute(insert(models.Patient.__table__), [
+            {"firstName": f"Pasien{i}", "lastName": "Bench", "phone": f"08{i:010d}", "gender": "Male",
+             "birthday": date(1990, 1, 1), "identityCard": f"{i:016d}", "issuerId": 1, "maritalStatusId": 1}
+            for i in range(TICKETS)
+        ])
+        conn.execute(insert(models.PatientQueue.__table__), [
+            {"numberQueue": f"P{i:03d}", "userId": i + 1, "status": "Waiting", "isPriority": i % 10 == 0,
+             "isChecked": False, "queueType": "Polyclinic", "polyclinic": POLYCLINICS[i % len(POLYCLINICS)],
+             "appointmentTime": now - timedelta(seconds=TICKETS - i)}
+            for i in range(TICKETS)
+        ])
+
+def room(polyclinic, claimed, latencies, errors):
+    db = SessionLocal()
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                ticket = claim_next_ticket(db, polyclinic=polyclinic)
+                if not ticket:
+                    db.rollback()
+                    return
+                ticket_id = ticket.id
+                db.commit()
+            except OperationalError as e:
+                # Lock timeout / deadlock victim: retry the call like a real client would
+                db.rollback()
+                errors.append(str(e.orig))
+                continue
+            except ClaimContended:
+                # Lost every race for the head of the queue: retry, patients are still waiting
+                db.rollback()
+                errors.append("contended")
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            claimed.append(ticket_id)
+    finally:
+        db.close()
+
+def main():
+    seed()
+    claimed, latencies, errors = [], [], []
+    threads = [
+        threading.Thread(target=room, args=(POLYCLINICS[i % len(POLYCLINICS)], claimed, latencies, errors))
+        for i in range(ROOMS)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    still_waiting = db.query(models.PatientQueue).filter(models.PatientQueue.status == "Waiting").count()
+    db.close()
+
+    duplicates = len(claimed) - len(set(claimed))
+    latencies.sort()
+    print(f"{ROOMS} rooms over {len(POLYCLINICS)} polyclinics, {TICKETS} tickets ({engine.dialect.name})")
+    print(f"  claimed {len(claimed)} in {elapsed:.2f}s ({len(claimed) / elapsed:.0f} calls/s), retried errors {len(errors)}")
+    print(f"  latency p50 {statistics.median(latencies):.2f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms")
+    assert duplicates == 0, f"{duplicates} tickets claimed twice"
+    assert still_waiting == 0 and len(claimed) == TICKETS, f"{still_waiting} tickets left waiting"
+    print("  OK: every ticket claimed exactly once")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Benchmark the streaming exports (routers/exports.py).
+
+Seeds N patients (1M by default) plus some live and archived queue tickets,
+then downloads /exports/patients as CSV, NDJSON and gzipped CSV from a local
+uvicorn server, reporting throughput and peak Python memory, and checks row counts,
+the date-range filter and the archive + live union of /exports/queue-history.
+
+Usage:
+    python backend/tests/bench_exports.py [patients]
+"""
+import sys
+import os
+import csv
+import io
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "exports.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+PATIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+CHUNK = 20_000
+
+import httpx
+import uvicorn
+from sqlalchemy import insert
+from backend.main import app
+from backend.database import SessionLocal, engine
+from backend import models, dependencies
+
+# Registrations spread over the last 400 days
+FIRST_DAY = datetime(2025, 1, 1)
+
+def seed():
+    rnd = random.Random(3)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Issuer.__table__), [{"issuer": "General", "nama": "Umum"}])
+        conn.execute(insert(models.MaritalStatus.__table__), [{"display": "Single"}])
+        conn.execute(insert(models.User.__table__), [{"username": "bench", "password_hash": "-", "full_name": "Bench", "role": "Administrator"}])
+        for start in range(0, PATIENTS, CHUNK):
+            conn.execute(insert(models.Patient.__table__), [{
+                "id": i + 1, "firstName": f"Pasien {i}", "lastName": "Ekspor, \"Uji\"", "phone": f"08{i:010d}",
+                "gender": "Female", "birthday": date(1990, 1, 1), "identityCard": f"{i:016d}", "religion": "Islam",
+                "province": "Jawa Barat", "city": "Bandung", "issuerId": 1, "maritalStatusId": 1,
+                "created_at": FIRST_DAY + timedelta(minutes=rnd.randrange(400 * 24 * 60))
+            } for i in range(start, min(start + CHUNK, PATIENTS))])
+        tickets = [{
+            "id": i + 1, "numberQueue": f"D-{i:03d}", "userId": i + 1, "status": "Completed", "queueType": "Doctor",
+            "appointmentTime": FIRST_DAY + timedelta(hours=i)
+        } for i in range(100)]
+        conn.execute(insert(models.PatientQueueArchive.__table__), tickets[:60])
+        conn.execute(insert(models.PatientQueue.__table__), tickets[60:])
+
+def serve() -> str:
+    # A real server: TestClient buffers whole responses, which hides streaming
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning")
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+def download(base_url, path, keep=False, **params) -> tuple:
+    """(bytes received, lines, seconds, peak KiB, text if keep) of one streamed download, read chunk by chunk."""
+    decompressor = zlib.decompressobj(31) if params.get("gzip") else None
+    size, lines, kept = 0, 0, []
+    tracemalloc.start()
+    start = time.perf_counter()
+    with httpx.stream("GET", base_url + path, params=params, timeout=600) as resp:
+        assert resp.status_code == 200, resp.read()
+        for chunk in resp.iter_raw():
+            size += len(chunk)
+            data = decompressor.decompress(chunk) if decompressor else chunk
+            lines += data.count(b"\n")
+            if keep:
+                kept.append(data)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, lines, elapsed, peak / 1024, b"".join(kept).decode("utf-8")
+
+def main():
+    print(f"Seeding {PATIENTS:,} patients...")
+    seed()
+    db = SessionLocal()
+    user = db.query(models.User).first()
+    db.expunge(user)
+    db.close()
+    app.dependency_overrides[dependencies.get_current_user] = lambda: user
+    base_url = serve()
+
+    print(f"{'export':22} {'rows':>9} {'size':>10} {'time':>7} {'rows/s':>9} {'peak mem':>10}")
+    for label, params in (("patients csv", {}), ("patients ndjson", {"format": "ndjson"}), ("patients csv.gz", {"gzip": True})):
+        size, lines, elapsed, peak_kb, _ = download(base_url, "/exports/patients", **params)
+        rows = lines - (0 if params.get("format") == "ndjson" else 1)
+        assert rows == PATIENTS, f"{label}: {rows} rows"
+        print(f"{label:22} {rows:9,} {size / 2**20:8.1f}MB {elapsed:6.1f}s {rows / elapsed:9,.0f} {peak_kb:8,.0f}KiB")
+
+    # Date range: local days, inclusive on both ends
+    *_, text = download(base_url, "/exports/patients", keep=True, date_from="2025-03-01", date_to="2025-03-31")
+    rows = list(csv.DictReader(io.StringIO(text)))
+    local_days = {(datetime.fromisoformat(r["created_at"]) + timedelta(hours=7)).date() for r in rows}
+    assert rows and min(local_days) == date(2025, 3, 1) and max(local_days) == date(2025, 3, 31)
+    assert rows[0]["lastName"] == 'Ekspor, "Uji"'
+    print(f"March 2025 filter: {len(rows):,} patients")
+
+    _, lines, *_ = download(base_url, "/exports/queue-history", format="ndjson")
+    assert lines == 100
+    print("OK: exports streamed, filtered and complete")
+
+if __name__ == "__main__":
+    main()
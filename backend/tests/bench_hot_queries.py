@@ -0,0 +1,181 @@
+"""
+Benchmark the hot queue / appointment / payment queries before and after
+migration v0001 (composite indexes).
+
+Seeds a dataset (1M queue tickets by default), drops the v0001 indexes to get
+the pre-migration schema, records EXPLAIN plans and latencies for each hot
+query, applies the migration and measures again.
+
+Usage:
+    python backend/tests/bench_hot_queries.py [queue_rows] [repeats]
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set (use a
+scratch MySQL schema to get InnoDB plans; the script DROPS the indexes there).
+"""
+import sys
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "hot_queries.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from sqlalchemy import text, insert
+from backend.database import engine, Base
+from backend import models, clinic_time
+from backend.migrations import run_migrations
+from backend.migrations.ops import drop_index_if_exists
+
+QUEUE_ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+REPEATS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+PATIENTS = max(1000, QUEUE_ROWS // 10)
+APPOINTMENTS = max(1000, QUEUE_ROWS // 5)
+PAYMENTS = max(1000, QUEUE_ROWS // 5)
+HISTORY_DAYS = 365
+CHUNK = 10_000
+
+V0001_INDEXES = [
+    ("patientqueue", "ix_patientqueue_type_prio_time"),
+    ("patientqueue", "ix_patientqueue_user_status_time"),
+    ("appointments", "ix_appointments_date_time"),
+    ("payments", "ix_payments_patient_id"),
+]
+
+def insert_chunked(conn, table, rows_iter, total):
+    batch = []
+    for row in rows_iter:
+        batch.append(row)
+        if len(batch) >= CHUNK:
+            conn.execute(insert(table), batch)
+            batch = []
+    if batch:
+        conn.execute(insert(table), batch)
+    print(f"  seeded {total:,} rows into {table.name}")
+
+def seed():
+    rnd = random.Random(42)
+    now = datetime.utcnow()
+    today = clinic_time.local_today()
+    statuses = ["Completed"] * 8 + ["Waiting", "In Consultation"]
+
+    with engine.begin() as conn:
+        conn.execute(insert(models.Issuer.__table__), [{"issuer": "General", "nama": "Umum"}])
+        conn.execute(insert(models.MaritalStatus.__table__), [{"display": "Single"}])
+        insert_chunked(conn, models.Patient.__table__, (
+            {"firstName": f"Pasien{i}", "lastName": "Bench", "phone": f"08{i:010d}", "gender": "Male",
+             "birthday": date(1990, 1, 1), "identityCard": f"{i:016d}", "issuerId": 1, "maritalStatusId": 1,
+             "created_at": now}
+            for i in range(PATIENTS)
+        ), PATIENTS)
+        insert_chunked(conn, models.PatientQueue.__table__, (
+            {"numberQueue": f"D{i % 999:03d}", "userId": rnd.randint(1, PATIENTS),
+             "appointmentTime": now - timedelta(days=rnd.randint(0, HISTORY_DAYS), minutes=rnd.randint(0, 600)),
+             "status": rnd.choice(statuses), "isPriority": rnd.random() < 0.1,
+             "queueType": "Polyclinic" if rnd.random() < 0.3 else "Doctor", "isChecked": False}
+            for i in range(QUEUE_ROWS)
+        ), QUEUE_ROWS)
+        insert_chunked(conn, models.Appointment.__table__, (
+            {"nik_patient": f"{rnd.randint(0, PATIENTS - 1):016d}",
+             "appointment_date": today + timedelta(days=rnd.randint(-HISTORY_DAYS, 30)),
+             "appointment_time": f"{rnd.randint(7, 20):02d}:{rnd.choice(['00', '30'])}", "status": "Scheduled",
+             "created_at": now}
+            for _ in range(APPOINTMENTS)
+        ), APPOINTMENTS)
+        insert_chunked(conn, models.Payment.__table__, (
+            {"patient_id": rnd.randint(1, PATIENTS), "amount": 50000, "method": "Cash", "claimStatus": "Paid",
+             "created_at": now}
+            for _ in range(PAYMENTS)
+        ), PAYMENTS)
+
+def hot_queries():
+    today_start = clinic_time.today_start_utc()
+    today = clinic_time.local_today()
+    return {
+        "queue today (get_queue)": (
+            'SELECT id FROM patientqueue WHERE "appointmentTime" >= :t ORDER BY "isPriority" DESC, "appointmentTime" ASC',
+            {"t": today_start}),
+        "today by type/priority": (
+            'SELECT id FROM patientqueue WHERE "queueType" = :qt AND "isPriority" = :p AND "appointmentTime" >= :t ORDER BY id DESC LIMIT 1',
+            {"qt": "Doctor", "p": False, "t": today_start}),
+        "active ticket for patient": (
+            'SELECT id FROM patientqueue WHERE "userId" = :u AND status IN (\'Waiting\', \'In Consultation\') AND "appointmentTime" >= :t LIMIT 1',
+            {"u": PATIENTS // 2, "t": today_start}),
+        "upcoming appointments": (
+            "SELECT id FROM appointments WHERE appointment_date > :d OR (appointment_date = :d AND appointment_time >= :tm) "
+            "ORDER BY appointment_date ASC, appointment_time ASC LIMIT 100",
+            {"d": today, "tm": "12:00"}),
+        "payments for patient": (
+            "SELECT id FROM payments WHERE patient_id = :p",
+            {"p": PATIENTS // 2}),
+    }
+
+def dialect_sql(sql):
+    if engine.dialect.name == "mysql":
+        return sql.replace('"', "`")
+    return sql
+
+def explain(conn, sql, params):
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    rows = conn.execute(text(prefix + dialect_sql(sql)), params).fetchall()
+    if engine.dialect.name == "sqlite":
+        return "; ".join(str(r[-1]) for r in rows)
+    return "; ".join(str(dict(r._mapping)) for r in rows)
+
+def measure(label):
+    results = {}
+    with engine.connect() as conn:
+        for name, (sql, params) in hot_queries().items():
+            plan = explain(conn, sql, params)
+            timings = []
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                conn.execute(text(dialect_sql(sql)), params).fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = (statistics.median(timings), max(timings), plan)
+            print(f"  [{label}] {name}: p50 {results[name][0]:.2f} ms | plan: {plan}")
+    return results
+
+def main():
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for table, index in V0001_INDEXES:
+            drop_index_if_exists(conn, table, index)
+        conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at DATETIME NOT NULL)"))
+        conn.execute(text("DELETE FROM schema_migrations WHERE version >= 1"))
+
+    print(f"Seeding {QUEUE_ROWS:,} queue tickets over {HISTORY_DAYS} days...")
+    start = time.perf_counter()
+    seed()
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"  done in {time.perf_counter() - start:.1f}s")
+
+    print("Before migration:")
+    before = measure("before")
+
+    print("Applying v0001...")
+    start = time.perf_counter()
+    run_migrations(engine, target=1)
+    with engine.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    # Fresh connections, so no statement prepared against the old schema is reused
+    engine.dispose()
+    print(f"  done in {time.perf_counter() - start:.1f}s")
+
+    print("After migration:")
+    after = measure("after")
+
+    print()
+    print(f"{'query':28} {'before p50':>12} {'after p50':>12} {'speedup':>9}")
+    for name in before:
+        b, a = before[name][0], after[name][0]
+        print(f"{name:28} {b:10.2f}ms {a:10.2f}ms {b / a if a else float('inf'):8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark the pooled HTTP sessions (services/http_pool.py) against a local
+stub standing in for ERPNext, over plain HTTP and over TLS (self-signed
+certificate made with openssl).
+
+"before" is the old call style, a module-level requests.get per call (new
+TCP + TLS handshake every time); "after" is FrappeClient.get_list on the
+shared keep-alive session. Also runs the pooled client from 8 threads and
+against an endpoint that answers 503 every other time, to show the per-host
+connection cap and the retries in the /metrics/http histograms.
+
+Usage:
+    python backend/tests/bench_http_pool.py [calls]
+"""
+import sys
+import os
+import json
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+CALLS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+THREADS = 8
+
+class StubERPNext(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as two writes; without this a kept-alive
+    # connection stalls on Nagle + delayed ACK (~40ms), which real servers avoid
+    disable_nagle_algorithm = True
+    flaky_calls = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path.startswith("/api/resource/Flaky"):
+            with StubERPNext.lock:
+                StubERPNext.flaky_calls += 1
+                fail = StubERPNext.flaky_calls % 2 == 1
+            if fail:
+                return self._reply(503, {"exc": "busy"})
+        self._reply(200, {"data": [{"name": "PAT-0001"}]})
+
+    def _reply(self, code, data):
+        raw = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *_):
+        pass
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    connections = 0
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+def start_stub(context=None):
+    server = CountingServer(("127.0.0.1", 0), StubERPNext)
+    if context:
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    scheme = "https" if context else "http"
+    return server, f"{scheme}://127.0.0.1:{server.server_address[1]}"
+
+def self_signed_cert():
+    folder = tempfile.mkdtemp()
+    cert, key = os.path.join(folder, "cert.pem"), os.path.join(folder, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-keyout", key, "-out", cert, "-subj", "/CN=127.0.0.1",
+                    "-addext", "subjectAltName=IP:127.0.0.1"], check=True, capture_output=True)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context, cert
+
+def timed(call, n):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        call()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.mean(times), statistics.median(times)
+
+def bench(label, context=None, cert=None):
+    import requests
+    from backend.services.frappe_service import frappe_client
+
+    server, url = start_stub(context)
+    frappe_client.base_url = url
+    frappe_client.session.verify = cert if cert else True
+    # A CA bundle from the environment would override session.verify
+    frappe_client.session.trust_env = False
+    params = {"fields": '["name"]', "filters": "{}", "limit_page_length": 500}
+
+    def before():
+        response = requests.get(f"{url}/api/resource/Patient", headers=frappe_client.headers, params=params,
+                                timeout=10, verify=cert if cert else True)
+        assert response.status_code == 200
+
+    def after():
+        assert frappe_client.get_list("Patient") == [{"name": "PAT-0001"}]
+
+    before(), after()  # warm up
+    server.connections = 0
+    avg_b, med_b = timed(before, CALLS)
+    conns_b, server.connections = server.connections, 0
+    avg_a, med_a = timed(after, CALLS)
+    conns_a = server.connections
+    print(f"{label}: {CALLS} sequential calls")
+    print(f"  before (requests.get): avg {avg_b:.2f}ms  p50 {med_b:.2f}ms  {conns_b} connections")
+    print(f"  after  (pooled)      : avg {avg_a:.2f}ms  p50 {med_a:.2f}ms  {conns_a} connections"
+          f"  -> {avg_b / avg_a:.1f}x less per-call overhead")
+
+    server.connections = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(lambda _: after(), range(CALLS)))
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"  pooled from {THREADS} threads: {CALLS} calls in {elapsed:.0f}ms, {server.connections} connections opened")
+    server.shutdown()
+    return conns_a
+
+def main():
+    from backend.services.http_pool import http_pool, POOL_MAXSIZE
+    from backend.services.frappe_service import frappe_client
+
+    conns = bench("http")
+    assert conns == 0, "pooled client should reuse the warm-up connection"
+    context, cert = self_signed_cert()
+    bench("https", context, cert)
+
+    http_pool.reset()
+    server, url = start_stub()
+    frappe_client.base_url = url
+    frappe_client.session.verify = True
+    for _ in range(20):
+        assert frappe_client.get_list("Flaky") == [{"name": "PAT-0001"}]
+    flaky = http_pool.stats()["clients"]["erpnext"]["endpoints"]["GET /api/resource/Flaky"]
+    print(f"flaky endpoint (503 every other call): 20 calls ok, {flaky['retries']} retries, "
+          f"p50 {flaky['p50_ms']}ms p95 {flaky['p95_ms']}ms")
+    assert flaky["retries"] == 20 and flaky["statuses"] == {"200": 20}
+
+    hosts = http_pool.stats()["clients"]["erpnext"]["hosts"]
+    assert all(h["connections_opened"] <= POOL_MAXSIZE for h in hosts), hosts
+    print("OK: pooled sessions reuse connections, cap them per host and retry idempotent calls")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
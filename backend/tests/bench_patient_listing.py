@@ -0,0 +1,108 @@
+"""
+Benchmark GET /patients paging: the old ORDER BY firstName OFFSET/LIMIT vs
+keyset paging on (firstName, id) in services/patient_listing.py.
+
+Seeds N patients (1M by default, some without a first name), checks that a
+full cursor walk of a small prefix returns every patient once in order,
+then times one page at increasing depths through both paths.
+
+Usage:
+    python backend/tests/bench_patient_listing.py [patients] [page_size]
+"""
+import sys
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "patient_listing.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from sqlalchemy import insert, text
+from backend.database import engine, Base, SessionLocal
+from backend import models
+from backend.services.patient_listing import list_patients, encode_list_cursor, patient_counter
+
+PATIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+PAGE_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+REPEATS = 10
+CHUNK = 20_000
+
+FIRST_NAMES = ["Muhammad", "Siti", "Budi", "Dewi", "Agus", "Putri", "Eko", "Rina", "Yusuf", "Ayu", "Hendra", "Joko"]
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(7)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Issuer.__table__), [{"issuer": "General", "nama": "Umum"}])
+        conn.execute(insert(models.MaritalStatus.__table__), [{"display": "Single"}])
+        for start in range(0, PATIENTS, CHUNK):
+            rows = []
+            for i in range(start, min(start + CHUNK, PATIENTS)):
+                # Heavy duplication, like real first names, and a few blanks
+                first = None if rnd.random() < 0.001 else f"{rnd.choice(FIRST_NAMES)} {rnd.randint(0, 999)}"
+                rows.append({
+                    "id": i + 1, "firstName": first, "lastName": "Bench", "phone": f"08{i:010d}",
+                    "gender": "Male", "birthday": date(1990, 1, 1), "identityCard": f"{i:016d}",
+                    "issuerId": 1, "maritalStatusId": 1
+                })
+            conn.execute(insert(models.Patient.__table__), rows)
+        if engine.dialect.name in ("sqlite", "postgresql"):
+            conn.execute(text("ANALYZE"))
+
+def offset_page(db, skip):
+    # The pre-keyset implementation of GET /patients
+    return db.query(models.Patient).order_by(models.Patient.firstName.asc()).offset(skip).limit(PAGE_SIZE).all()
+
+def check_walk(db, pages=50):
+    expected = [row.id for row in db.query(models.Patient.id).order_by(
+        models.Patient.firstName.asc(), models.Patient.id.asc()).limit(pages * PAGE_SIZE)]
+    walked, cursor = [], None
+    for _ in range(pages):
+        patients, cursor = list_patients(db, PAGE_SIZE, cursor)
+        walked.extend(p.id for p in patients)
+        if not cursor:
+            break
+    assert walked == expected[:len(walked)] and len(walked) == len(expected), "cursor walk out of order"
+    print(f"  cursor walk of {len(walked):,} patients matches ORDER BY firstName, id")
+
+def timed(fn):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    print(f"Seeding {PATIENTS:,} patients...")
+    start = time.perf_counter()
+    seed()
+    print(f"  done in {time.perf_counter() - start:.1f}s")
+
+    db = SessionLocal()
+    check_walk(db)
+    print(f"  X-Total-Count: {patient_counter.get(db):,} (recount {patient_counter.last_recount_ms:.1f}ms, cached after)")
+
+    print(f"{'depth':>10} {'OFFSET p50':>12} | {'keyset p50':>11}")
+    for depth in (0, 10_000, 100_000, PATIENTS // 2, PATIENTS - PAGE_SIZE):
+        if depth >= PATIENTS:
+            continue
+        # The cursor a client would hold after paging down to `depth`
+        cursor = None
+        if depth:
+            anchor = db.query(models.Patient).order_by(
+                models.Patient.firstName.asc(), models.Patient.id.asc()).offset(depth - 1).first()
+            cursor = encode_list_cursor(anchor.firstName, anchor.id)
+        offset_ms = timed(lambda: (db.expunge_all(), offset_page(db, depth)))
+        keyset_ms = timed(lambda: (db.expunge_all(), list_patients(db, PAGE_SIZE, cursor)))
+        print(f"{depth:>10,} {offset_ms:10.2f}ms | {keyset_ms:9.2f}ms")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark patient search: the old five-column LIKE '%q%' filter vs the
+token-index search in services/patient_search.py (including the phonetic
+fallback for misspelled names).
+
+Seeds N patients (500k by default) with Indonesian-style names, phone
+numbers, NIKs and MRNs, then times typical front-desk queries through both
+paths and reports p50 / p95 and result counts.
+
+Usage:
+    python backend/tests/bench_patient_search.py [patients] [repeats]
+"""
+import sys
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "patient_search.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from sqlalchemy import insert, text
+from backend.database import engine, Base, SessionLocal
+from backend import models
+from backend.services.patient_search import search_patients, name_tokens
+
+PATIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+REPEATS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+CHUNK = 10_000
+
+FIRST_NAMES = [
+    "Muhammad", "Muhamad", "Ahmad", "Siti", "Nur", "Dewi", "Budi", "Agus", "Sri", "Rina", "Andi", "Putri",
+    "Eko", "Dian", "Wahyu", "Fitri", "Rizki", "Indah", "Yusuf", "Ayu", "Bambang", "Hendra", "Lestari",
+    "Joko", "Rudi", "Fajar", "Ratna", "Dedi", "Nurul", "Aditya", "Kurniawan", "Hadi", "Yanti", "Irfan",
+]
+LAST_NAMES = [
+    "Santoso", "Wijaya", "Saputra", "Hidayat", "Nurhaliza", "Pratama", "Setiawan", "Susanto", "Hartono",
+    "Kusuma", "Rahmawati", "Gunawan", "Lubis", "Siregar", "Nasution", "Harahap", "Simanjuntak", "Sihombing",
+    "Wibowo", "Purnomo", "Handoko", "Suryadi", "Syahputra", "Ramadhan", "Permana", "Utami", "Anggraini",
+]
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    rnd = random.Random(7)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Issuer.__table__), [{"issuer": "General", "nama": "Umum"}])
+        conn.execute(insert(models.MaritalStatus.__table__), [{"display": "Single"}])
+        for start in range(0, PATIENTS, CHUNK):
+            patients, tokens = [], []
+            for i in range(start, min(start + CHUNK, PATIENTS)):
+                first = rnd.choice(FIRST_NAMES)
+                if rnd.random() < 0.4:
+                    first += " " + rnd.choice(FIRST_NAMES)
+                last = rnd.choice(LAST_NAMES)
+                patients.append({
+                    "id": i + 1, "firstName": first, "lastName": last, "phone": f"08{i:010d}",
+                    "gender": "Male", "birthday": date(1990, 1, 1),
+                    # Most patients share the clinic's district code
+                    "identityCard": f"317101{i:010d}", "nomorRekamMedis": f"RM-{i:07d}",
+                    "issuerId": 1, "maritalStatusId": 1
+                })
+                tokens.extend({"token": t, "patient_id": i + 1} for t in name_tokens(first, last))
+            conn.execute(insert(models.Patient.__table__), patients)
+            conn.execute(insert(models.PatientSearchToken.__table__), tokens)
+        if engine.dialect.name in ("sqlite", "postgresql"):
+            conn.execute(text("ANALYZE"))
+
+def like_search(db, query):
+    # The pre-index implementation of GET /patients/search
+    return db.query(models.Patient).filter(
+        (models.Patient.firstName.contains(query)) |
+        (models.Patient.lastName.contains(query)) |
+        (models.Patient.identityCard.contains(query)) |
+        (models.Patient.phone.contains(query)) |
+        (models.Patient.nomorRekamMedis.contains(query))
+    ).all()
+
+def index_search(db, query):
+    return search_patients(db, query)[0]
+
+def timed(fn, db, query):
+    timings = []
+    for _ in range(REPEATS):
+        db.expunge_all()
+        start = time.perf_counter()
+        result = fn(db, query)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[max(0, int(len(timings) * 0.95) - 1)], len(result)
+
+def main():
+    print(f"Seeding {PATIENTS:,} patients...")
+    start = time.perf_counter()
+    seed()
+    print(f"  done in {time.perf_counter() - start:.1f}s")
+
+    mid = PATIENTS // 2
+    queries = [
+        "muh", "Siti Nurhaliza", "budi s", "simanjuntak", "hendra wibowo", "budi xq",
+        # Misspellings only the phonetic keys find
+        "Mohamad Santosa", "nurhalizah", "Siti Nurhalisa", "Ramadan Utamy",
+        f"08{mid:010d}"[:8], f"08{mid:010d}", f"317101{mid:010d}", f"RM-{mid:07d}",
+    ]
+    db = SessionLocal()
+    print(f"{'query':22} {'LIKE p50':>10} {'p95':>9} {'rows':>7} | {'index p50':>10} {'p95':>9} {'rows':>5}")
+    for q in queries:
+        like_p50, like_p95, like_rows = timed(like_search, db, q)
+        idx_p50, idx_p95, idx_rows = timed(index_search, db, q)
+        print(f"{q:22} {like_p50:8.2f}ms {like_p95:7.2f}ms {like_rows:7} | {idx_p50:8.2f}ms {idx_p95:7.2f}ms {idx_rows:5}")
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Microbenchmark for POST /patients/queue (registration hot path).
+
+Registers N distinct patients through the API on a throwaway SQLite database
+and reports per-registration latency and SQL statements (auth overridden, so
+only the endpoint's own statements are counted). Also registers each patient a
+second time to measure the duplicate-rejection path.
+
+Usage:
+    python backend/tests/bench_registration.py [registrations]
+"""
+import sys
+import os
+import statistics
+import tempfile
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "registration.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from sqlalchemy import event, insert
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal, engine
+from backend import models, dependencies
+
+REGISTRATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+def seed():
+    with engine.begin() as conn:
+        conn.execute(insert(models.Issuer.__table__), [{"issuer": "General", "nama": "Umum"}])
+        conn.execute(insert(models.MaritalStatus.__table__), [{"display": "Single"}])
+        conn.execute(insert(models.Patient.__table__), [
+            {"firstName": f"Pasien{i}", "lastName": "Bench", "phone": f"08{i:010d}", "gender": "Male",
+             "birthday": date(1990, 1, 1), "identityCard": f"{i:016d}", "religion": "Islam", "profession": "-",
+             "education": "-", "province": "-", "city": "-", "district": "-", "subdistrict": "-", "rt": "01",
+             "rw": "01", "postalCode": "00000", "issuerId": 1, "maritalStatusId": 1}
+            for i in range(REGISTRATIONS)
+        ])
+    db = SessionLocal()
+    user = models.User(username="bench", password_hash="-", full_name="Bench", role="Administrator")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+    return user
+
+def run(client, label, expected_status):
+    statements = []
+    latencies = []
+    count = {"n": 0}
+
+    def on_execute(*_):
+        count["n"] += 1
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        for patient_id in range(1, REGISTRATIONS + 1):
+            count["n"] = 0
+            start = time.perf_counter()
+            resp = client.post("/patients/queue", json={"userId": patient_id, "queueType": "Doctor"})
+            latencies.append((time.perf_counter() - start) * 1000)
+            statements.append(count["n"])
+            assert resp.status_code == expected_status, resp.text
+    finally:
+        event.remove(engine, "before_cursor_execute", on_execute)
+
+    latencies.sort()
+    print(f"{label}: {REGISTRATIONS} requests | "
+          f"p50 {statistics.median(latencies):.2f} ms, p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f} ms | "
+          f"statements/request avg {statistics.mean(statements):.1f}, max {max(statements)}")
+
+def main():
+    user = seed()
+    app.dependency_overrides[dependencies.get_current_user] = lambda: user
+    client = TestClient(app)
+    run(client, "new registration      ", 200)
+    run(client, "duplicate registration", 400)
+
+if __name__ == "__main__":
+    main()
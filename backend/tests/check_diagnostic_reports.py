@@ -0,0 +1,134 @@
+"""
+Check paginated, cached DiagnosticReport retrieval (services/diagnostic_reports.py)
+against mock_satusehat.py:
+  - pages are requested lazily, following Bundle.link "next",
+  - GET /integration/diagnostic-reports/{id}/stream sends the full history as
+    NDJSON, the same list GET /integration/diagnostic-reports/{id} returns,
+  - a returning patient costs one _lastUpdated request, which only brings
+    the new and changed reports, with meta.lastUpdated ending in "Z",
+  - a failed refresh serves the cached list,
+  - linking a patient by NIK on the way does not bump updated_at.
+
+Usage:
+    python backend/tests/check_diagnostic_reports.py [reports] [latency_ms]
+"""
+import sys
+import os
+import json
+import tempfile
+import time
+from datetime import date, datetime, timezone
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "diagnostic_reports.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+REPORTS = int(sys.argv[1]) if len(sys.argv) > 1 else 480
+LATENCY_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+PAGE_SIZE = 50
+os.environ["SATUSEHAT_REPORT_PAGE_SIZE"] = str(PAGE_SIZE)
+# Every visit after the first checks for changes
+os.environ["DIAGNOSTIC_REPORT_FRESH_SECONDS"] = "0"
+
+from mock_satusehat import start_mock_satusehat
+
+mock, mock_url = start_mock_satusehat(latency_ms=LATENCY_MS, jitter_ms=0)
+os.environ["SATUSEHAT_AUTH_URL"] = os.environ["SATUSEHAT_BASE_URL"] = mock_url
+
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal
+from backend import models
+from backend.auth_utils import get_current_user
+from backend.services.satu_sehat_service import satu_sehat_client
+from backend.services.diagnostic_reports import _last_updated
+
+NIK = "3171000000000004"
+IHS = f"P{NIK}"
+
+def seed():
+    db = SessionLocal()
+    db.add(models.Issuer(issuer="General", nama="Umum"))
+    db.add(models.MaritalStatus(display="Single"))
+    user = models.User(username="check", password_hash="-", full_name="Check", role="Administrator")
+    patient = models.Patient(firstName="Pasien", lastName="Lab", phone="081200000000", gender="Female",
+                             birthday=date(1980, 1, 1), identityCard=NIK, issuerId=1, maritalStatusId=1)
+    db.add_all([user, patient])
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    patient_id, updated_at = patient.id, patient.updated_at
+    db.close()
+    return user, patient_id, updated_at
+
+def stream(client, patient_id) -> tuple:
+    """(reports, report pages requested, seconds)"""
+    pages, start = mock.state.report_pages, time.perf_counter()
+    response = client.get(f"/integration/diagnostic-reports/{patient_id}/stream")
+    assert response.status_code == 200 and response.headers["content-type"] == "application/x-ndjson"
+    reports = [json.loads(line) for line in response.text.splitlines()]
+    assert all("error" not in r for r in reports), reports[-1]
+    return reports, mock.state.report_pages - pages, time.perf_counter() - start
+
+def main():
+    user, patient_id, updated_at = seed()
+    app.dependency_overrides[get_current_user] = lambda: user
+    client = TestClient(app)
+    # A "Z" instant is a watermark on every Python version, not a full refetch
+    zulu = _last_updated({"meta": {"lastUpdated": "2024-05-01T08:30:00.123Z"}})
+    assert zulu and zulu[0] == datetime(2024, 5, 1, 8, 30, 0, 123000, tzinfo=timezone.utc), zulu
+
+    mock.state.add_reports(IHS, REPORTS)
+    assert mock.state.reports[IHS][0]["meta"]["lastUpdated"].endswith("Z")
+    pages = -(-REPORTS // PAGE_SIZE)
+
+    # Pages are only requested as the caller consumes them
+    lazy = satu_sehat_client.iter_diagnostic_reports(IHS)
+    before = mock.state.report_pages
+    first = next(lazy)
+    assert mock.state.report_pages - before == 1 and first["id"] == f"DR-{IHS}-{REPORTS - 1}"
+    lazy.close()
+    print(f"lazy pager:  first report after 1 of {pages} pages")
+
+    reports, requested, elapsed = stream(client, patient_id)
+    print(f"first visit: {len(reports)} reports, {requested} pages, {elapsed * 1000:.0f}ms")
+    assert len(reports) == REPORTS and requested == pages
+    assert [r["id"] for r in reports] == [f"DR-{IHS}-{k}" for k in reversed(range(REPORTS))]
+
+    db = SessionLocal()
+    patient = db.get(models.Patient, patient_id)
+    assert patient.ihs_number == IHS and patient.updated_at == updated_at, "NIK link bumped updated_at"
+    db.close()
+
+    listed = client.get(f"/integration/diagnostic-reports/{patient_id}").json()
+    assert listed == reports
+    reports, requested, elapsed = stream(client, patient_id)
+    print(f"revisit:     {len(reports)} reports, {requested} page (nothing new), {elapsed * 1000:.0f}ms")
+    assert len(reports) == REPORTS and requested == 1
+
+    refreshed = satu_sehat_client.diagnostic_reports.refreshed_reports
+    mock.state.add_reports(IHS, 3)
+    mock.state.update_report(IHS, 0, status="amended")
+    reports, requested, elapsed = stream(client, patient_id)
+    print(f"3 new, 1 amended: {len(reports)} reports, {requested} page, {elapsed * 1000:.0f}ms")
+    assert len(reports) == REPORTS + 3 and requested == 1
+    assert reports[0]["id"] == f"DR-{IHS}-{REPORTS + 2}"
+    assert reports[-1]["status"] == "amended"
+    # The 4 changed ones, plus the newest one already seen (ge is inclusive)
+    assert satu_sehat_client.diagnostic_reports.refreshed_reports - refreshed <= 5
+    assert satu_sehat_client.diagnostic_reports.full_fetches == 1, "refresh fell back to a full refetch"
+
+    mock.state.error_status = 503
+    reports, _, _ = stream(client, patient_id)
+    mock.state.error_status = None
+    assert len(reports) == REPORTS + 3
+    print("SatuSehat down: cached list served")
+
+    print(client.get("/metrics/diagnostic-reports").json())
+    print("OK: reports are paged lazily, streamed and refreshed by _lastUpdated")
+    mock.shutdown()
+
+if __name__ == "__main__":
+    main()
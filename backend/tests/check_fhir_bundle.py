@@ -0,0 +1,136 @@
+"""
+Check the transaction Bundle push (services/fhir_bundle.py) against the FHIR
+stub in mock_satusehat.py.
+
+Seeds a backlog of unlinked patients (a few with NIKs the stub rejects),
+doctors and pharmacists, calls the push endpoints and verifies that:
+  - the backlog goes out in a handful of Bundle POSTs instead of one
+    request per row,
+  - every row gets the IHS id of its own resource,
+  - a rejected Bundle is split and resent, so only the rejected rows (and
+    a few neighbours) end up in single requests, and only they stay unlinked,
+  - a Bundle the server can't take (503) stops the push after one request
+    instead of being split, and the next push picks the backlog up,
+  - doctors and pharmacists keep their updated_at (no incremental ERPNext
+    re-push).
+
+Usage:
+    python backend/tests/check_fhir_bundle.py [patients] [latency_ms]
+"""
+import sys
+import os
+import tempfile
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "fhir_bundle.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+PATIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+LATENCY_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+DOCTORS, PHARMACISTS = 30, 12
+# Row indexes whose NIK the stub rejects, one in the first chunk and one further in
+REJECTED = {17, PATIENTS // 2 + 45}
+
+from mock_satusehat import start_mock_satusehat
+
+mock, mock_url = start_mock_satusehat(latency_ms=LATENCY_MS, jitter_ms=0)
+os.environ["SATUSEHAT_AUTH_URL"] = os.environ["SATUSEHAT_BASE_URL"] = mock_url
+
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal
+from backend import models, auth_utils
+from backend.services.fhir_bundle import BUNDLE_SIZE
+
+def nik(i):
+    return f"3171{i:012d}"
+
+def seed():
+    db = SessionLocal()
+    db.add(models.Issuer(issuer="General", nama="Umum"))
+    db.add(models.MaritalStatus(display="Single"))
+    user = models.User(username="check", password_hash="-", full_name="Check", role="Administrator")
+    db.add(user)
+    db.add_all([models.Patient(
+        firstName=f"Pasien{i}", lastName="Bundle", phone=f"08{i:010d}", gender="Female", birthday=date(1990, 1, 1),
+        identityCard=nik(i), issuerId=1, maritalStatusId=1
+    ) for i in range(PATIENTS)])
+    db.add_all([models.DoctorEntity(namaDokter=f"dr. Bundle {i}", identityCard=nik(10**6 + i), polyName="Umum")
+                for i in range(DOCTORS)])
+    db.add_all([models.Pharmacist(name=f"Apt. Farma {i} S.Farm", nik=nik(2 * 10**6 + i)) for i in range(PHARMACISTS)])
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+    mock.state.reject_niks.update(nik(i) for i in REJECTED)
+    return user
+
+def main():
+    user = seed()
+    app.dependency_overrides[auth_utils.get_current_user] = lambda: user
+    client = TestClient(app)
+
+    start = time.perf_counter()
+    result = client.post("/integration/satusehat/patients/push").json()
+    elapsed = time.perf_counter() - start
+    requests = len(mock.state.bundles) + mock.state.creates
+    chunks = -(-PATIENTS // BUNDLE_SIZE)
+    print(f"{PATIENTS} patients: {result['count']} created with {len(mock.state.bundles)} Bundles "
+          f"+ {mock.state.creates} single requests in {elapsed:.1f}s "
+          f"(one request per row at {LATENCY_MS:.0f}ms: ~{PATIENTS * LATENCY_MS / 1000:.0f}s)")
+    assert result["count"] == PATIENTS - len(REJECTED), result
+    # Splitting a rejected Bundle down to its bad row costs about 2*log2(BUNDLE_SIZE) extra requests,
+    # a few of them singles for neighbours left alone in their half
+    assert len(REJECTED) <= mock.state.creates <= len(REJECTED) * BUNDLE_SIZE.bit_length(), mock.state.creates
+    assert requests <= chunks + len(REJECTED) * 2 * BUNDLE_SIZE.bit_length(), requests
+
+    db = SessionLocal()
+    for patient in db.query(models.Patient):
+        expected = None if patient.identityCard in mock.state.reject_niks else f"P{patient.identityCard}"
+        assert patient.ihs_number == expected, (patient.identityCard, patient.ihs_number)
+
+    doctor_updated = {d.identityCard: d.updated_at for d in db.query(models.DoctorEntity)}
+    pharmacist_updated = {p.id: p.updated_at for p in db.query(models.Pharmacist)}
+    db.close()
+
+    before = len(mock.state.bundles)
+    assert client.post("/integration/satusehat/doctors/push").json()["count"] == DOCTORS
+    assert client.post("/integration/satusehat/pharmacists/push").json()["count"] == PHARMACISTS
+    assert len(mock.state.bundles) - before == 2
+
+    db = SessionLocal()
+    for doctor in db.query(models.DoctorEntity):
+        assert doctor.ihs_practitioner_number == f"N{doctor.identityCard}"
+        assert doctor.updated_at == doctor_updated[doctor.identityCard]
+    for pharmacist in db.query(models.Pharmacist):
+        assert pharmacist.ihs_number == f"N{pharmacist.nik}"
+        assert pharmacist.updated_at == pharmacist_updated[pharmacist.id]
+    db.close()
+    print(f"{DOCTORS} doctors, {PHARMACISTS} pharmacists: one Bundle each")
+
+    # Only the rejected rows are left, and they are rejected again
+    assert client.post("/integration/satusehat/patients/push").json()["count"] == 0
+
+    # Server down: one Bundle, no splitting, nothing linked; then it comes back
+    db = SessionLocal()
+    db.query(models.Patient).update({"ihs_number": None}, synchronize_session=False)
+    db.commit()
+    db.close()
+    mock.state.bundle_error_status = 503
+    requests_before = len(mock.state.bundles) + mock.state.creates
+    assert client.post("/integration/satusehat/patients/push").json()["count"] == 0
+    assert len(mock.state.bundles) + mock.state.creates - requests_before == 1
+    mock.state.bundle_error_status = None
+    assert client.post("/integration/satusehat/patients/push").json()["count"] == PATIENTS - len(REJECTED)
+    print("503 on a Bundle: push stopped after 1 request, next push linked the backlog")
+
+    print(client.get("/metrics/satusehat-bundles").json())
+    print("OK: backlog pushed in transaction Bundles, rejected rows isolated")
+    mock.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Check the background IHS linking job (services/ihs_linking.py) against the
+latency-injecting mock in mock_satusehat.py.
+
+Seeds patients (some already linked, some with malformed NIKs) and doctors,
+starts the link jobs through the API, polls their progress and verifies that:
+  - only unlinked rows with a 16-digit NIK are looked up,
+  - every registered NIK gets its IHS number, others stay empty,
+  - requests in flight never exceed IHS_LINK_CONCURRENCY and the request
+    rate stays within IHS_LINK_RATE (plus the burst),
+  - a second run only re-checks the NIKs SatuSehat did not know.
+
+Usage:
+    python backend/tests/check_ihs_linking.py [patients] [latency_ms]
+"""
+import sys
+import os
+import tempfile
+import time
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "ihs_linking.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+PATIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 1200
+LATENCY_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+CONCURRENCY, RATE, BURST = 8, 100, 10
+ALREADY_LINKED = PATIENTS // 5
+BAD_NIK = 50
+DOCTORS = 40
+
+from mock_satusehat import start_mock_satusehat, registered
+
+mock, mock_url = start_mock_satusehat(latency_ms=LATENCY_MS, jitter_ms=LATENCY_MS / 2)
+os.environ["SATUSEHAT_AUTH_URL"] = os.environ["SATUSEHAT_BASE_URL"] = mock_url
+os.environ["IHS_LINK_CONCURRENCY"], os.environ["IHS_LINK_RATE"] = str(CONCURRENCY), str(RATE)
+os.environ["IHS_LINK_BURST"], os.environ["IHS_LINK_BATCH_SIZE"] = str(BURST), "100"
+
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal
+from backend import models, auth_utils
+
+def nik(i):
+    return f"3171{i:012d}"
+
+def seed():
+    db = SessionLocal()
+    db.add(models.Issuer(issuer="General", nama="Umum"))
+    db.add(models.MaritalStatus(display="Single"))
+    user = models.User(username="check", password_hash="-", full_name="Check", role="Administrator")
+    db.add(user)
+    for i in range(PATIENTS + BAD_NIK):
+        db.add(models.Patient(
+            firstName=f"Pasien{i}", lastName="IHS", phone=f"08{i:010d}", gender="Male", birthday=date(1990, 1, 1),
+            identityCard=nik(i) if i < PATIENTS else f"12345{i}", issuerId=1, maritalStatusId=1,
+            ihs_number="P-EXISTING" if i < ALREADY_LINKED else None
+        ))
+    for i in range(DOCTORS):
+        db.add(models.DoctorEntity(namaDokter=f"dr. Mock {i}", identityCard=nik(10**6 + i), polyName="Umum"))
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+    return user
+
+def run_job(client, kind):
+    job = client.post(f"/integration/satusehat/{kind}/sync").json()["job"]
+    while job["status"] == "running":
+        time.sleep(1)
+        job = client.get(f"/integration/satusehat/link-jobs/{job['id']}").json()
+        print(f"  {kind}: {job['processed']}/{job['total']} looked up, {job['linked']} linked ({job['rate_per_second']}/s)")
+    assert job["status"] == "done", job
+    return job
+
+def main():
+    user = seed()
+    app.dependency_overrides[auth_utils.get_current_user] = lambda: user
+    client = TestClient(app)
+
+    start = time.perf_counter()
+    job = run_job(client, "patients")
+    elapsed = time.perf_counter() - start
+    expected_lookups = PATIENTS - ALREADY_LINKED
+    expected_linked = sum(registered(nik(i)) for i in range(ALREADY_LINKED, PATIENTS))
+    assert job["total"] == job["processed"] == expected_lookups, job
+    assert job["linked"] == expected_linked, job
+    assert len(mock.state.request_times) == expected_lookups, "linked rows or bad NIKs were looked up"
+
+    db = SessionLocal()
+    for patient in db.query(models.Patient).filter(models.Patient.ihs_number.isnot(None), models.Patient.ihs_number != "P-EXISTING"):
+        assert patient.ihs_number == f"P{patient.identityCard}"
+    assert db.query(models.Patient).filter(models.Patient.ihs_number == "P-EXISTING").count() == ALREADY_LINKED
+    db.close()
+
+    serial = expected_lookups * LATENCY_MS * 1.25 / 1000
+    print(f"patients: {expected_lookups} lookups in {elapsed:.1f}s (serial at this latency: ~{serial:.0f}s); "
+          f"peak in flight {mock.state.max_in_flight}/{CONCURRENCY}, peak {mock.state.max_rate()} req in 1s (limit {RATE} + burst {BURST})")
+    assert mock.state.max_in_flight <= CONCURRENCY
+    assert mock.state.max_rate() <= RATE + BURST
+
+    job = run_job(client, "doctors")
+    assert job["linked"] == sum(registered(nik(10**6 + i)) for i in range(DOCTORS))
+
+    mock.state.request_times.clear()
+    job = run_job(client, "patients")
+    assert job["total"] == expected_lookups - expected_linked
+    print(f"second run: {job['total']} unregistered NIKs re-checked, {job['linked']} linked")
+    print("OK: bulk IHS linking is concurrent, rate limited and skips linked rows")
+    mock.shutdown()
+
+if __name__ == "__main__":
+    main()
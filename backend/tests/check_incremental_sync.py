@@ -0,0 +1,155 @@
+"""
+Check the incremental ERPNext push (services/incremental_sync.py,
+services/erpnext_push.py) against a throwaway HTTP server standing in for
+ERPNext:
+  - the first push sends every patient and records the watermark,
+  - a second push with nothing changed makes no calls at all,
+  - after editing a few rows only those are sent,
+  - a failed push keeps the watermark at the failed row and the next run
+    retries it,
+  - writing back the ERPNext id (frappe_id) does not count as a change.
+
+Usage:
+    python backend/tests/check_incremental_sync.py [patients]
+"""
+import sys
+import os
+import json
+import tempfile
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "incremental_sync.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+os.environ.setdefault("SYNC_SETTLE_SECONDS", "0")
+
+PATIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+class FakeERPNext(BaseHTTPRequestHandler):
+    writes = []
+    fail_mobile = None
+    lock = threading.Lock()
+
+    def do_GET(self):
+        self._reply(200, {"data": []})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if body.get("mobile") == FakeERPNext.fail_mobile:
+            return self._reply(500, {"exc": "boom"})
+        with FakeERPNext.lock:
+            FakeERPNext.writes.append(("POST", body.get("mobile")))
+            name = f"PAT-{len(FakeERPNext.writes):06d}"
+        self._reply(200, {"data": {"name": name}})
+
+    def do_PUT(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if body.get("mobile") == FakeERPNext.fail_mobile:
+            return self._reply(500, {"exc": "boom"})
+        with FakeERPNext.lock:
+            FakeERPNext.writes.append(("PUT", body.get("mobile")))
+        self._reply(200, {"data": {"name": self.path.rsplit("/", 1)[-1]}})
+
+    def _reply(self, code, data):
+        raw = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *_):
+        pass
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), FakeERPNext)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+os.environ["FRAPPE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+from backend.database import engine, Base, SessionLocal
+from backend import models
+from backend.services.erpnext_push import push_changes, TARGET_PATIENT
+from backend.services.incremental_sync import keep_updated_at
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(models.Issuer(issuer="General", nama="Umum"))
+    db.add(models.MaritalStatus(display="Single"))
+    db.add_all(models.Patient(
+        firstName=f"Pasien{i}", lastName="Sync", phone=f"08{i:010d}", gender="Male", birthday=date(1990, 1, 1),
+        identityCard=f"{i:016d}", issuerId=1, maritalStatusId=1
+    ) for i in range(PATIENTS))
+    db.commit()
+    db.close()
+
+def push():
+    FakeERPNext.writes.clear()
+    db = SessionLocal()
+    start = time.perf_counter()
+    report = push_changes(db, TARGET_PATIENT)
+    elapsed = time.perf_counter() - start
+    db.close()
+    print(f"  {report['changed']} changed, {report['pushed']} pushed, {report['failed']} failed, "
+          f"{len(FakeERPNext.writes)} writes in {elapsed * 1000:.0f}ms")
+    return report
+
+def edit(ids, **values):
+    db = SessionLocal()
+    for patient in db.query(models.Patient).filter(models.Patient.id.in_(ids)):
+        for key, value in values.items():
+            setattr(patient, key, value)
+    db.commit()
+    db.close()
+
+def main():
+    seed()
+    print("first push:")
+    report = push()
+    assert report["pushed"] == PATIENTS and all(method == "POST" for method, _ in FakeERPNext.writes)
+    db = SessionLocal()
+    assert db.query(models.Patient).filter(models.Patient.frappe_id.is_(None)).count() == 0
+    db.close()
+
+    print("nothing changed:")
+    report = push()
+    assert report["changed"] == 0 and not FakeERPNext.writes
+
+    print("5 patients edited:")
+    edit([3, 50, 700, 1200, PATIENTS], lastName="Diubah")
+    report = push()
+    assert report["pushed"] == 5 and sorted(m for _, m in FakeERPNext.writes) == sorted(
+        f"08{i - 1:010d}" for i in [3, 50, 700, 1200, PATIENTS])
+
+    print("3 edited, the second one fails:")
+    edit([10], lastName="A")
+    edit([20], lastName="B")
+    edit([30], lastName="C")
+    FakeERPNext.fail_mobile = f"08{19:010d}"
+    report = push()
+    assert report["pushed"] == 2 and report["failed"] == 1 and "erpnext.patient 20" in report["error"]
+    FakeERPNext.fail_mobile = None
+    print("retry:")
+    report = push()
+    # Restarts at the failed row; the one after it goes again (a harmless update)
+    assert report["pushed"] == 2 and report["failed"] == 0
+
+    print("remote id written back:")
+    db = SessionLocal()
+    patient = db.get(models.Patient, 40)
+    patient.frappe_id = "PAT-RELINKED"
+    keep_updated_at(patient)
+    db.commit()
+    db.close()
+    report = push()
+    assert report["changed"] == 0
+
+    print("OK: incremental push only sends what changed")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Check the local KFA catalog mirror (services/kfa_catalog.py) against the KFA
+stub in mock_satusehat.py:
+  - a full refresh mirrors the whole catalog into kfa_products,
+  - searches come from the in-memory index, in well under a millisecond,
+    with results shaped exactly like _parse_kfa_product of the live API,
+  - an incremental refresh only fetches products updated since the last one,
+  - a full refresh drops products KFA no longer lists,
+  - search keeps working while KFA is down, and a refresh failing then
+    leaves the index alone,
+  - a restart rebuilds the index from the table without calling KFA.
+
+Usage:
+    python backend/tests/check_kfa_catalog.py [products] [latency_ms]
+"""
+import sys
+import os
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "kfa_catalog.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+PRODUCTS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+LATENCY_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 150
+
+from mock_satusehat import start_mock_satusehat, KFA_DRUGS
+
+mock, mock_url = start_mock_satusehat(latency_ms=LATENCY_MS, jitter_ms=0)
+os.environ["SATUSEHAT_AUTH_URL"] = os.environ["SATUSEHAT_BASE_URL"] = os.environ["KFA_BASE_URL"] = mock_url
+
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend import models, auth_utils
+from backend.services.kfa_catalog import kfa_catalog, KfaCatalog, PAGE_SIZE
+from backend.services.satu_sehat_service import satu_sehat_client
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def main():
+    user = models.User(username="check", password_hash="-", full_name="Check", role="Administrator")
+    app.dependency_overrides[auth_utils.get_current_user] = lambda: user
+    app.dependency_overrides[auth_utils.get_current_user_released] = lambda: user
+    client = TestClient(app)
+    mock.state.add_kfa_products(PRODUCTS)
+
+    start = time.perf_counter()
+    upstream = client.get("/integration/kfa/products", params={"query": "paracetamol 500", "limit": 10}).json()
+    upstream_ms = (time.perf_counter() - start) * 1000
+    assert upstream and mock.state.kfa_requests == 1
+
+    report = kfa_catalog.refresh(full=True)
+    print(f"full refresh: {report['products']} products, {report['pages']} pages in {report['duration_ms']:.0f}ms, "
+          f"index {kfa_catalog.stats()['tokens']} tokens built in {kfa_catalog.build_ms:.0f}ms")
+    assert report["products"] == PRODUCTS and report["pages"] == PRODUCTS // PAGE_SIZE + 1
+
+    # Same shape as the live API, item for item
+    raw = mock.state.kfa_products[7]
+    local = kfa_catalog.search(raw["kfa_code"])
+    assert local == [satu_sehat_client._parse_kfa_product(raw)], local
+
+    results = client.get("/integration/kfa/products", params={"query": "paracetamol 500", "limit": 10}).json()
+    assert mock.state.kfa_requests == 1 + report["pages"], "search went to KFA"
+    assert len(results) == 10 and all(r["name"].lower().startswith("paracetamol 500") for r in results), results
+    assert set(results[0]) == set(upstream[0])
+
+    queries = [drug[:n] for drug in KFA_DRUGS for n in (2, 3, 5, len(drug))]
+    queries += [f"{drug.split()[0].lower()} {strength}" for drug in KFA_DRUGS for strength in (5, 50, 500)]
+    queries += ["kalbe", "sirup amox", "9300001", "zzz"]
+    timings = []
+    for _ in range(5):
+        for query in queries:
+            start = time.perf_counter()
+            kfa_catalog.search(query, 1, 10)
+            timings.append((time.perf_counter() - start) * 1e6)
+    print(f"search:       KFA {upstream_ms:.0f}ms per lookup; index p50 {percentile(timings, 0.5):.0f}us, "
+          f"p99 {percentile(timings, 0.99):.0f}us, max {max(timings):.0f}us over {len(timings)} searches")
+    assert percentile(timings, 0.99) < 1000
+
+    mock.state.update_kfa_product(5, name="Parasetamol Baru 500 mg Tablet")
+    before = PRODUCTS
+    mock.state.add_kfa_products(10)
+    for k in range(before, before + 10):
+        mock.state.update_kfa_product(k)
+    report = kfa_catalog.refresh()
+    print(f"incremental:  {report['products']} changed products in {report['pages']} page(s), from {report['from_date']}")
+    assert not report["full"] and report["products"] == 11 and report["pages"] == 1
+    assert kfa_catalog.search("parasetamol baru")[0]["item_code"] == mock.state.kfa_products[5]["kfa_code"]
+
+    gone = mock.state.kfa_products.pop()
+    report = kfa_catalog.refresh(full=True)
+    assert report["deactivated"] == 1 and not kfa_catalog.search(gone["kfa_code"])
+    print(f"full refresh: {report['deactivated']} product KFA no longer lists dropped")
+
+    mock.state.error_status = 503
+    report = kfa_catalog.refresh()
+    assert "error" in report and kfa_catalog.stats()["products"] == PRODUCTS + 9
+    results = client.get("/integration/kfa/products", params={"query": "amlo 10"}).json()
+    mock.state.error_status = None
+    assert results and all("amlodipine 10" in r["name"].lower() for r in results)
+    print("KFA down:     refresh failed, search still served from the index")
+
+    requests = mock.state.kfa_requests
+    restarted = KfaCatalog()
+    assert restarted.load() == PRODUCTS + 9 and mock.state.kfa_requests == requests
+    print(f"restart:      index rebuilt from kfa_products in {restarted.build_ms:.0f}ms")
+
+    print(client.get("/metrics/kfa-catalog").json())
+    print("OK: KFA autocomplete served from the local mirror")
+    mock.shutdown()
+
+if __name__ == "__main__":
+    main()
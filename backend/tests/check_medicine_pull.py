@@ -0,0 +1,250 @@
+"""
+Check the bulk ERPNext medicine pull (services/medicine_pull.py, POST
+/medicines/sync) against a throwaway HTTP server standing in for ERPNext:
+  - a catalog of thousands of items syncs in a few requests (Item and Bin
+    pages, Bin summed per item_code) and a few SQL statements,
+  - stock is the sum over all of an item's Bins, new items are created and
+    linked medicines updated,
+  - new items take ERPNext's standard_rate as retail price, and a push
+    right after the pull sends none of the pulled items back,
+  - a second pull with nothing changed writes nothing, and pulled updates
+    leave updated_at alone (no push back to ERPNext),
+  - ERPNext refusing group_by falls back to plain Bin pages,
+  - a failed stock read writes nothing instead of zeroing the stock,
+and compares with the former one Bin request and one SELECT per item.
+
+Usage:
+    python backend/tests/check_medicine_pull.py [items] [latency_ms]
+"""
+import sys
+import os
+import json
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "medicine_pull.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+os.environ.setdefault("SYNC_SETTLE_SECONDS", "0")
+
+ITEMS = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+LATENCY_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+# Medicines already linked before the first pull
+EXISTING = ITEMS // 3
+
+def item_code(i):
+    return f"MED-{i:05d}"
+
+class FakeERPNext(BaseHTTPRequestHandler):
+    items = []
+    # [item_code, warehouse, actual_qty]
+    bins = []
+    requests = {}
+    # Item codes written by a push (PUT / POST)
+    writes = []
+    fail_bin = False
+    refuse_group_by = False
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        doctype = url.path.rsplit("/", 1)[-1]
+        with FakeERPNext.lock:
+            FakeERPNext.requests[doctype] = FakeERPNext.requests.get(doctype, 0) + 1
+        time.sleep(LATENCY_MS / 1000)
+        filters = json.loads(params.get("filters", "{}"))
+        start = int(params.get("limit_start", 0))
+        length = int(params.get("limit_page_length", 20))
+
+        if doctype == "Item":
+            rows = sorted(FakeERPNext.items, key=lambda item: item["name"])
+        elif doctype == "Bin":
+            if FakeERPNext.fail_bin or (FakeERPNext.refuse_group_by and "group_by" in params):
+                return self._reply(417, {"exc": "Field not permitted in query: sum(actual_qty)"})
+            bins = [b for b in FakeERPNext.bins if filters.get("item_code", b[0]) == b[0]]
+            if params.get("group_by") == "item_code":
+                totals = {}
+                for code, _, qty in bins:
+                    totals[code] = totals.get(code, 0) + qty
+                rows = [{"item_code": code, "actual_qty": totals[code]} for code in sorted(totals)]
+            else:
+                rows = [{"item_code": code, "warehouse": wh, "actual_qty": qty} for code, wh, qty in bins]
+        else:
+            rows = []
+        self._reply(200, {"data": rows[start:start + length] if "limit_start" in params else rows})
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        with FakeERPNext.lock:
+            FakeERPNext.writes.append(urlparse(self.path).path.rsplit("/", 1)[-1])
+        self._reply(200, {"data": {}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        with FakeERPNext.lock:
+            FakeERPNext.writes.append(body.get("item_code"))
+        self._reply(200, {"data": {"name": body.get("item_code")}})
+
+    def _reply(self, code, data):
+        raw = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *_):
+        pass
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), FakeERPNext)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+os.environ["FRAPPE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+from sqlalchemy import event
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal, engine
+from backend import models, dependencies
+from backend.services.frappe_service import frappe_client
+from backend.services.erpnext_push import push_changes, TARGET_MEDICINE
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+def seed():
+    for i in range(ITEMS):
+        FakeERPNext.items.append({"name": item_code(i), "item_name": f"Obat {i}", "stock_uom": "Tablet",
+                                  "description": f"Obat nomor {i}", "standard_rate": 1000})
+        # Every third item is kept in two warehouses
+        FakeERPNext.bins.append([item_code(i), "Gudang Utama", float(i % 50)])
+        if i % 3 == 0:
+            FakeERPNext.bins.append([item_code(i), "Apotek", 5.0])
+    db = SessionLocal()
+    db.add_all([models.Medicine(erpnext_item_code=item_code(i), medicineName=f"Obat lama {i}", unit="Strip",
+                                qty=0, medicinePrice=700, medicineRetailPrice=900) for i in range(EXISTING)])
+    # A local medicine ERPNext does not know about stays as it is
+    db.add(models.Medicine(erpnext_item_code="MANUAL-0001", medicineName="Racikan", qty=3))
+    user = models.User(username="check", password_hash="-", full_name="Check", role="Administrator")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+    return user
+
+def expected_qty(i):
+    return i % 50 + (5 if i % 3 == 0 else 0)
+
+def pull(client) -> tuple:
+    """(response, ERPNext requests, SQL statements, seconds)"""
+    FakeERPNext.requests = {}
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    start = time.perf_counter()
+    try:
+        response = client.post("/medicines/sync").json()
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+    return response, sum(FakeERPNext.requests.values()), counter.count, time.perf_counter() - start
+
+def per_item_pull(db) -> tuple:
+    """The former pull: one Bin request and one Medicine SELECT per item. (requests, statements, seconds)"""
+    FakeERPNext.requests = {}
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+    start = time.perf_counter()
+    try:
+        for item in frappe_client.get_items():
+            stock_qty = frappe_client.get_item_stock(item["name"])
+            med = db.query(models.Medicine).filter(models.Medicine.erpnext_item_code == item["name"]).first()
+            med.qty = int(stock_qty)
+        db.commit()
+    finally:
+        event.remove(engine, "before_cursor_execute", counter)
+    return sum(FakeERPNext.requests.values()), counter.count, time.perf_counter() - start
+
+def main():
+    user = seed()
+    app.dependency_overrides[dependencies.get_current_user] = lambda: user
+    client = TestClient(app)
+
+    report, requests, statements, first_elapsed = pull(client)
+    print(f"first pull:  {report['count']} items ({report['created']} new, {report['updated']} updated) "
+          f"in {requests} requests, {statements} statements, {first_elapsed * 1000:.0f}ms")
+    assert report["status"] == "success", report
+    assert report["count"] == ITEMS and report["created"] == ITEMS - EXISTING and report["updated"] == EXISTING
+    # Pages of 500 until a short one
+    pages = ITEMS // 500 + 1
+    assert requests == 2 * pages and statements <= 10, (FakeERPNext.requests, statements)
+
+    db = SessionLocal()
+    meds = {m.erpnext_item_code: m for m in db.query(models.Medicine)}
+    assert len(meds) == ITEMS + 1 and meds["MANUAL-0001"].qty == 3
+    for i in range(ITEMS):
+        med = meds[item_code(i)]
+        assert med.qty == expected_qty(i) and med.medicineName == f"Obat {i}" and med.unit == "Tablet", i
+    assert meds[item_code(0)].medicinePrice == 700, "pull overwrote a local price"
+    assert meds[item_code(0)].medicineRetailPrice == 900, "pull overwrote a local price"
+    assert meds[item_code(ITEMS - 1)].medicineRetailPrice == 1000, "new item without ERPNext's standard_rate"
+    updated_at = {code: m.updated_at for code, m in meds.items()}
+
+    # Only the rows created locally are pushed; the pulled ones are ERPNext's data
+    FakeERPNext.writes = []
+    result = push_changes(db, TARGET_MEDICINE)
+    assert sorted(FakeERPNext.writes) == sorted([item_code(i) for i in range(EXISTING)] + ["MANUAL-0001"]), result
+    FakeERPNext.writes = []
+    result = push_changes(db, TARGET_MEDICINE)
+    assert result["changed"] == 0 and not FakeERPNext.writes, result
+    print(f"push after pull: {EXISTING + 1} local rows pushed, none of the {ITEMS - EXISTING} pulled ones")
+    db.close()
+
+    report, requests, statements, _ = pull(client)
+    print(f"second pull: {report['unchanged']} unchanged, {report['updated']} updated, {statements} statements")
+    assert report["updated"] == 0 and report["created"] == 0 and report["unchanged"] == ITEMS
+    assert statements <= 3
+
+    FakeERPNext.bins[0][2] += 7
+    FakeERPNext.items[1]["item_name"] = "Obat 1 Forte"
+    FakeERPNext.refuse_group_by = True
+    report, _, _, _ = pull(client)
+    FakeERPNext.refuse_group_by = False
+    print(f"no group_by: {report['updated']} updated from {FakeERPNext.requests['Bin']} Bin requests "
+          f"({len(FakeERPNext.bins)} Bins, summed here)")
+    assert report["updated"] == 2 and FakeERPNext.requests["Bin"] == 1 + len(FakeERPNext.bins) // 500 + 1
+    db = SessionLocal()
+    changed = {m.erpnext_item_code: m for m in db.query(models.Medicine).filter(
+        models.Medicine.erpnext_item_code.in_([item_code(0), item_code(1)]))}
+    assert changed[item_code(0)].qty == expected_qty(0) + 7 and changed[item_code(1)].medicineName == "Obat 1 Forte"
+    assert all(m.updated_at == updated_at[code] for code, m in changed.items()), "pull bumped updated_at"
+    db.close()
+
+    FakeERPNext.fail_bin = True
+    FakeERPNext.bins[0][2] += 1
+    report, _, statements, _ = pull(client)
+    FakeERPNext.fail_bin = False
+    db = SessionLocal()
+    assert report["status"] == "failed" and statements == 0
+    assert db.query(models.Medicine).filter(models.Medicine.erpnext_item_code == item_code(0)).one().qty == expected_qty(0) + 7
+    print("Bin read failing: nothing written")
+
+    requests, statements, elapsed_old = per_item_pull(db)
+    db.close()
+    print(f"per item:    {requests} requests, {statements} statements, {elapsed_old * 1000:.0f}ms "
+          f"(bulk: {2 * pages} requests, {first_elapsed * 1000:.0f}ms)")
+    assert requests == pages + ITEMS
+
+    print("OK: medicine pull runs in a few requests and statements")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Check the phonetic / typo-tolerant name matching in services/patient_search.py.
+
+1. Common Indonesian spelling variants must share a phonetic or skeleton key.
+2. On a small patient table, misspelled queries must find the intended
+   patient, with the closest spelling ranked first and exact matches ahead of
+   fuzzy ones, even when more than FUZZY_CANDIDATES far-off names share the key.
+3. A patient matched by several tiers (exact phone and NIK prefix) is listed
+   once across all cursor pages, not once per page.
+
+Usage:
+    python backend/tests/check_name_matching.py
+"""
+import sys
+import os
+import tempfile
+from datetime import date
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "name_matching.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from backend.database import engine, Base, SessionLocal
+from backend import models
+from backend.services.patient_search import word_keys, search_patients, index_patient, FUZZY_CANDIDATES
+
+VARIANTS = [
+    ("muhammad", "muhamad"), ("mohammad", "muhammad"), ("nurhaliza", "nurhalizah"),
+    ("soekarno", "sukarno"), ("djoko", "joko"), ("chairul", "hairul"), ("ramadhan", "ramadan"),
+    ("tjipto", "cipto"), ("fatimah", "fatima"), ("yoesoef", "yusuf"), ("santoso", "santosa"),
+]
+
+NAMES = [
+    ("Muhammad", "Rizki"), ("Muhamad", "Rizky"), ("Siti", "Nurhaliza"), ("Djoko", "Susilo"),
+    ("Chairul", "Tanjung"), ("Budi", "Santoso"), ("Agus", "Ramadhan"), ("Dewi", "Lestari"),
+]
+
+# (query, expected first result, other patients that must be found too)
+SEARCHES = [
+    ("Muhamad Rizky", "Muhamad Rizky", ["Muhammad Rizki"]),
+    ("Mohammad Rizki", "Muhammad Rizki", ["Muhamad Rizky"]),
+    ("siti nurhalizah", "Siti Nurhaliza", []),
+    ("Joko Soesilo", "Djoko Susilo", []),
+    ("Hairul", "Chairul Tanjung", []),
+    ("budi santosa", "Budi Santoso", []),
+    ("agus ramadan", "Agus Ramadhan", []),
+    ("santosa", "Budi Santoso", []),
+]
+
+# Same skeleton key as "santosa" (~snts), much further in spelling; seeded
+# first so they come ahead of Budi Santoso in id order
+FAR_MATCH = ("Eko", "Suuniitoosee")
+# Matches "081234567890" as exact phone (one of them) and as NIK prefix (both)
+SHARED_PREFIX = "081234567890"
+
+def seed():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(models.Issuer(issuer="General", nama="Umum"))
+    db.add(models.MaritalStatus(display="Single"))
+    people = [FAR_MATCH] * (FUZZY_CANDIDATES + 50) + NAMES
+    for i, (first, last) in enumerate(people):
+        patient = models.Patient(
+            firstName=first, lastName=last, phone=f"08{i:010d}", gender="Male", birthday=date(1990, 1, 1),
+            identityCard=f"{i:016d}", issuerId=1, maritalStatusId=1
+        )
+        db.add(patient)
+        db.flush()
+        index_patient(db, patient)
+    for i, phone in enumerate([SHARED_PREFIX, "089999999999"]):
+        patient = models.Patient(
+            firstName="Tier", lastName=f"Check{i}", phone=phone, gender="Male", birthday=date(1990, 1, 1),
+            identityCard=f"{SHARED_PREFIX}000{i}", issuerId=1, maritalStatusId=1
+        )
+        db.add(patient)
+        db.flush()
+        index_patient(db, patient)
+    db.commit()
+    db.close()
+
+def main():
+    failures = 0
+    for a, b in VARIANTS:
+        shared = set(word_keys(a)) & set(word_keys(b))
+        status = "OK  " if shared else "FAIL"
+        failures += not shared
+        print(f"{status} {a:10} ~ {b:10} {sorted(shared)}")
+
+    seed()
+    db = SessionLocal()
+    for query, first, others in SEARCHES:
+        found = [f"{p.firstName} {p.lastName}" for p in search_patients(db, query)[0]]
+        ok = bool(found) and found[0] == first and all(o in found for o in others)
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {query!r:20} -> {found[:3]}")
+
+    listed, cursor = [], None
+    while True:
+        page, cursor = search_patients(db, SHARED_PREFIX, limit=1, cursor=cursor)
+        listed += [f"{p.firstName} {p.lastName}" for p in page]
+        if not cursor:
+            break
+    ok = listed == ["Tier Check0", "Tier Check1"]
+    failures += not ok
+    print(f"{'OK  ' if ok else 'FAIL'} {SHARED_PREFIX!r:20} -> {listed} (one per page)")
+    db.close()
+
+    if failures:
+        print(f"{failures} check(s) failed")
+        sys.exit(1)
+    print("OK: all name variants matched")
+
+if __name__ == "__main__":
+    main()
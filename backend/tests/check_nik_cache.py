@@ -0,0 +1,114 @@
+"""
+Check the SatuSehat NIK lookup cache (services/nik_cache.py) against
+mock_satusehat.py:
+  - repeated lookups are answered from memory with no request to SatuSehat,
+  - after a restart (memory emptied) they come from the nik_lookups table,
+  - "not registered" answers expire after the short negative TTL while
+    found ones stay,
+  - failed lookups are not cached,
+  - DELETE /integration/satusehat/nik-cache/{nik} forces a fresh lookup,
+  - the async client shares the cache.
+
+Usage:
+    python backend/tests/check_nik_cache.py [niks]
+"""
+import sys
+import os
+import asyncio
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "nik_cache.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+NIKS = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+# Longer than the cold pass below (about 50ms per NIK), so no negative expires during it
+NEGATIVE_TTL = 6
+os.environ["NIK_CACHE_NEGATIVE_TTL_SECONDS"] = str(NEGATIVE_TTL)
+
+from mock_satusehat import start_mock_satusehat, registered
+
+mock, mock_url = start_mock_satusehat(latency_ms=40, jitter_ms=10)
+os.environ["SATUSEHAT_AUTH_URL"] = os.environ["SATUSEHAT_BASE_URL"] = mock_url
+
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend import models, auth_utils
+from backend.services.nik_cache import nik_cache
+from backend.services.satu_sehat_service import satu_sehat_client, async_satu_sehat_client
+
+niks = [f"3171{i:012d}" for i in range(NIKS)]
+unregistered = [n for n in niks if not registered(n)]
+
+def searches() -> int:
+    return len(mock.state.request_times)
+
+def lookup_all() -> tuple:
+    """(answers, SatuSehat requests made, ms per lookup)"""
+    before, start = searches(), time.perf_counter()
+    answers = [satu_sehat_client.search_patient_by_nik(nik) for nik in niks]
+    return answers, searches() - before, (time.perf_counter() - start) * 1000 / len(niks)
+
+def check(answers):
+    for nik, answer in zip(niks, answers):
+        assert (answer["ihs_number"] == f"P{nik}") if registered(nik) else answer is None, (nik, answer)
+
+def main():
+    answers, requests, ms = lookup_all()
+    cold_done = time.monotonic()
+    check(answers)
+    print(f"cold:            {requests} SatuSehat requests, {ms:.2f}ms per lookup")
+    assert requests == NIKS
+
+    answers, requests, ms = lookup_all()
+    check(answers)
+    print(f"warm (memory):   {requests} SatuSehat requests, {ms:.3f}ms per lookup")
+    assert requests == 0
+
+    nik_cache._memory.clear()  # what a restart leaves behind
+    answers, requests, ms = lookup_all()
+    check(answers)
+    print(f"restart (table): {requests} SatuSehat requests, {ms:.2f}ms per lookup")
+    assert requests == 0 and nik_cache.db_hits == NIKS
+
+    time.sleep(max(0, cold_done + NEGATIVE_TTL + 0.1 - time.monotonic()))
+    answers, requests, ms = lookup_all()
+    check(answers)
+    print(f"after negative TTL: {requests} SatuSehat requests ({len(unregistered)} unregistered NIKs)")
+    assert requests == len(unregistered)
+
+    fresh = "3171999999999998"
+    mock.state.error_status = 503
+    assert satu_sehat_client.search_patient_by_nik(fresh) is None
+    mock.state.error_status = None
+    before = searches()
+    assert satu_sehat_client.search_patient_by_nik(fresh)["ihs_number"] == f"P{fresh}"
+    assert searches() - before == 1, "a failed lookup was cached"
+    print("failed lookup:   not cached, retried on the next call")
+
+    user = models.User(username="check", password_hash="-", full_name="Check", role="Administrator")
+    app.dependency_overrides[auth_utils.get_current_user] = lambda: user
+    client = TestClient(app)
+    assert client.delete(f"/integration/satusehat/nik-cache/{niks[1]}").json() == {"status": "success", "deleted": 1}
+    before = searches()
+    satu_sehat_client.search_patient_by_nik(niks[1])
+    assert searches() - before == 1
+    print("invalidated NIK: looked up again")
+
+    async def async_lookups():
+        return await asyncio.gather(*[async_satu_sehat_client.search_patient_by_nik(nik) for nik in niks])
+
+    before = searches()
+    check(asyncio.run(async_lookups()))
+    assert searches() == before
+    print("async client:    served from the same cache")
+
+    print(client.get("/metrics/nik-cache").json())
+    print("OK: repeated NIK lookups cost no SatuSehat round trip")
+    mock.shutdown()
+
+if __name__ == "__main__":
+    main()
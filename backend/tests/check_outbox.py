@@ -0,0 +1,179 @@
+"""
+End-to-end check of the transactional outbox (services/outbox.py).
+
+Starts a throwaway HTTP server standing in for ERPNext, registers patients and
+queue tickets through the API, and verifies that:
+  - the requests make no Frappe calls themselves (messages are only queued),
+  - the worker delivers every message exactly once, even with several
+    workers claiming concurrently,
+  - failed deliveries are retried with backoff and eventually succeed,
+  - a POST that ERPNext applied but whose reply was lost is not repeated
+    on retry (the record is found by its key first).
+
+Usage:
+    python backend/tests/check_outbox.py [patients]
+"""
+import sys
+import os
+import json
+import tempfile
+from urllib.parse import urlparse, parse_qs
+import threading
+from datetime import date, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "outbox.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+PATIENTS = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+
+def _matches(body: dict, filters: dict) -> bool:
+    for field, cond in filters.items():
+        value = str(body.get(field) or "")
+        if isinstance(cond, list) and cond[0] == "like":
+            if cond[1].strip("%") not in value:
+                return False
+        elif value != str(cond):
+            return False
+    return True
+
+class FakeFrappe(BaseHTTPRequestHandler):
+    calls = []
+    fail_next = 0
+    # Applied, but answered with an error (like a reply lost to a timeout)
+    lose_reply_next = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        filters = json.loads(parse_qs(url.query).get("filters", ["{}"])[0])
+        with FakeFrappe.lock:
+            found = [{"name": f"PAT-{i + 1:05d}"} for i, (path, body) in enumerate(FakeFrappe.calls)
+                     if path == url.path and filters and _matches(body, filters)]
+        self._reply(200, {"data": found})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with FakeFrappe.lock:
+            if FakeFrappe.fail_next > 0:
+                FakeFrappe.fail_next -= 1
+                return self._reply(503, {"exc": "down"})
+            FakeFrappe.calls.append((self.path, body))
+            name = f"PAT-{len(FakeFrappe.calls):05d}"
+            if FakeFrappe.lose_reply_next > 0:
+                FakeFrappe.lose_reply_next -= 1
+                return self._reply(504, {"exc": "gateway timeout"})
+        self._reply(200, {"data": {"name": name}})
+
+    def _reply(self, code, data):
+        raw = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *_):
+        pass
+
+server = ThreadingHTTPServer(("127.0.0.1", 0), FakeFrappe)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+os.environ["FRAPPE_URL"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal
+from backend import models, dependencies, outbox_worker
+from backend.services import outbox
+from backend.services.outbox_handlers import TOPIC_FRAPPE_CREATE_PATIENT, TOPIC_SATUSEHAT_LINK_PATIENT
+
+def seed_user():
+    db = SessionLocal()
+    db.add(models.Issuer(issuer="General", nama="Umum"))
+    db.add(models.MaritalStatus(display="Single"))
+    user = models.User(username="check", password_hash="-", full_name="Check", role="Administrator")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+    return user
+
+def drain(workers=3, rounds=50):
+    """Run several workers' claim/process loops side by side until nothing is due."""
+    def worker():
+        with outbox_worker.ThreadPoolExecutor(max_workers=2) as executor:
+            for _ in range(rounds):
+                if outbox_worker.run_once(executor) == 0:
+                    return
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def make_due(db):
+    db.query(models.OutboxMessage).filter(models.OutboxMessage.status == outbox.STATUS_PENDING).update(
+        {"nextAttemptAt": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
+def main():
+    user = seed_user()
+    app.dependency_overrides[dependencies.get_current_user] = lambda: user
+    client = TestClient(app)
+
+    for i in range(PATIENTS):
+        resp = client.post("/patients", json={
+            "firstName": f"Pasien{i}", "lastName": "Outbox", "phone": f"08{i:010d}", "gender": "Male",
+            "birthday": str(date(1990, 1, 1)), "identityCard": f"{i:016d}", "religion": "Islam",
+            "profession": "-", "education": "-", "province": "-", "city": "-", "district": "-",
+            "subdistrict": "-", "rt": "01", "rw": "01", "postalCode": "00000", "issuerId": 1, "maritalStatusId": 1
+        })
+        assert resp.status_code == 200, resp.text
+        resp = client.post("/patients/queue", json={"userId": resp.json()["id"], "queueType": "Doctor"})
+        assert resp.status_code == 200, resp.text
+
+    assert not FakeFrappe.calls, "requests must not call Frappe inline"
+    db = SessionLocal()
+    stats = outbox.outbox_stats(db)
+    print(f"queued: {stats}")
+    assert stats["pending"] == PATIENTS * 3
+
+    # SatuSehat isn't configured here, so those messages keep failing; park them
+    db.query(models.OutboxMessage).filter(models.OutboxMessage.topic == TOPIC_SATUSEHAT_LINK_PATIENT).update(
+        {"status": outbox.STATUS_DEAD}, synchronize_session=False)
+    db.commit()
+
+    # First deliveries partly fail or lose their reply, then retries get through
+    FakeFrappe.fail_next = PATIENTS // 4
+    FakeFrappe.lose_reply_next = PATIENTS // 4
+    drain()
+    retry_pending = db.query(models.OutboxMessage).filter(models.OutboxMessage.status == outbox.STATUS_PENDING).count()
+    print(f"after first pass: {retry_pending} waiting for retry")
+    for _ in range(5):
+        make_due(db)
+        drain()
+
+    stats = outbox.outbox_stats(db)
+    print(f"drained: {stats}")
+    assert stats["pending"] == 0 and stats["processing"] == 0
+    assert stats["done"] == PATIENTS * 2
+
+    created = [body for path, body in FakeFrappe.calls if path == "/api/resource/Patient"]
+    events = [body for path, body in FakeFrappe.calls if path == "/api/resource/Event"]
+    assert len(created) == PATIENTS, f"{len(created)} patient creates for {PATIENTS} patients"
+    assert len(events) == PATIENTS, f"{len(events)} appointments for {PATIENTS} tickets"
+    assert all(body["first_name"] for body in created)
+    linked = db.query(models.Patient).filter(models.Patient.frappe_id.isnot(None)).count()
+    assert linked == PATIENTS
+    retried = db.query(models.OutboxMessage).filter(
+        models.OutboxMessage.topic == TOPIC_FRAPPE_CREATE_PATIENT, models.OutboxMessage.attempts > 1).count()
+    print(f"OK: {PATIENTS * 2} messages delivered exactly once ({retried} patient creates needed a retry)")
+    db.close()
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
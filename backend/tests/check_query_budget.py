@@ -0,0 +1,112 @@
+"""
+SQL statement budget check for the list endpoints.
+
+Seeds a throwaway SQLite database with a busy day (300 queue tickets,
+200 medicines with batches, 200 appointments), calls each endpoint once and
+fails if it issues more statements than its budget. A lazy-loaded
+relationship slipping back into a response shows up here as hundreds of
+statements instead of a handful.
+
+Usage:
+    python backend/tests/check_query_budget.py
+"""
+import sys
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+db_file = os.path.join(tempfile.mkdtemp(), "query_budget.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from sqlalchemy import event
+from fastapi.testclient import TestClient
+from backend.main import app
+from backend.database import SessionLocal, engine
+from backend import models, dependencies, auth_utils, clinic_time
+from backend.services.queue_cache import queue_snapshot_cache
+
+# Max statements per request (auth is overridden, so these are the endpoint's own)
+BUDGETS = {
+    "/patients/queue": 2,
+    "/medicines/": 2,
+    "/dashboard/overview": 6,
+    "/appointments": 2,
+    "/appointments/today": 2,
+}
+
+class StatementCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+def seed():
+    db = SessionLocal()
+    db.add(models.Issuer(issuer="General", nama="Umum"))
+    db.add(models.MaritalStatus(display="Single"))
+    doctors = [models.DoctorEntity(gelarDepan="dr.", namaDokter=f"Dokter {i}", polyName="General", identityCard=f"D{i:015d}") for i in range(10)]
+    db.add_all(doctors)
+    db.flush()
+
+    now = datetime.utcnow()
+    today = clinic_time.local_today()
+    for i in range(300):
+        patient = models.Patient(
+            firstName=f"Pasien{i}", lastName="Test", phone=f"0812{i:08d}", gender="Male",
+            birthday=date(1990, 1, 1), identityCard=f"{i:016d}", religion="Islam", profession="-",
+            education="-", province="-", city="-", district="-", subdistrict="-", rt="01", rw="01",
+            postalCode="00000", issuerId=1, maritalStatusId=1
+        )
+        db.add(patient)
+        db.flush()
+        db.add(models.PatientQueue(
+            numberQueue=f"D{i + 1:03d}", userId=patient.id, appointmentTime=now - timedelta(minutes=i % 60),
+            status="Waiting", medicalFacilityPolyDoctorId=doctors[i % 10].medicalFacilityPolyDoctorId
+        ))
+        if i < 200:
+            db.add(models.Appointment(
+                nik_patient=patient.identityCard, appointment_date=today + timedelta(days=1),
+                appointment_time="10:00", status="Scheduled"
+            ))
+
+    for i in range(200):
+        med = models.Medicine(erpnext_item_code=f"ITEM-{i}", medicineName=f"Obat {i}", unit="Tablet")
+        med.batches = [models.MedicineBatch(batchNumber=f"B{i}-{b}", qty=10) for b in range(3)]
+        db.add(med)
+
+    user = models.User(username="budget", password_hash="-", full_name="Budget Check", role="Administrator")
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    db.expunge(user)
+    db.close()
+    return user
+
+def main():
+    user = seed()
+    app.dependency_overrides[dependencies.get_current_user] = lambda: user
+    app.dependency_overrides[auth_utils.get_current_user] = lambda: user
+    client = TestClient(app)
+
+    counter = StatementCounter()
+    event.listen(engine, "before_cursor_execute", counter)
+
+    failures = []
+    for path, budget in BUDGETS.items():
+        queue_snapshot_cache.bump() # Measure a cold rebuild, not a cache hit
+        counter.count = 0
+        resp = client.get(path, params={"limit": 100} if path == "/medicines/" else None)
+        status = "OK" if counter.count <= budget and resp.status_code == 200 else "FAIL"
+        print(f"{status:4} {path:24} {counter.count:4} statements (budget {budget}), HTTP {resp.status_code}")
+        if status == "FAIL":
+            failures.append(path)
+
+    if failures:
+        print(f"FAILED: {', '.join(failures)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Concurrency check for the per-day queue number allocator.
+
+Fires parallel registrations at services/queue_numbering.allocate_queue_number
+(each in its own session/transaction, like add_to_queue) and verifies every
+ticket number is unique and the sequence has no gaps.
+
+Usage:
+    python backend/tests/check_queue_allocator.py [registrations] [threads]
+
+Runs against a throwaway SQLite file unless DATABASE_URL is set
+(e.g. point it at a scratch MySQL schema to test InnoDB locking).
+"""
+import sys
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "queue_allocator.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+from backend.database import SessionLocal, engine, Base
+from backend import models, clinic_time
+from backend.services.queue_numbering import allocate_queue_number
+
+REGISTRATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+THREADS = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+
+def register(i: int):
+    # Mix queue types / priorities so several counter rows are contended at once
+    queue_type = "Polyclinic" if i % 3 == 0 else "Doctor"
+    is_priority = i % 5 == 0
+
+    db = SessionLocal()
+    try:
+        number = allocate_queue_number(db, queue_type, is_priority, clinic_time.local_today())
+        db.add(models.PatientQueue(
+            numberQueue=number,
+            userId=None,
+            status="Waiting",
+            queueType=queue_type,
+            isPriority=is_priority
+        ))
+        db.commit()
+        return number
+    finally:
+        db.close()
+
+def main():
+    Base.metadata.create_all(bind=engine)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        numbers = list(pool.map(register, range(REGISTRATIONS)))
+    elapsed = time.perf_counter() - start
+
+    dupes = [n for n, c in Counter(numbers).items() if c > 1]
+    print(f"{REGISTRATIONS} registrations on {THREADS} threads in {elapsed:.2f}s ({elapsed / REGISTRATIONS * 1000:.2f} ms/registration)")
+
+    # Every prefix must be numbered 1..N without gaps
+    gaps = []
+    for prefix in ("D", "DP", "P", "PP"):
+        nums = sorted(int(n[len(prefix):]) for n in numbers if n[:len(prefix)] == prefix and n[len(prefix):].isdigit())
+        if nums != list(range(1, len(nums) + 1)):
+            gaps.append(prefix)
+        print(f"  {prefix}: {len(nums)} tickets")
+
+    if dupes or gaps:
+        print(f"FAILED: duplicates={dupes[:10]} gaps_in={gaps}")
+        sys.exit(1)
+    print("OK: all ticket numbers unique and contiguous")
+
+if __name__ == "__main__":
+    main()
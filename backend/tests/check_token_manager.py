@@ -0,0 +1,120 @@
+"""
+Check the SatuSehat token manager (services/oauth_token.py) against
+mock_satusehat.py:
+  - 32 threads starting cold send a single /accesstoken request,
+  - under steady load a token about to expire is replaced in the background,
+    without callers waiting or any request going out with an expired token,
+  - after the server revokes the token, the callers that hit a 401 share
+    one forced refresh, and every call succeeds,
+  - the same from the async client.
+
+Usage:
+    python backend/tests/check_token_manager.py [seconds of load]
+"""
+import sys
+import os
+import asyncio
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+if not os.getenv("DATABASE_URL"):
+    db_file = os.path.join(tempfile.mkdtemp(), "token_manager.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_file}"
+
+LOAD_SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+# Tokens live 64s; with the 60s safety margin they are used for 4s, the last 2 in refresh-ahead
+TOKEN_TTL = 64
+os.environ["SATUSEHAT_TOKEN_REFRESH_AHEAD"] = "2"
+# Every lookup must reach SatuSehat, so keep the NIK cache out of the way
+os.environ["NIK_CACHE_TTL_SECONDS"] = os.environ["NIK_CACHE_NEGATIVE_TTL_SECONDS"] = "0"
+
+from mock_satusehat import start_mock_satusehat
+
+mock, mock_url = start_mock_satusehat(latency_ms=50, jitter_ms=10)
+mock.state.token_ttl = TOKEN_TTL
+os.environ["SATUSEHAT_AUTH_URL"] = os.environ["SATUSEHAT_BASE_URL"] = mock_url
+
+from backend.database import Base, engine
+from backend.services.satu_sehat_service import satu_sehat_client, async_satu_sehat_client
+
+Base.metadata.create_all(bind=engine)
+
+NIK = "3171000000000001"
+tokens = satu_sehat_client.tokens
+
+def lookup(_=None) -> bool:
+    result = satu_sehat_client.search_patient_by_nik(NIK)
+    return bool(result and result["ihs_number"] == f"P{NIK}")
+
+def concurrent(n) -> list:
+    with ThreadPoolExecutor(n) as pool:
+        return list(pool.map(lookup, range(n)))
+
+def main():
+    print("cold start, 32 threads:")
+    assert all(concurrent(32))
+    print(f"  {mock.state.token_requests} token request, {tokens.waits} callers waited for it")
+    assert mock.state.token_requests == 1 and tokens.waits > 0
+
+    print(f"{LOAD_SECONDS:.0f}s of load from 8 threads, tokens usable for {TOKEN_TTL - 60}s:")
+    before, waits_before = mock.state.token_requests, tokens.waits
+    stop, calls, failed = time.monotonic() + LOAD_SECONDS, [0], [0]
+    lock = threading.Lock()
+
+    def worker():
+        while time.monotonic() < stop:
+            ok = lookup()
+            with lock:
+                calls[0] += 1
+                failed[0] += not ok
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    refreshed = mock.state.token_requests - before
+    print(f"  {calls[0]} calls, {failed[0]} failed, {refreshed} refreshes "
+          f"({tokens.background_refreshes} in the background), {tokens.waits - waits_before} waits, "
+          f"{mock.state.unauthorized} 401s")
+    assert failed[0] == 0 and mock.state.unauthorized == 0
+    assert 0 < refreshed <= LOAD_SECONDS / 2 + 1
+    assert tokens.waits == waits_before, "callers waited for a refresh that should have run in the background"
+
+    # Long-lived tokens from here on; wait out the short one so no refresh-ahead interferes
+    mock.state.token_ttl = 3599
+    time.sleep(TOKEN_TTL - 60)
+    assert lookup()
+
+    print("token revoked, 16 threads:")
+    before = mock.state.token_requests
+    mock.state.revoke_tokens()
+    assert all(concurrent(16))
+    print(f"  {mock.state.unauthorized} 401s, {mock.state.token_requests - before} token request, "
+          f"{tokens.forced_refreshes} forced refresh")
+    assert mock.state.token_requests - before == 1 and tokens.forced_refreshes == 1
+    # Threads starting after the refresh never see the revoked token
+    assert 1 <= mock.state.unauthorized <= 16
+
+    print("token revoked, 16 async lookups:")
+    before, unauthorized = mock.state.token_requests, mock.state.unauthorized
+    mock.state.revoke_tokens()
+
+    async def async_lookups():
+        results = await asyncio.gather(*[async_satu_sehat_client.search_patient_by_nik(NIK) for _ in range(16)])
+        return [r and r["ihs_number"] == f"P{NIK}" for r in results]
+
+    assert all(asyncio.run(async_lookups()))
+    print(f"  {mock.state.unauthorized - unauthorized} 401s, {mock.state.token_requests - before} token request")
+    assert mock.state.token_requests - before == 1
+
+    print(tokens.stats())
+    print("OK: token refreshes are single-flight, proactive and recover from 401s")
+    mock.shutdown()
+
+if __name__ == "__main__":
+    main()
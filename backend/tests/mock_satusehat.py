@@ -0,0 +1,321 @@
+"""
+Local stand-in for the SatuSehat OAuth + FHIR API, with injected latency.
+
+Serves POST /accesstoken, GET /Patient, /Practitioner by NIK identifier,
+POST /Patient, /Practitioner and transaction Bundles POSTed to the base URL.
+A NIK is "registered" unless it is divisible by 3 (or once created); its IHS
+id is P<nik> / N<nik>. Creating a resource whose NIK is in
+state.reject_niks fails with 400, and so does any Bundle containing it
+(transactions are all-or-nothing).
+
+GET /DiagnosticReport?subject=<ihs> serves state.reports[ihs] (fill it with
+state.add_reports), latest first, _count per page with Bundle.link "next",
+and honours _lastUpdated=ge<instant>. meta.lastUpdated is a "Z"-suffixed
+UTC instant, as SatuSehat sends it. state.report_pages counts the pages.
+
+GET /kfa-v2/products/all pages through state.kfa_products (fill it with
+state.add_kfa_products), filtered by keyword and from_date. Every request waits latency_ms (plus up to jitter_ms) before
+answering, and the server records request times and the peak number of
+requests in flight, so callers can check their concurrency and rate limits.
+
+Each token request issues a new token valid for state.token_ttl seconds;
+state.revoke_tokens() invalidates all of them, so the next call gets a 401.
+Setting state.error_status (e.g. 503) makes every search fail with it, and
+state.bundle_error_status every transaction Bundle.
+
+Use from a check script:
+    server, url = start_mock_satusehat(latency_ms=50)
+    os.environ["SATUSEHAT_AUTH_URL"] = os.environ["SATUSEHAT_BASE_URL"] = url
+
+Or standalone:
+    python backend/tests/mock_satusehat.py [port] [latency_ms]
+"""
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, parse_qs, urlencode
+
+NIK_SYSTEM = "https://fhir.kemkes.go.id/id/nik"
+
+def _now_instant() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+def _parse_instant(raw: str) -> datetime:
+    return datetime.fromisoformat(raw.replace("Z", "+00:00"))
+
+class MockState:
+    def __init__(self, latency_ms: float, jitter_ms: float):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.request_times = []
+        self.token_requests = 0
+        self.token_ttl = 3599
+        self.tokens = {}
+        self.unauthorized = 0
+        self.error_status = None
+        self.bundle_error_status = None
+        self.created = {}
+        self.reject_niks = set()
+        self.creates = 0
+        self.bundles = []
+        self.reports = {}
+        self.report_pages = 0
+        self.kfa_products = []
+        self.kfa_requests = 0
+
+    def issue_token(self) -> tuple:
+        with self.lock:
+            self.token_requests += 1
+            token = f"mock-token-{self.token_requests}"
+            self.tokens[token] = time.monotonic() + self.token_ttl
+            return token, self.token_ttl
+
+    def token_valid(self, token: str) -> bool:
+        with self.lock:
+            valid = time.monotonic() < self.tokens.get(token, 0)
+            if not valid:
+                self.unauthorized += 1
+            return valid
+
+    def add_reports(self, subject: str, n: int, status: str = "final"):
+        """n more reports for the patient, each newer than the last; returns them."""
+        with self.lock:
+            reports = self.reports.setdefault(subject, [])
+            added = []
+            for _ in range(n):
+                k = len(reports)
+                added.append({
+                    "resourceType": "DiagnosticReport", "id": f"DR-{subject}-{k}", "status": status,
+                    "meta": {"lastUpdated": _now_instant()},
+                    "code": {"coding": [{"code": f"LAB{k}", "display": f"Lab test {k}"}]},
+                    "effectiveDateTime": (datetime(2020, 1, 1, tzinfo=timezone.utc) + timedelta(hours=k)).isoformat(),
+                    "performer": [{"display": "Mock Lab"}],
+                })
+                reports.append(added[-1])
+            return added
+
+    def update_report(self, subject: str, k: int, **changes):
+        with self.lock:
+            report = self.reports[subject][k]
+            report.update(changes)
+            report["meta"] = {"lastUpdated": _now_instant()}
+
+    def add_kfa_products(self, n: int):
+        with self.lock:
+            for _ in range(n):
+                k = len(self.kfa_products)
+                drug = KFA_DRUGS[k % len(KFA_DRUGS)]
+                strength = KFA_STRENGTHS[(k // len(KFA_DRUGS)) % len(KFA_STRENGTHS)]
+                form = KFA_FORMS[(k // (len(KFA_DRUGS) * len(KFA_STRENGTHS))) % len(KFA_FORMS)]
+                self.kfa_products.append({
+                    "kfa_code": f"93{k:07d}", "name": f"{drug} {strength} mg {form} {k}",
+                    "manufacturer": KFA_MANUFACTURERS[k % len(KFA_MANUFACTURERS)],
+                    "packaging": f"Dus, 10 Strip @ 10 {form}", "active": True,
+                    "updated_at": "2024-01-01 00:00:00",
+                })
+
+    def update_kfa_product(self, k: int, **changes):
+        with self.lock:
+            self.kfa_products[k].update(changes, updated_at=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
+
+    def revoke_tokens(self):
+        with self.lock:
+            self.tokens.clear()
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.request_times.append(time.monotonic())
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def max_rate(self, window: float = 1.0) -> int:
+        """Most requests seen in any `window` seconds."""
+        times = sorted(self.request_times)
+        best, start = 0, 0
+        for end, t in enumerate(times):
+            while t - times[start] > window:
+                start += 1
+            best = max(best, end - start + 1)
+        return best
+
+KFA_DRUGS = ["Paracetamol", "Amoxicillin", "Ibuprofen", "Metformin", "Amlodipine", "Omeprazole", "Cetirizine",
+             "Simvastatin", "Captopril", "Ranitidine", "Dexamethasone", "Ciprofloxacin", "Loratadine", "Asam Mefenamat",
+             "Ambroxol", "Salbutamol", "Glibenclamide", "Lansoprazole", "Furosemide", "Allopurinol"]
+KFA_STRENGTHS = [5, 10, 25, 50, 100, 250, 500]
+KFA_FORMS = ["Tablet", "Kapsul", "Sirup", "Kaplet"]
+KFA_MANUFACTURERS = ["Kimia Farma", "Kalbe Farma", "Sanbe Farma", "Dexa Medica", "Indofarma"]
+
+def registered(nik: str) -> bool:
+    return nik.isdigit() and int(nik) % 3 != 0
+
+def nik_of(resource: dict) -> str:
+    for identifier in resource.get("identifier") or []:
+        if identifier.get("system") == NIK_SYSTEM:
+            return identifier.get("value") or ""
+    return ""
+
+class MockSatuSehat(BaseHTTPRequestHandler):
+    state: MockState = None
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _delay(self):
+        time.sleep((self.state.latency_ms + random.uniform(0, self.state.jitter_ms)) / 1000)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = urlparse(self.path).path.rstrip("/")
+        if path.endswith("/accesstoken"):
+            self._delay()
+            token, ttl = self.state.issue_token()
+            return self._reply(200, {"access_token": token, "expires_in": str(ttl)})
+        if not self.state.token_valid(self.headers.get("Authorization", "").removeprefix("Bearer ")):
+            return self._reply(401, {"error": "invalid token"})
+        self._delay()
+        data = json.loads(body or b"{}")
+        if path == "" and data.get("type") == "transaction":
+            return self._transaction(data)
+        if path.rsplit("/", 1)[-1] in ("Patient", "Practitioner"):
+            with self.state.lock:
+                self.state.creates += 1
+            rejected = self._rejected(data)
+            if rejected:
+                return self._reply(400, rejected)
+            return self._reply(201, self._create(data))
+        self._reply(404, {"error": "not found"})
+
+    def _rejected(self, resource: dict):
+        nik = nik_of(resource)
+        if len(nik) != 16 or nik in self.state.reject_niks:
+            return {"resourceType": "OperationOutcome", "issue": [
+                {"severity": "error", "code": "invalid", "diagnostics": f"invalid NIK {nik}"}]}
+        return None
+
+    def _create(self, resource: dict) -> dict:
+        nik = nik_of(resource)
+        prefix = "P" if resource.get("resourceType") == "Patient" else "N"
+        with self.state.lock:
+            self.state.created[(resource.get("resourceType"), nik)] = f"{prefix}{nik}"
+        return {**resource, "id": f"{prefix}{nik}"}
+
+    def _transaction(self, bundle: dict):
+        entries = bundle.get("entry") or []
+        with self.state.lock:
+            self.state.bundles.append(len(entries))
+        if self.state.bundle_error_status:
+            return self._reply(self.state.bundle_error_status, {"error": "unavailable"})
+        for entry in entries:
+            rejected = self._rejected(entry.get("resource") or {})
+            if rejected:
+                return self._reply(400, rejected)
+        response = []
+        for entry in entries:
+            created = self._create(entry["resource"])
+            response.append({"response": {
+                "status": "201 Created",
+                "location": f"{created['resourceType']}/{created['id']}/_history/1",
+            }})
+        self._reply(200, {"resourceType": "Bundle", "type": "transaction-response", "entry": response})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if not self.state.token_valid(self.headers.get("Authorization", "").removeprefix("Bearer ")):
+            return self._reply(401, {"error": "invalid token"})
+        resource = url.path.rsplit("/", 1)[-1]
+        identifier = parse_qs(url.query).get("identifier", [""])[0]
+        nik = identifier.split("|", 1)[1] if identifier.startswith(NIK_SYSTEM + "|") else ""
+        self.state.enter()
+        try:
+            self._delay()
+        finally:
+            # Leave before replying: the client may send its next request as soon as it has the answer
+            self.state.leave()
+        if self.state.error_status:
+            return self._reply(self.state.error_status, {"error": "unavailable"})
+        if url.path.endswith("/kfa-v2/products/all"):
+            return self._kfa(url)
+        if resource == "DiagnosticReport":
+            return self._reports(url)
+        if resource not in ("Patient", "Practitioner"):
+            return self._reply(404, {"error": "not found"})
+        entries = []
+        if registered(nik) or (resource, nik) in self.state.created:
+            prefix = "P" if resource == "Patient" else "N"
+            entries.append({"resource": {
+                "resourceType": resource, "id": f"{prefix}{nik}", "active": True,
+                "name": [{"text": f"Mock {resource} {nik[-4:]}"}],
+            }})
+        self._reply(200, {"resourceType": "Bundle", "type": "searchset", "total": len(entries), "entry": entries})
+
+    def _reports(self, url):
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with self.state.lock:
+            self.state.report_pages += 1
+            reports = list(self.state.reports.get(query.get("subject"), []))
+        since = query.get("_lastUpdated", "")
+        if since.startswith("ge"):
+            since = _parse_instant(since[2:])
+            reports = [r for r in reports if _parse_instant(r["meta"]["lastUpdated"]) >= since]
+        reports.sort(key=lambda r: r["effectiveDateTime"], reverse=True)
+        count, page = int(query.get("_count", 100)), int(query.get("_page", 0))
+        links = []
+        if (page + 1) * count < len(reports):
+            host = f"http://{self.headers.get('Host')}"
+            links.append({"relation": "next", "url": f"{host}{url.path}?{urlencode({**query, '_page': page + 1})}"})
+        self._reply(200, {"resourceType": "Bundle", "type": "searchset", "total": len(reports), "link": links,
+                          "entry": [{"resource": r} for r in reports[page * count:(page + 1) * count]]})
+
+    def _kfa(self, url):
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with self.state.lock:
+            self.state.kfa_requests += 1
+            products = list(self.state.kfa_products)
+        words = query.get("keyword", "").lower().split()
+        products = [p for p in products if all(w in p["name"].lower() for w in words)]
+        if query.get("from_date"):
+            products = [p for p in products if p["updated_at"][:10] >= query["from_date"]]
+        page, size = int(query.get("page", 1)), int(query.get("size", 10))
+        self._reply(200, {"total": len(products), "page": page, "size": size,
+                          "items": {"data": products[(page - 1) * size:page * size]}})
+
+    def _reply(self, code, data):
+        raw = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *_):
+        pass
+
+def start_mock_satusehat(port: int = 0, latency_ms: float = 50, jitter_ms: float = 20) -> tuple:
+    """Start the mock in a daemon thread; returns (server, base_url). server.state has the stats."""
+    handler = type("Handler", (MockSatuSehat,), {"state": MockState(latency_ms, jitter_ms)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.state = handler.state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8090
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    server, url = start_mock_satusehat(port, latency)
+    print(f"Mock SatuSehat on {url} ({latency:.0f}ms latency); Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
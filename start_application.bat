@@ -18,6 +18,7 @@ if exist "C:\kafka\bin\windows\kafka-server-start.bat" (
 
 echo [2/3] Launching Backend Server...
 start "Klinik Backend Server" cmd /k "backend\start_server.bat"
+start "Klinik Outbox Worker" cmd /k "backend\start_outbox_worker.bat"
 
 echo Waiting for backend to initialize (5 seconds)...
 timeout /t 5 /nobreak >nul